@@ -30,10 +30,9 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 Questions can be directed to support@sunspec.org
 """
 
-import sys
 import os
-import glob
-import importlib
+
+from . import plugins
 
 # Import all battsim extensions in current directory.
 # A battsim extension has a file name of battsim_*.py and contains a function battsim_params(info) that contains
@@ -41,7 +40,7 @@ import importlib
 
 # dict of modules found, entries are: name : module_name
 
-battsim_modules = {}
+battsim_modules = plugins.PluginModules()
 
 
 def params(info, id=None, label='Battery Simulator', group_name=None, active=None, active_value=None):
@@ -161,40 +160,18 @@ class BattSim(object):
 
 def battsim_scan():
     """
-    Scans for battery simulator modules in the current directory and imports them.
-    
-    This function scans all files in the current directory that match the pattern "battsim_*.py",
-    imports the modules, and adds them to the global `battsim_modules` dictionary, keyed by the
-    "mode" value returned from the `battsim_info()` function in the module.
-    
-    If a module does not have a `battsim_info()` function, or if an exception occurs during the
-    import, the module is removed from `sys.modules` and the exception is re-raised as a
-    `BattSimError`.
+    Scan for battsim modules on import.
+
+    Finds all files in the current directory that match 'battsim_*.py' and registers them in 'battsim_modules',
+    keyed by the 'mode' value returned from 'battsim_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used. Scan and module import errors
+    are raised as BattSimError.
     """
     global battsim_modules
     # scan all files in current directory that match battsim_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'battsim_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'battsim_info'):
-                info = m.battsim_info()
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    battsim_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            raise BattSimError('Error scanning module %s: %s' % (module_name, str(e)))
+    plugins.plugin_scan(battsim_modules, os.path.dirname(os.path.realpath(__file__)), 'battsim_*.py', 'battsim_info',
+                        package_name=package_name, error=BattSimError, raise_errors=True)
 
 # scan for battsim modules on import
 battsim_scan()
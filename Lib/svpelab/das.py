@@ -30,12 +30,14 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 Questions can be directed to support@sunspec.org
 """
 
-import sys
 import os
-import glob
-import importlib
+import threading
+import time
+import queue
+import concurrent.futures
 
 from . import dataset
+from . import plugins
 
 '''
 The DAS module supports collecting time series data records in a dataset. Each time series data record is comprised
@@ -49,10 +51,16 @@ Data records read directly can be returned as a list of data point values or in
 the keys are the data point names and values are the data point values.
 
     das_init() - Create das instance.
+    das_aggregate() - Create a das instance sampling several das instances together on a common timebase.
 
     data_capture() - Enable/disable RMS data capture
     data_capture_read() - Return the last data sample from the data capture in expanded format.
     data_capture_dataset() - Return dataset (Dataset) created from last data capture.
+    data_capture_stream() - Stream the data capture to csv file(s) while it is running.
+    data_capture_ring() - Hold data captures in a fixed size memory-mapped ring buffer with spill-to-disk segments.
+    data_capture_scheduler() - Sample data captures from a drift-free acquisition scheduler thread.
+    data_capture_stats() - Return sample timing statistics of the last scheduled data capture.
+    data_capture_pipeline() - Process data capture samples in a consumer thread decoupled from device reads.
     device_data_read() - Read the current data values directly from the DAS. It does not create a new data sample in
                          the data capture, if active.
     data_read() - Read the current data values directly from the DAS and return as expanded data record. It does
@@ -91,7 +99,16 @@ sc_points_default = ('SC_TRIG',)
 
 MINIMUM_SAMPLE_PERIOD = 50
 
-das_modules = {}
+# minimum sample period (ms) when sampling with the acquisition scheduler thread
+SCHEDULER_MINIMUM_SAMPLE_PERIOD = 1
+# time (sec) before a deadline at which the scheduler stops sleeping and polls the clock
+SCHEDULER_SPIN_TIME = 0.001
+# minimum sample period (sec) at which the scheduler polls the clock, shorter periods only sleep to the deadline
+SCHEDULER_SPIN_MINIMUM_PERIOD = 0.01
+# maximum number of device reads waiting to be processed in a pipelined data capture
+PIPELINE_QUEUE_SIZE = 1000
+
+das_modules = plugins.PluginModules()
 
 DAS_DEFAULT_ID = 'das'
 
@@ -144,6 +161,26 @@ def das_init(ts, id=None, points=None, sc_points=None, group_name=None, support_
 
     return sim
 
+def das_aggregate(ts, das_list, sample_interval=None, sc_points=None, group_name=None):
+    """
+    Function to create a DAS that samples several DAS instances (created with das_init()) together.
+
+    Each sample, the devices of all DAS instances are read concurrently and their data points are merged into one
+    record with a common TIME, so the sample period is bounded by the slowest device rather than the sum of the
+    device read times. The read latency (sec) of each device is recorded in the DAS_LATENCY_<n> points.
+
+    ts (object)             : test script with logging capability
+    das_list (list)         : DAS instances to aggregate
+    sample_interval (int)   : sample interval (ms), defaults to the largest sample interval of the instances
+    sc_points (list)        : soft channel points of the aggregate DAS
+    """
+    if group_name is None:
+        group_name = DAS_DEFAULT_ID
+    das_list = [d for d in das_list if d is not None]
+    if len(das_list) == 0:
+        raise DASError('No data acquisition systems to aggregate')
+    return AggregateDAS(ts, group_name, das_list, sample_interval=sample_interval, sc_points=sc_points)
+
 class DASError(Exception):
     """
     Exception to wrap all das generated exceptions.
@@ -151,6 +188,155 @@ class DASError(Exception):
     pass
 
 
+class SampleScheduler(threading.Thread):
+    """
+    Acquisition thread calling a sample function on absolute deadlines.
+
+    Deadlines are computed from the start time (start + n * period) rather than from the end of the previous
+    sample, so a slow sample does not shift the timing of the following samples. If a sample runs past one or
+    more deadlines, those deadlines are skipped and counted as missed. Lateness (jitter) of each sample start and
+    sample duration statistics are available from stats().
+    """
+
+    def __init__(self, period, callback, ts=None):
+        """
+        period (float)      : sample period (sec)
+        callback (function) : function called at each deadline
+        ts (object)         : optional test script used to log callback errors
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.period = float(period)
+        self.callback = callback
+        self.ts = ts
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._samples = 0
+        self._missed = 0
+        self._overruns = 0
+        self._errors = 0
+        self._jitter_sum = 0.
+        self._jitter_max = 0.
+        self._duration_sum = 0.
+        self._duration_max = 0.
+
+    def run(self):
+        start = time.perf_counter()
+        spin = SCHEDULER_SPIN_TIME if self.period >= SCHEDULER_SPIN_MINIMUM_PERIOD else 0.
+        n = 0
+        while not self._stop_event.is_set():
+            deadline = start + n * self.period
+            delay = deadline - time.perf_counter()
+            if delay > spin and self._stop_event.wait(delay - spin):
+                break
+            # poll the last moments before the deadline, yielding so the other threads keep running
+            while time.perf_counter() < deadline:
+                time.sleep(0)
+            t = time.perf_counter()
+            try:
+                self.callback()
+            except Exception as e:
+                self._errors += 1
+                if self.ts is not None:
+                    self.ts.log_error('Sample error: %s' % e)
+            end = time.perf_counter()
+            n += 1
+            # skip deadlines that have already passed
+            next_n = int((end - start) / self.period) + 1
+            with self._lock:
+                self._samples += 1
+                jitter = t - deadline
+                self._jitter_sum += jitter
+                self._jitter_max = max(self._jitter_max, jitter)
+                duration = end - t
+                self._duration_sum += duration
+                self._duration_max = max(self._duration_max, duration)
+                if duration > self.period:
+                    self._overruns += 1
+                if next_n > n:
+                    self._missed += next_n - n
+                    n = next_n
+
+    def stop(self, timeout=None):
+        """
+        Stop the scheduler and wait for the sample in progress to complete.
+        """
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+    def stats(self):
+        """
+        Returns:
+        --------
+        dict
+            Sample statistics: 'samples', 'missed' (skipped deadlines), 'overruns' (samples longer than the
+            period), 'errors', 'jitter_mean', 'jitter_max', 'duration_mean', 'duration_max' (sec).
+        """
+        with self._lock:
+            count = max(self._samples, 1)
+            return {'period': self.period,
+                    'samples': self._samples,
+                    'missed': self._missed,
+                    'overruns': self._overruns,
+                    'errors': self._errors,
+                    'jitter_mean': self._jitter_sum / count,
+                    'jitter_max': self._jitter_max,
+                    'duration_mean': self._duration_sum / count,
+                    'duration_max': self._duration_max}
+
+
+class SamplePipeline(threading.Thread):
+    """
+    Consumer stage of a pipelined data capture.
+
+    The sampling thread (test script timer or SampleScheduler) only reads the device and queues the raw reading
+    with a snapshot of the soft channel values. This thread appends the records to the capture dataset, which also
+    streams them to file if enabled. The queue is bounded, so if processing falls behind, the sampling thread blocks
+    and the scheduler reports the missed deadlines.
+
+    Only devices that provide data_read_raw()/data_parse() (currently the Yokogawa WT3000) have their reading
+    conversion (type conversion, PF sign correction, etc.) moved to this thread. For other devices the sampling
+    thread still runs the full data_read() and only the dataset append and file streaming are moved here.
+    """
+
+    def __init__(self, das, queue_size=PIPELINE_QUEUE_SIZE):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.das = das
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.errors = 0
+
+    def put(self, raw, sc):
+        """
+        Queue a raw device reading and the soft channel values at the time of the reading.
+        """
+        self.queue.put((raw, sc))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            raw, sc = item
+            try:
+                data = self.das.device_data_parse(raw)
+                data.extend(sc)
+                self.das._last_datarec = data
+                self.das._ds.append(data)
+            except Exception as e:
+                self.errors += 1
+                self.das.ts.log_error('Data capture processing error: %s' % e)
+
+    def stop(self, timeout=None):
+        """
+        Process all queued readings and stop.
+        """
+        if self.is_alive():
+            self.queue.put(None)
+            self.join(timeout)
+
+
 class DAS(object):
     """
     Template for data acquisition system implementations. This class can be used as a base class or
@@ -201,6 +387,13 @@ class DAS(object):
         self._timer = None
         self._ds = None
         self._last_datarec = []
+        self._stream = None
+        self._ring = None
+        self._scheduler = None
+        self.scheduled = False
+        self._pipeline = None
+        self._pipeline_size = None
+        self._capture_lock = threading.Lock()  # orders data_sample() appends against stopping the capture
 
         # optional interfaces to other SVP abstraction layers/device drivers
         self.dc_measurement_device = None
@@ -315,22 +508,147 @@ class DAS(object):
             self.sample_interval = self.device.sample_interval
         if enable is True:
             if self._capture is False:
-                self._ds = dataset.Dataset(self.data_points, ts=self.ts)
+                if self._ring is not None:
+                    self._ds = dataset.RingDataset(self.data_points, ts=self.ts, **self._ring)
+                else:
+                    self._ds = dataset.Dataset(self.data_points, ts=self.ts)
                 self._last_datarec = []
+                self._scheduler = None
+                if self._stream is not None:
+                    self._ds.stream_csv(**self._stream)
+                self._pipeline = None
+                if self._pipeline_size is not None:
+                    self._pipeline = SamplePipeline(self, queue_size=self._pipeline_size)
+                    self._pipeline.start()
                 if self.sample_interval > 0:
-                    if self.sample_interval < MINIMUM_SAMPLE_PERIOD:
-                        raise DASError('Sample period too small: %s' % (self.sample_interval))
-                    self._timer = self.ts.timer_start(float(self.sample_interval)/1000, self._timer_timeout,
-                                                      repeating=True)
+                    if self.scheduled:
+                        if self.sample_interval < SCHEDULER_MINIMUM_SAMPLE_PERIOD:
+                            raise DASError('Sample period too small: %s' % (self.sample_interval))
+                        self._scheduler = SampleScheduler(float(self.sample_interval)/1000, self.data_sample,
+                                                          ts=self.ts)
+                    else:
+                        if self.sample_interval < MINIMUM_SAMPLE_PERIOD:
+                            raise DASError('Sample period too small: %s' % (self.sample_interval))
+                        self._timer = self.ts.timer_start(float(self.sample_interval)/1000, self._timer_timeout,
+                                                          repeating=True)
                 self._capture = True
+                if self._scheduler is not None:
+                    self._scheduler.start()
         elif enable is False:
             if self._capture is True:
                 if self._timer is not None:
                     self.ts.timer_cancel(self._timer)
                 self._timer = None
-                self._capture = False
+                if self._scheduler is not None:
+                    self._scheduler.stop()
+                    if self._ds is not None:
+                        self._ds.stats = self._scheduler.stats()
+                # a timer callback still in progress can not add samples once the capture is disabled
+                with self._capture_lock:
+                    self._capture = False
+                if self._pipeline is not None:
+                    self._pipeline.stop()
+                if self._ds is not None:
+                    self._ds.stream_close()
+                    if isinstance(self._ds, dataset.RingDataset):
+                        self._ds.close()
         self.device.data_capture(enable)
 
+    def data_capture_stream(self, filename=None, chunk_size=dataset.CSV_CHUNK_SIZE, rotate_size=None):
+        """
+        Stream subsequent data captures to csv while they run. Records are written every chunk_size samples so an
+        interrupted test only loses the last partial chunk. The stream is closed when the data capture is disabled.
+
+        Parameters:
+        -----------
+        filename : str, optional
+            Path and name of the csv file. None disables streaming. Streaming can not be combined with
+            data_capture_ring().
+        chunk_size : int, optional
+            Number of samples written at a time.
+        rotate_size : int, optional
+            If set, a new csv file is started every rotate_size samples.
+        """
+        if filename is None:
+            self._stream = None
+        else:
+            if self._ring is not None:
+                raise DASError('Csv streaming can not be used with the ring buffer data capture, the ring buffer'
+                               ' spills its data to segment files (see data_capture_ring())')
+            self._stream = {'filename': filename, 'chunk_size': chunk_size, 'rotate_size': rotate_size}
+
+    def data_capture_ring(self, filename=None, retention=dataset.RING_RETENTION,
+                          segment_size=dataset.RING_SEGMENT_SIZE):
+        """
+        Hold subsequent data captures in a fixed size memory-mapped ring buffer so memory use stays constant for
+        long running tests. The most recent retention samples are available from the capture dataset and every
+        segment_size samples are spilled to an npz segment file next to the buffer file. The complete capture is
+        available from the dataset history() and is written by to_csv().
+
+        Parameters:
+        -----------
+        filename : str, optional
+            Path and name of the ring buffer file. None disables the ring buffer. The ring buffer can not be
+            combined with data_capture_stream().
+        retention : int, optional
+            Number of samples held in the ring buffer.
+        segment_size : int, optional
+            Number of samples in each spilled segment.
+        """
+        if filename is None:
+            self._ring = None
+        else:
+            if self._stream is not None:
+                raise DASError('The ring buffer data capture can not be used with csv streaming, disable streaming'
+                               ' with data_capture_stream(None) first')
+            self._ring = {'filename': filename, 'retention': retention, 'segment_size': segment_size}
+
+    def data_capture_scheduler(self, enable=True):
+        """
+        Sample subsequent data captures from a dedicated acquisition thread using absolute deadlines instead of
+        the repeating test script timer. Sample timing does not drift when a device read is slow, periods down to
+        SCHEDULER_MINIMUM_SAMPLE_PERIOD ms are allowed for devices that can keep up and missed deadline/jitter
+        statistics are stored in the capture dataset (stats) when the capture is disabled.
+
+        Parameters:
+        -----------
+        enable : bool, optional
+            True to use the acquisition scheduler, False to use the test script timer.
+        """
+        self.scheduled = enable
+
+    def data_capture_stats(self):
+        """
+
+        Returns:
+        --------
+        dict
+            Sample timing statistics (see SampleScheduler.stats()) of the current or last scheduled data capture,
+            None if the capture was not scheduled.
+        """
+        if self._scheduler is not None:
+            return self._scheduler.stats()
+        return None
+
+    def data_capture_pipeline(self, enable=True, queue_size=PIPELINE_QUEUE_SIZE):
+        """
+        Split subsequent data captures into a producer (the sampling thread) that only reads the device and a
+        consumer thread (SamplePipeline) that converts the readings and appends them to the dataset, so device I/O
+        latency does not add to the processing time within the sample period. Reading conversion is only moved to
+        the consumer thread for devices providing data_read_raw()/data_parse(), see SamplePipeline.
+
+        Parameters:
+        -----------
+        enable : bool, optional
+            True to pipeline data captures, False to process each sample in the sampling thread.
+        queue_size : int, optional
+            Maximum number of readings waiting to be processed.
+        """
+        if enable:
+            self._pipeline_size = queue_size
+        else:
+            self._pipeline_size = None
+
     def data_capture_read(self):
         """
 
@@ -373,6 +691,32 @@ class DAS(object):
 
         return data
 
+    def device_data_read_raw(self):
+        """
+        Read the current values from the DAS device without converting them to a data record. Devices that support
+        pipelined processing provide data_read_raw() and data_parse(), for other devices this is the same as
+        device.data_read().
+
+        Returns:
+        --------
+            Raw device reading to be passed to device_data_parse().
+        """
+        if hasattr(self.device, 'data_read_raw'):
+            return self.device.data_read_raw()
+        return self.device.data_read()
+
+    def device_data_parse(self, raw):
+        """
+        Convert a raw device reading from device_data_read_raw() to a list of data point values.
+
+        Returns:
+        --------
+            List containing the data values, without soft channel points.
+        """
+        if hasattr(self.device, 'data_read_raw'):
+            return self.device.data_parse(raw)
+        return raw
+
     def data_read(self):
         """
         Read the current data values directly from the DAS. It does not create a new data sample in the
@@ -390,11 +734,22 @@ class DAS(object):
 
         Returns:
         --------
-            List containing the last data record.
+            List containing the last data record. None in a pipelined data capture, where the record is created
+            later by the consumer thread (see data_capture_read()).
         """
         if self._capture is True:
-            self._last_datarec = self.device_data_read()
-            self._ds.append(self._last_datarec)
+            if self._pipeline is not None:
+                raw = self.device_data_read_raw()
+                sc = [self.sc[p] for p in self.sc_data_points]
+                with self._capture_lock:
+                    if self._capture is True:
+                        self._pipeline.put(raw, sc)
+                return None
+            datarec = self.device_data_read()
+            with self._capture_lock:
+                if self._capture is True:
+                    self._last_datarec = datarec
+                    self._ds.append(datarec)
         return self._last_datarec
 
     def waveform_config(self, params):
@@ -479,46 +834,117 @@ class DAS(object):
         """
         return self.device.waveform_capture_dataset()
 
-def das_scan():
+class AggregateDevice(object):
+    """
+    DAS device reading the devices of several DAS instances concurrently in a thread pool.
     """
-    Scan for DAS modules in the current directory.
 
-    This function scans all files in the current directory that match the pattern 'das_*.py',
-    imports them, and adds them to the global das_modules dictionary if they have a 'das_info' attribute.
+    def __init__(self, das_list, sample_interval=None):
+        self.das_list = das_list
+        if sample_interval is None:
+            sample_interval = max([d.sample_interval for d in das_list])
+        self.sample_interval = sample_interval
+        self.data_points = ['TIME']
+        self._executor = None
+        # index of the points of each device record that are placed in the aggregate record
+        self._point_idx = []
+        for d in das_list:
+            sc_count = len(d.sc_data_points) if d.sc_data_points is not None else 0
+            points = d.data_points[:len(d.data_points) - sc_count]
+            idx = []
+            for i in range(len(points)):
+                p = points[i]
+                if p == 'TIME':
+                    continue
+                if p in self.data_points:
+                    p = '%s.%s' % (d.group_name, p)
+                self.data_points.append(p)
+                idx.append(i)
+            self._point_idx.append(idx)
+        for i in range(len(das_list)):
+            self.data_points.append('DAS_LATENCY_%d' % (i + 1))
+
+    def _read(self, das_device):
+        t = time.perf_counter()
+        data = das_device.data_read()
+        return data, time.perf_counter() - t
+
+    def info(self):
+        return '\n'.join([str(d.info()) for d in self.das_list])
+
+    def open(self):
+        for d in self.das_list:
+            d.open()
+
+    def close(self):
+        for d in self.das_list:
+            d.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def data_capture(self, enable=True):
+        for d in self.das_list:
+            d.device.data_capture(enable)
+
+    def data_read(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.das_list))
+        t = time.time()
+        futures = [self._executor.submit(self._read, d.device) for d in self.das_list]
+        data = [t]
+        latency = []
+        for i in range(len(futures)):
+            rec, lat = futures[i].result()
+            data.extend([rec[j] for j in self._point_idx[i]])
+            latency.append(lat)
+        return data + latency
+
+    def waveform_config(self, params):
+        raise DASError('Waveform capture not supported by aggregate DAS')
+
+    def waveform_capture(self, enable=True, sleep=None):
+        raise DASError('Waveform capture not supported by aggregate DAS')
 
-    Returns:
-    --------
-    None
+    def waveform_status(self):
+        raise DASError('Waveform capture not supported by aggregate DAS')
+
+    def waveform_force_trigger(self):
+        raise DASError('Waveform capture not supported by aggregate DAS')
+
+    def waveform_capture_dataset(self):
+        raise DASError('Waveform capture not supported by aggregate DAS')
+
+
+class AggregateDAS(DAS):
+    """
+    DAS sampling several DAS instances together. See das_aggregate().
+    """
+
+    def __init__(self, ts, group_name, das_list, sample_interval=None, sc_points=None):
+        DAS.__init__(self, ts, group_name, sc_points=sc_points)
+        self.das_list = das_list
+        self.device = AggregateDevice(das_list, sample_interval=sample_interval)
+        self.sample_interval = self.device.sample_interval
+        self.data_points = list(self.device.data_points)
+
+        # initialize soft channel points
+        self._init_sc_points()
+
+
+def das_scan():
+    """
+    Scan for das modules on import.
 
-    Raises:
-    -------
-    DASError
-        If there's an error while scanning or importing a module.
+    Finds all files in the current directory that match 'das_*.py' and registers them in 'das_modules',
+    keyed by the 'mode' value returned from 'das_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used.
     """
     global das_modules
     # scan all files in current directory that match das_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'das_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'das_info'):
-                info = m.das_info()
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    das_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            print(DASError('Error scanning module %s: %s' % (module_name, str(e))))
+    plugins.plugin_scan(das_modules, os.path.dirname(os.path.realpath(__file__)), 'das_*.py', 'das_info',
+                        package_name=package_name, error=DASError)
             
 # scan for das modules on import
 
@@ -39,6 +39,7 @@ def params(info, group_name=None):
     info.param(pname('ip_address'), label='IP address', default='10.0.0.111')
     info.param(pname('sample_interval'), label='Sample Interval (ms)', default=1000)
     info.param(pname('timestamp'), label='Timestamp source', default='Zimmer', values=['Zimmer', 'SVP'])
+    info.param(pname('acquisition'), label='Acquisition Mode', default='Polled', values=['Polled', 'Streaming'])
     info.param(pname('scale_i_inverse'), label='Negative Scale I factor', default='True', values=['True', 'False'])
     # group 1 parameters
     info.param(pname('group_1'), label='Group 1', default='1 channel',
@@ -187,6 +188,7 @@ class DAS(das.DAS):
         self.params['comm'] = self._param_value('comm')
         self.params['sample_interval'] = self._param_value('sample_interval')
         self.params['timestamp'] = self._param_value('timestamp')
+        self.params['acquisition'] = self._param_value('acquisition')
         self.params['scale_i_inverse'] = self._param_value('scale_i_inverse')
         self.params['pf_convention'] = self._param_value('pf_convention')
 
@@ -54,6 +54,7 @@ def params(info, group_name):
     info.param(pname('ip_addr'), label='IP Address',
                active=pname('comm'),  active_value=['Network'], default='192.168.0.10')
     info.param(pname('sample_interval'), label='Sample Interval (ms)', default=1000)
+    info.param(pname('numeric_format'), label='Numeric Data Format', default='Binary', values=['Binary', 'ASCII'])
 
     info.param(pname('chan_1'), label='Channel 1', default='AC', values=['AC', 'DC', 'Unused'])
     info.param(pname('chan_2'), label='Channel 2', default='AC', values=['AC', 'DC', 'Unused'])
@@ -94,6 +95,7 @@ class DAS(das.DAS):
         self.params['ip_addr'] = self._param_value('ip_addr')
         self.params['ipport'] = self._param_value('ip_port')
         self.params['timeout'] = self._param_value('ip_timeout')
+        self.params['numeric_format'] = self._param_value('numeric_format')
 
         # create channel info for each channel from parameters
         channels = [None]
@@ -78,6 +78,7 @@ def params(info, group_name):
     info.param(pname('sample_rate'), label='Sampling Rate (Hz)', default=2.5e9)
     info.param(pname('length'), label='Data Length', default='1k', values=['1k', '10k', '100k', '1M', '5M'])
     info.param(pname('save_wave'), label='Save Waveforms?', default='No', values=['Yes', 'No'])
+    info.param(pname('transfer'), label='Waveform Transfer', default='Fast', values=['Fast', 'Legacy'])
 
 
 GROUP_NAME = 'dpo3000'
@@ -110,6 +111,7 @@ class DAS(das.DAS):
         self.params['horiz_scale'] = self._param_value('horiz')
         self.params['sample_rate'] = self._param_value('sample_rate')
         self.params['save_wave'] = self._param_value('save_wave')
+        self.params['transfer'] = self._param_value('transfer')
 
         if self._param_value('length') == '1k':
             self.params['length'] = 1000
@@ -62,6 +62,7 @@ def params(info, group_name):
     info.param(pname('visa_id'), label='visa_id',
                active=pname('comm'),  active_value=['VISA'], default='GPIB0::13::INSTR')
     info.param(pname('sample_interval'), label='Sample Interval (ms)', default=1000)
+    info.param(pname('numeric_format'), label='Numeric Data Format', default='Binary', values=['Binary', 'ASCII'])
 
     info.param(pname('chan_1'), label='Channel 1', default='AC', values=['AC', 'DC', 'Unused'])
     info.param(pname('chan_2'), label='Channel 2', default='AC', values=['AC', 'DC', 'Unused'])
@@ -104,6 +105,7 @@ class DAS(das.DAS):
         self.params['username'] = self._param_value('username')
         self.params['password'] = self._param_value('password')
         self.params['timeout'] = self._param_value('ip_timeout')
+        self.params['numeric_format'] = self._param_value('numeric_format')
         self.params['visa_id'] = self._param_value('visa_id')
         self.params['comm'] = self._param_value('comm')
         self.params['ts'] = ts
@@ -30,15 +30,437 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 Questions can be directed to support@sunspec.org
 """
 import datetime
+import json
+import math
 import os
+import zipfile
+import numpy as np
 import pandas as pd
 
+# initial number of samples preallocated for each column
+COLUMN_CAPACITY = 1024
+
+# number of records formatted and written at a time by the csv writers
+CSV_CHUNK_SIZE = 1000
+
+# default ring dataset retention window and spill segment size (records)
+RING_RETENTION = 100000
+RING_SEGMENT_SIZE = 10000
+
 class DatasetError(Exception):
     """
     Exception to wrap all das generated exceptions.
     """
     pass
 
+
+class Column(object):
+    """
+    Growable float64 storage for the samples of a single data point.
+
+    Values are kept in a preallocated numpy array that doubles in size when full so appends are amortized O(1).
+    Missing values (None) are stored as NaN and flagged in a parallel boolean mask. Values that can not be
+    converted to float (event labels, etc.) are flagged in the mask and kept in a sparse dict so they are written
+    back out unchanged.
+
+    Indexing a column returns the same values the list based dataset used to hold: a float, 'None' for a missing
+    value or the original non-numeric object.
+    """
+
+    def __init__(self, data=None, capacity=COLUMN_CAPACITY):
+        self._values = np.empty(max(int(capacity), 1), dtype=np.float64)
+        self._mask = np.zeros(len(self._values), dtype=bool)
+        self._objects = {}
+        self._len = 0
+        if data is not None:
+            self.extend(data)
+
+    def _reserve(self, count):
+        size = len(self._values)
+        if count > size:
+            while size < count:
+                size *= 2
+            values = np.empty(size, dtype=np.float64)
+            values[:self._len] = self._values[:self._len]
+            mask = np.zeros(size, dtype=bool)
+            mask[:self._len] = self._mask[:self._len]
+            self._values = values
+            self._mask = mask
+
+    def _set(self, idx, v):
+        try:
+            if v is None:
+                self._values[idx] = np.nan
+                self._mask[idx] = True
+                self._objects.pop(idx, None)
+                return
+            if isinstance(v, tuple):
+                v = v[0]
+            if isinstance(v, datetime.datetime):
+                # total_seconds will be in decimals (millisecond precision)
+                v = (v - datetime.datetime.utcfromtimestamp(0)).total_seconds()
+            self._values[idx] = float(v)
+            self._mask[idx] = False
+            self._objects.pop(idx, None)
+        except (TypeError, ValueError):
+            if isinstance(v, str) and v == 'None':
+                self._set(idx, None)
+                return
+            self._values[idx] = np.nan
+            self._mask[idx] = True
+            self._objects[idx] = v
+
+    def _get(self, idx):
+        if self._mask[idx]:
+            return self._objects.get(idx, 'None')
+        return float(self._values[idx])
+
+    @classmethod
+    def from_array(cls, values, mask=None, objects=None):
+        """
+        Create a column holding a copy of a numeric array.
+
+        :param values: 1-D array-like of numeric values
+        :param mask: optional boolean array-like, True where the value is missing or non-numeric
+        :param objects: optional dict of record index to non-numeric value
+        """
+        values = np.asarray(values, dtype=np.float64)
+        col = cls(capacity=len(values))
+        col.extend(values)
+        if mask is not None:
+            col._mask[:col._len] = mask
+        if objects:
+            col._objects.update(objects)
+        return col
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._get(i) for i in range(*idx.indices(self._len))]
+        if idx < 0:
+            idx += self._len
+        if idx < 0 or idx >= self._len:
+            raise IndexError('Column index out of range')
+        return self._get(idx)
+
+    def __setitem__(self, idx, v):
+        if idx < 0:
+            idx += self._len
+        if idx < 0 or idx >= self._len:
+            raise IndexError('Column index out of range')
+        self._set(idx, v)
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self._get(i)
+
+    def __repr__(self):
+        return 'Column(%s)' % self.tolist()
+
+    def append(self, v):
+        self._reserve(self._len + 1)
+        self._set(self._len, v)
+        self._len += 1
+
+    def extend(self, data):
+        if isinstance(data, Column):
+            count = len(data)
+            self._reserve(self._len + count)
+            self._values[self._len:self._len + count] = data.values
+            self._mask[self._len:self._len + count] = data.mask
+            for k, v in data._objects.items():
+                self._objects[self._len + k] = v
+            self._len += count
+            return
+        arr = np.asarray(data)
+        if arr.ndim == 1 and arr.dtype.kind in 'biuf':
+            # numeric block - single vectorized copy
+            count = len(arr)
+            self._reserve(self._len + count)
+            self._values[self._len:self._len + count] = arr
+            self._mask[self._len:self._len + count] = False
+            self._len += count
+            return
+        data = list(data)
+        count = len(data)
+        self._reserve(self._len + count)
+        for i in range(count):
+            self._set(self._len + i, data[i])
+        self._len += count
+
+    def clear(self):
+        self._objects = {}
+        self._mask[:self._len] = False
+        self._len = 0
+
+    @property
+    def values(self):
+        """
+        float64 numpy view of the column, NaN where a value is missing or non-numeric.
+        """
+        return self._values[:self._len]
+
+    @property
+    def mask(self):
+        """
+        Boolean numpy view of the column, True where a value is missing or non-numeric.
+        """
+        return self._mask[:self._len]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is not None:
+            return self.values.astype(dtype)
+        return self.values.copy() if copy else self.values
+
+    def tolist(self):
+        if not self._objects and not self.mask.any():
+            return self.values.tolist()
+        return list(self)
+
+    def strings(self, start=0, stop=None):
+        """
+        Return the values in [start, stop) formatted as strings with str(). Numeric values are formatted in a
+        single vectorized pass.
+        """
+        if stop is None or stop > self._len:
+            stop = self._len
+        s = self._values[start:stop].astype(str).tolist()
+        mask = self._mask[start:stop]
+        if mask.any():
+            for i in np.flatnonzero(mask).tolist():
+                s[i] = str(self._objects.get(start + i, 'None'))
+        return s
+
+
+def format_rows(data, start, stop, sep=', '):
+    """
+    Format records [start, stop) of a list of columns as csv text.
+
+    :param data: list of Column or list columns
+    :param start: first record
+    :param stop: end record (exclusive)
+    :param sep: field separator
+
+    :return: csv text with a trailing newline for each record
+    """
+    cols = []
+    for d in data:
+        if isinstance(d, Column):
+            cols.append(d.strings(start, stop))
+        else:
+            cols.append([str(v) for v in d[start:stop]])
+    if not cols or not cols[0]:
+        return ''
+    return '\n'.join(map(sep.join, zip(*cols))) + '\n'
+
+
+def read_csv(filename, sep=',', points=None, mmap=False):
+    """
+    Read a csv file written by Dataset.to_csv() (or any csv file with a header line) into typed columns.
+
+    The file is parsed in a single pass by the pandas C parser. Each column is returned as a float64 Column;
+    'None' cells are flagged as missing and other non-numeric cells (such as 'Step' labels) are flagged and kept as
+    strings.
+
+    :param filename: String Path and name of the csv file to read
+    :param sep: field separator
+    :param points: optional list of point names to read, all points are read if None
+    :param mmap: memory map the file instead of reading it through a file buffer (large waveform files)
+
+    :return: tuple (point names, list of Column)
+    """
+    try:
+        df = pd.read_csv(filename, sep=sep, skipinitialspace=True, keep_default_na=False, na_values=['None'],
+                         memory_map=mmap, low_memory=False, float_precision='round_trip')
+    except Exception as e:
+        raise DatasetError('Error reading csv file %s: %s' % (filename, e))
+    df.columns = [str(c).strip() for c in df.columns]
+    if points is None:
+        points = list(df.columns)
+    data = []
+    for p in points:
+        if p not in df.columns:
+            raise DatasetError('Data point not in csv file %s: %s' % (filename, p))
+        col = df[p]
+        if col.dtype.kind in 'biuf':
+            data.append(Column.from_array(col.to_numpy(dtype=np.float64, na_value=np.nan),
+                                          mask=col.isna().to_numpy()))
+        else:
+            values = pd.to_numeric(col, errors='coerce')
+            mask = values.isna().to_numpy()
+            objects = {}
+            text = col.to_numpy()
+            for i in np.flatnonzero(mask & col.notna().to_numpy()).tolist():
+                objects[i] = str(text[i]).strip()
+            data.append(Column.from_array(values.to_numpy(dtype=np.float64, na_value=np.nan), mask=mask,
+                                          objects=objects))
+    return list(points), data
+
+
+def iter_csv(filename, sep=',', points=None, chunk_size=100000):
+    """
+    Read a large numeric csv file (such as a waveform capture) in blocks of rows.
+
+    Only the requested points are parsed and no more than chunk_size rows are held in memory at a time.
+
+    :param filename: String Path and name of the csv file to read
+    :param sep: field separator
+    :param points: optional list of point names to read, all points are read if None. May also be a function
+                   called with the list of column names in the file that returns the point names to read.
+    :param chunk_size: number of rows in each block
+
+    :return: generator of tuples (point names, list of float64 numpy arrays), 'None' and non-numeric cells are NaN
+    """
+    try:
+        header = pd.read_csv(filename, sep=sep, skipinitialspace=True, nrows=0)
+    except Exception as e:
+        raise DatasetError('Error reading csv file %s: %s' % (filename, e))
+    columns = [str(c).strip() for c in header.columns]
+    if points is None:
+        points = columns
+    elif callable(points):
+        points = points(columns)
+    try:
+        for p in points:
+            if p not in columns:
+                raise DatasetError('Data point not in csv file %s: %s' % (filename, p))
+        usecols = [header.columns[columns.index(p)] for p in points]
+        reader = pd.read_csv(filename, sep=sep, skipinitialspace=True, keep_default_na=False, na_values=['None'],
+                             usecols=usecols, chunksize=chunk_size, float_precision='round_trip')
+        for df in reader:
+            yield list(points), [pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+                                 for c in usecols]
+    except DatasetError:
+        raise
+    except Exception as e:
+        raise DatasetError('Error reading csv file %s: %s' % (filename, e))
+
+
+NPZ_META = '__meta__'
+NPZ_MASK = '.mask'
+
+
+class DatasetFile(object):
+    """
+    Read access to a dataset saved with Dataset.to_npz().
+
+    The file is opened lazily: point data is only decompressed when it is first requested with point_data(), so an
+    analysis that needs a single point does not load the whole dataset.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            self._npz = np.load(filename, allow_pickle=False)
+            meta = json.loads(str(self._npz[NPZ_META]))
+        except Exception as e:
+            raise DatasetError('Error reading dataset file %s: %s' % (filename, e))
+        self.points = meta.get('points', [])
+        self.start_time = meta.get('start_time')
+        self.sample_rate = meta.get('sample_rate')
+        self.trigger_sample = meta.get('trigger_sample')
+        self._objects = meta.get('objects', {})
+        self._columns = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def point_data(self, point):
+        col = self._columns.get(point)
+        if col is None:
+            if point not in self.points:
+                raise DatasetError('Data point not in dataset: %s' % point)
+            mask = None
+            if point + NPZ_MASK in self._npz.files:
+                mask = self._npz[point + NPZ_MASK]
+            objects = dict((int(k), v) for k, v in self._objects.get(point, {}).items())
+            col = Column.from_array(self._npz[point], mask=mask, objects=objects)
+            self._columns[point] = col
+        return col
+
+    def dataset(self, points=None, ts=None):
+        """
+        Return a Dataset containing the requested points (all points if None).
+        """
+        if points is None:
+            points = self.points
+        return Dataset(points=list(points), data=[self.point_data(p) for p in points], start_time=self.start_time,
+                       sample_rate=self.sample_rate, trigger_sample=self.trigger_sample, ts=ts)
+
+    def close(self):
+        if self._npz is not None:
+            self._npz.close()
+            self._npz = None
+
+
+class CsvStream(object):
+    """
+    Incremental csv writer for a dataset that is still being filled.
+
+    Records are formatted and written in chunks of chunk_size records as they are added to the dataset, so an
+    interrupted capture only loses the records that were not yet written. When rotate_size is set, a new file is
+    started every rotate_size records: name.csv, name_1.csv, name_2.csv, ...
+    """
+
+    def __init__(self, filename, points, chunk_size=CSV_CHUNK_SIZE, rotate_size=None):
+        self.filename = filename
+        self.points = list(points)
+        self.chunk_size = max(int(chunk_size), 1)
+        self.rotate_size = rotate_size
+        self.filenames = []
+        self.row = 0                # next dataset record to be written
+        self._file = None
+        self._file_rows = 0
+
+    def _open(self):
+        base, ext = os.path.splitext(self.filename)
+        name = self.filename
+        if len(self.filenames) > 0:
+            name = '%s_%s%s' % (base, len(self.filenames), ext)
+        self._file = open(name, 'w')
+        self._file.write('%s\n' % ', '.join(map(str, self.points)))
+        self._file_rows = 0
+        self.filenames.append(name)
+
+    def write(self, data, flush=False):
+        """
+        Write the pending records of data. Unless flush is True, only complete chunks are written.
+
+        :param data: list of Column or list columns of the dataset being streamed
+        :param flush: write all pending records
+        """
+        rows = len(data[0]) if len(data) > 0 else 0
+        while rows - self.row >= self.chunk_size or (flush and rows > self.row):
+            if self._file is None:
+                self._open()
+            count = min(rows - self.row, self.chunk_size)
+            if self.rotate_size:
+                count = min(count, self.rotate_size - self._file_rows)
+            self._file.write(format_rows(data, self.row, self.row + count))
+            self._file.flush()
+            self.row += count
+            self._file_rows += count
+            if self.rotate_size and self._file_rows >= self.rotate_size:
+                self._file.close()
+                self._file = None
+        if flush and self._file is None and not self.filenames:
+            self._open()
+
+    def close(self, data=None):
+        """
+        Write any pending records and close the current file.
+        """
+        if data is not None:
+            self.write(data, flush=True)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
 """
     Data AC/DC point names have three parts:
 
@@ -76,12 +498,17 @@ class Dataset(object):
         self.data = data                          # data
         self.ts = ts
         self.df = None
+        self.stream = None
+        self.stats = None                         # data capture statistics
 
         if points is None:
             self.points = []
         if data is None:
             self.clear()
 
+    def _columnar(self):
+        return len(self.data) > 0 and all(isinstance(d, Column) for d in self.data)
+
     def point_data(self, point):
         try:
             idx = self.points.index(point)
@@ -95,6 +522,12 @@ class Dataset(object):
         if len(data) != len(self.data):
             raise DatasetError('Append record point mismatch, dataset contains %s points,'
                                ' appended data contains %s points' % (len(self.data), dlen))
+        if self._columnar():
+            for i in range(dlen):
+                self.data[i].append(data[i])
+            if self.stream is not None:
+                self.stream.write(self.data)
+            return
         for i in range(dlen):
             try:
                 if data[i] is not None:
@@ -113,6 +546,8 @@ class Dataset(object):
             except ValueError:
                 v = data[i]
             self.data[i].append(v)
+        if self.stream is not None:
+            self.stream.write(self.data)
 
     def extend(self, data):
         dlen = len(data)
@@ -122,10 +557,99 @@ class Dataset(object):
         for i in range(dlen):
             self.data[i].extend(data[i])
 
+    def append_block(self, data):
+        """
+        Append a block of records with one copy per data point.
+
+        :param data: 2-D array-like with one row per data point (the same layout as the dataset data), or a dict
+                     of point name to column array. Points missing from the dict are filled with None.
+        """
+        if isinstance(data, dict):
+            for p in data:
+                if p not in self.points:
+                    raise DatasetError('Data point not in dataset: %s' % p)
+            count = None
+            for v in data.values():
+                count = len(v)
+                break
+            if count is None:
+                return
+            cols = []
+            for p in self.points:
+                col = data.get(p)
+                if col is None:
+                    col = [None] * count
+                cols.append(col)
+        else:
+            cols = data
+        if len(cols) != len(self.data):
+            raise DatasetError('Append block point mismatch, dataset contains %s points,'
+                               ' appended data contains %s points' % (len(self.data), len(cols)))
+        count = None
+        for col in cols:
+            if count is None:
+                count = len(col)
+            elif len(col) != count:
+                raise DatasetError('Append block record count mismatch, all points must contain %s records' % count)
+        for i in range(len(cols)):
+            col = cols[i]
+            if isinstance(self.data[i], Column):
+                self.data[i].extend(col)
+            else:
+                self.data[i].extend(col.tolist() if isinstance(col, np.ndarray) else col)
+        if self.stream is not None:
+            self.stream.write(self.data)
+
+    def append_many(self, records):
+        """
+        Append a sequence of records, each in the same form as passed to append().
+
+        :param records: sequence of records or 2-D array-like with one row per record.
+        """
+        if not isinstance(records, np.ndarray):
+            for i in range(len(records)):
+                if len(records[i]) != len(self.points):
+                    raise DatasetError('Append record point mismatch, dataset contains %s points,'
+                                       ' record %s contains %s points' % (len(self.points), i, len(records[i])))
+        arr = np.asarray(records)
+        if arr.ndim == 2 and arr.dtype.kind in 'biuf':
+            self.append_block(arr.T)
+        elif len(records) > 0:
+            self.append_block([list(col) for col in zip(*records)])
+
+    def stream_csv(self, filename, chunk_size=CSV_CHUNK_SIZE, rotate_size=None):
+        """
+        Stream the dataset to csv while it is being filled. Records already in the dataset and all records added
+        with append()/append_block() are written in chunks of chunk_size records.
+
+        :param filename: String Path and name of the csv file to write
+        :param chunk_size: number of records written at a time
+        :param rotate_size: if set, start a new file every rotate_size records
+
+        :return: CsvStream
+        """
+        self.stream_close()
+        self.stream = CsvStream(filename, self.points, chunk_size=chunk_size, rotate_size=rotate_size)
+        self.stream.write(self.data)
+        return self.stream
+
+    def stream_close(self):
+        """
+        Write any records not yet streamed and close the csv stream.
+
+        :return: list of files written by the stream
+        """
+        filenames = []
+        if self.stream is not None:
+            self.stream.close(self.data)
+            filenames = self.stream.filenames
+            self.stream = None
+        return filenames
+
     def clear(self):
         self.data = []
         for i in range(len(self.points)):
-            self.data.append([])
+            self.data.append(Column())
 
     def to_csv(self, filename):
         """
@@ -138,41 +662,76 @@ class Dataset(object):
         """
         mode = self.ts.param_value('das.' + 'mode')
         if mode != 'DAS Simulation' or self.df is None:
-            cols = list(range(len(self.data)))
-            if len(cols) > 0:
+            if len(self.data) > 0:
                 f = open(filename, 'w')
                 f.write('%s\n' % ', '.join(map(str, self.points)))
-                for i in range(len(self.data[0])):
-                    d = []
-                    for j in cols:
-                        # self.ts.log_debug('data = %s' % self.data)
-                        # self.ts.log_debug('point names = %s' % self.points)
-                        # self.ts.log_debug('len(points) = %s, len(data) = %s' % (len(self.points), len(self.data)))
-                        # self.ts.log_debug('j = %s, i = %i, self.data[j][i] = %s' % (j, i, self.data[j][i]))
-                        d.append(self.data[j][i])
-                    f.write('%s\n' % ', '.join(map(str, d)))
+                rows = len(self.data[0])
+                for i in range(0, rows, CSV_CHUNK_SIZE):
+                    f.write(format_rows(self.data, i, min(i + CSV_CHUNK_SIZE, rows)))
                 f.close()
         else:
             self.df.to_csv(filename, index=False)
 
-    def from_csv(self, filename, sep=','):
-        self.clear()
-        f = open(filename, 'r')
-        lines = f.readlines()
-        self.points = [e.strip() for e in lines.pop(0).split(sep)]
-        for line in lines:
-            data = []
-            for e in line.split(sep):
-                if 'Step' not in e and 'None' not in e:
-                    data.append(float(e.strip()))
-                elif 'Step' in e or 'None' in e:
-                    data.append(e.strip())
-                    if len(data) > 0:
-                        self.data.append(data)
-                # else:
-                #     data.append(e.strip())
-
-        f.close()
+    def from_csv(self, filename, sep=',', mmap=False):
+        """
+        Load the dataset from a csv file written by to_csv().
+
+        :param filename: String Path and name of the csv file to read
+        :param sep: field separator
+        :param mmap: memory map the file while parsing
+
+        :return: nothing
+        """
+        self.points, self.data = read_csv(filename, sep=sep, mmap=mmap)
+
+    def to_npz(self, filename):
+        """
+        Write the dataset as a compressed binary columnar file (numpy .npz). Each point is stored as a separate
+        float64 array along with the dataset start time, sample rate and trigger sample so points can be loaded
+        individually with DatasetFile.
+
+        :param filename: String Path and name of the file to write
+
+        :return: nothing
+        """
+        arrays = {}
+        objects = {}
+        for i in range(len(self.points)):
+            p = str(self.points[i])
+            col = self.data[i]
+            if not isinstance(col, Column):
+                col = Column(col)
+            arrays[p] = col.values
+            if col.mask.any():
+                arrays[p + NPZ_MASK] = col.mask
+            if col._objects:
+                objects[p] = dict((str(k), str(v)) for k, v in col._objects.items())
+        start_time = self.start_time
+        if start_time is not None and not isinstance(start_time, (int, float)):
+            start_time = str(start_time)
+        meta = {'points': [str(p) for p in self.points], 'start_time': start_time, 'sample_rate': self.sample_rate,
+                'trigger_sample': self.trigger_sample, 'objects': objects}
+        arrays[NPZ_META] = np.array(json.dumps(meta))
+        with open(filename, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+    def from_npz(self, filename, points=None):
+        """
+        Load the dataset from a file written by to_npz().
+
+        :param filename: String Path and name of the file to read
+        :param points: optional list of point names to load, all points are loaded if None
+
+        :return: nothing
+        """
+        with DatasetFile(filename) as f:
+            ds = f.dataset(points=points)
+        self.points = ds.points
+        self.data = ds.data
+        self.start_time = ds.start_time
+        self.sample_rate = ds.sample_rate
+        self.trigger_sample = ds.trigger_sample
+
     def remove_none_row(self,filename, index):
         import pandas as pd
         import numpy as np
@@ -183,6 +742,321 @@ class Dataset(object):
         df.to_csv(filename,index=False)
 
 
+def _float(v):
+    """
+    Convert a record value to float, NaN if it is missing or not numeric.
+    """
+    try:
+        if isinstance(v, tuple):
+            v = v[0]
+        if isinstance(v, datetime.datetime):
+            return (v - datetime.datetime.utcfromtimestamp(0)).total_seconds()
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _nan_column(values):
+    """
+    Column for a float array where NaN marks a missing value.
+    """
+    return Column.from_array(values, mask=np.isnan(values))
+
+
+class RingColumn(Column):
+    """
+    Read-only view of the records [start, stop) of one point of a RingDataset.
+
+    Values are read from the memory-mapped ring buffer when they are accessed, creating the view does not copy any
+    data. Accessing records that have since been overwritten in the ring raises DatasetError.
+    """
+
+    def __init__(self, ds, index, start, stop):
+        self._ds = ds
+        self._index = index
+        self._start = start
+        self._len = stop - start
+        self._objects = {}
+
+    def _check(self, start, stop):
+        if start < self._ds.count - self._ds.capacity:
+            raise DatasetError('Records %s-%s no longer in ring buffer' % (start, stop))
+
+    def _get(self, idx):
+        pos = self._start + idx
+        self._check(pos, pos + 1)
+        v = float(self._ds._ring[pos % self._ds.capacity, self._index])
+        if math.isnan(v):
+            return 'None'
+        return v
+
+    def _read_only(self, *args):
+        raise DatasetError('Ring dataset columns are read-only')
+
+    __setitem__ = append = extend = clear = _reserve = _read_only
+
+    @property
+    def values(self):
+        """
+        Read-only float64 numpy view of the column (a copy when the records wrap around the end of the ring),
+        NaN where a value is missing.
+        """
+        self._check(self._start, self._start + self._len)
+        ring = self._ds._ring
+        a = self._start % self._ds.capacity
+        b = a + self._len
+        if b <= self._ds.capacity:
+            values = ring[a:b, self._index]
+        else:
+            values = np.concatenate((ring[a:, self._index], ring[:b - self._ds.capacity, self._index]))
+        values = np.asarray(values).view(np.ndarray)
+        values.flags.writeable = False
+        return values
+
+    @property
+    def mask(self):
+        return np.isnan(self.values)
+
+    def strings(self, start=0, stop=None):
+        if stop is None or stop > self._len:
+            stop = self._len
+        values = self.values[start:stop]
+        s = values.astype(str).tolist()
+        for i in np.flatnonzero(np.isnan(values)).tolist():
+            s[i] = 'None'
+        return s
+
+
+class RingDataset(Dataset):
+    """
+    Dataset with constant memory use for long running data captures.
+
+    Records are written to a fixed size memory-mapped ring buffer file holding the most recent retention records
+    (rounded up to whole segments). Every time segment_size records have been appended, the segment is spilled to
+    its own npz file (filename base + _0000.npz, _0001.npz, ...), so the full capture history can be recovered with
+    history() or from the segment files after the test.
+
+    Values are stored as float64, missing and non-numeric values are stored as NaN.
+    """
+
+    def __init__(self, points=None, filename=None, retention=RING_RETENTION, segment_size=RING_SEGMENT_SIZE,
+                 start_time=None, sample_rate=None, trigger_sample=None, ts=None):
+        if filename is None:
+            raise DatasetError('Ring dataset requires a buffer file name')
+        self.start_time = start_time
+        self.sample_rate = sample_rate
+        self.trigger_sample = trigger_sample
+        self.points = list(points) if points is not None else []
+        self.ts = ts
+        self.df = None
+        self.stream = None
+        self.stats = None
+        self.filename = filename
+        self.segment_size = max(int(segment_size), 1)
+        self.capacity = max(int(math.ceil(float(retention)/self.segment_size)), 1) * self.segment_size
+        self.segments = []
+        self.count = 0
+        self._ring = np.memmap(filename, dtype=np.float64, mode='w+', shape=(self.capacity, max(len(self.points), 1)))
+
+    @property
+    def data(self):
+        """
+        List of read-only RingColumn views of the records still in the ring buffer.
+        """
+        start = max(self.count - self.capacity, 0)
+        return [RingColumn(self, j, start, self.count) for j in range(len(self.points))]
+
+    @data.setter
+    def data(self, data):
+        raise DatasetError('Ring dataset data can not be assigned')
+
+    def _rows(self, start, stop):
+        """
+        Records [start, stop) from the ring buffer, the records must still be in the buffer.
+        """
+        if start < max(self.count - self.capacity, 0) or stop > self.count:
+            raise DatasetError('Records %s-%s not in ring buffer' % (start, stop))
+        if stop <= start:
+            return np.empty((0, len(self.points)))
+        a = start % self.capacity
+        b = stop % self.capacity
+        if a < b:
+            return np.array(self._ring[a:b, :len(self.points)])
+        return np.concatenate((self._ring[a:, :len(self.points)], self._ring[:b, :len(self.points)]))
+
+    def _segment_filename(self, index):
+        return '%s_%04d.npz' % (os.path.splitext(self.filename)[0], index)
+
+    def _spill(self):
+        start = len(self.segments) * self.segment_size
+        rows = self._rows(start, start + self.segment_size)
+        ds = Dataset(points=self.points, data=[_nan_column(rows[:, j]) for j in range(len(self.points))],
+                     start_time=self.start_time, sample_rate=self.sample_rate, trigger_sample=self.trigger_sample)
+        filename = self._segment_filename(len(self.segments))
+        ds.to_npz(filename)
+        self.segments.append(filename)
+        self._ring.flush()
+
+    def _write(self, rows):
+        """
+        Write a (records x points) float64 block into the ring buffer, spilling each segment as it completes.
+        """
+        i = 0
+        while i < len(rows):
+            count = min(len(rows) - i, self.segment_size - self.count % self.segment_size)
+            pos = self.count % self.capacity
+            self._ring[pos:pos + count, :len(self.points)] = rows[i:i + count]
+            self.count += count
+            i += count
+            if self.count % self.segment_size == 0:
+                self._spill()
+
+    def __len__(self):
+        return self.count
+
+    def point_data(self, point):
+        try:
+            idx = self.points.index(point)
+        except ValueError:
+            raise DatasetError('Data point not in dataset: %s' % point)
+        return RingColumn(self, idx, max(self.count - self.capacity, 0), self.count)
+
+    def append(self, data):
+        if len(data) != len(self.points):
+            raise DatasetError('Append record point mismatch, dataset contains %s points,'
+                               ' appended data contains %s points' % (len(self.points), len(data)))
+        self._write(np.array([[_float(v) for v in data]], dtype=np.float64))
+
+    def extend(self, data):
+        self.append_block(data)
+
+    def append_block(self, data):
+        if isinstance(data, dict):
+            for p in data:
+                if p not in self.points:
+                    raise DatasetError('Data point not in dataset: %s' % p)
+            cols = [data.get(p) for p in self.points]
+        else:
+            cols = list(data)
+        if len(cols) != len(self.points):
+            raise DatasetError('Append block point mismatch, dataset contains %s points,'
+                               ' appended data contains %s points' % (len(self.points), len(cols)))
+        count = max([len(c) for c in cols if c is not None] or [0])
+        rows = np.full((count, len(self.points)), np.nan)
+        for j in range(len(cols)):
+            col = cols[j]
+            if col is None:
+                continue
+            if len(col) != count:
+                raise DatasetError('Append block record count mismatch, all points must contain %s records' % count)
+            arr = np.asarray(col)
+            if arr.dtype.kind not in 'biuf':
+                arr = np.array([_float(v) for v in col], dtype=np.float64)
+            rows[:, j] = arr
+        self._write(rows)
+
+    def clear(self):
+        """
+        Remove all records, the spilled segment files are deleted.
+        """
+        for filename in self.segments:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+        self.count = 0
+        self.segments = []
+
+    def stream_csv(self, filename, chunk_size=CSV_CHUNK_SIZE, rotate_size=None):
+        raise DatasetError('Csv streaming is not supported for ring datasets, use the spill segments')
+
+    def history(self, points=None):
+        """
+        Return a Dataset containing the complete capture history rebuilt from the spilled segments and the records
+        not yet spilled. The whole history is loaded into memory, use to_csv()/to_npz() or iter_history() for long
+        captures.
+
+        :param points: optional list of point names, all points if None
+        """
+        if points is None:
+            points = self.points
+        ds = Dataset(points=list(points), start_time=self.start_time, sample_rate=self.sample_rate,
+                     trigger_sample=self.trigger_sample, ts=self.ts)
+        for cols in self.iter_history(points):
+            ds.append_block(cols)
+        return ds
+
+    def iter_history(self, points=None):
+        """
+        Iterate over the complete capture history one segment at a time.
+
+        :param points: optional list of point names, all points if None
+
+        :return: iterator of lists of Columns (one per point), the last list holds the records not yet spilled
+        """
+        if points is None:
+            points = self.points
+        for filename in self.segments:
+            with DatasetFile(filename) as f:
+                yield [f.point_data(p) for p in points]
+        start = len(self.segments) * self.segment_size
+        yield [RingColumn(self, self.points.index(p), start, self.count) for p in points]
+
+    def to_csv(self, filename):
+        """
+        Write the complete capture history to a csv file, one segment at a time.
+        """
+        with open(filename, 'w') as f:
+            f.write('%s\n' % ', '.join(map(str, self.points)))
+            for cols in self.iter_history():
+                rows = len(cols[0]) if cols else 0
+                for i in range(0, rows, CSV_CHUNK_SIZE):
+                    f.write(format_rows(cols, i, min(i + CSV_CHUNK_SIZE, rows)))
+
+    def to_npz(self, filename):
+        """
+        Write the complete capture history in the Dataset.to_npz() format. Each point array is written to the
+        archive one segment at a time so the history is never loaded into memory at once.
+        """
+        start_time = self.start_time
+        if start_time is not None and not isinstance(start_time, (int, float)):
+            start_time = str(start_time)
+        meta = {'points': [str(p) for p in self.points], 'start_time': start_time, 'sample_rate': self.sample_rate,
+                'trigger_sample': self.trigger_sample, 'objects': {}}
+        with zipfile.ZipFile(filename, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            for p in self.points:
+                if self._write_npy(zf, p):
+                    self._write_npy(zf, p, mask=True)
+            with zf.open(NPZ_META + '.npy', 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, np.array(json.dumps(meta)), allow_pickle=False)
+
+    def _write_npy(self, zf, point, mask=False):
+        """
+        Write the history of a point (or of its missing value mask) as an npy member of an npz archive, one segment
+        at a time.
+
+        :return: True if the point has missing values
+        """
+        name = str(point) + NPZ_MASK if mask else str(point)
+        dtype = np.dtype(bool) if mask else np.dtype(np.float64)
+        masked = False
+        with zf.open(name + '.npy', 'w', force_zip64=True) as f:
+            np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                                     'fortran_order': False, 'shape': (self.count,)})
+            for cols in self.iter_history([point]):
+                col_mask = cols[0].mask
+                masked = masked or bool(col_mask.any())
+                data = col_mask if mask else cols[0].values
+                f.write(np.ascontiguousarray(data, dtype=dtype).tobytes())
+        return masked
+
+    def close(self):
+        """
+        Flush the ring buffer file.
+        """
+        self._ring.flush()
+
+
 if __name__ == "__main__":
 
     rms_points = ['TIME',
@@ -30,10 +30,9 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 Questions can be directed to support@sunspec.org
 """
 
-import sys
 import os
-import glob
-import importlib
+
+from . import plugins
 
 # Import all dcsim extensions in current directory.
 # A dcsim extension has a file name of dcsim_*.py and contains a function dcsim_params(info) that contains
@@ -41,7 +40,7 @@ import importlib
 
 # dict of modules found, entries are: name : module_name
 
-dcsim_modules = {}
+dcsim_modules = plugins.PluginModules()
 
 def params(info, id=None, label='DC Simulator', group_name=None, active=None, active_value=None):
     if group_name is None:
@@ -224,30 +223,18 @@ class DCSim(object):
         return state
 
 def dcsim_scan():
+    """
+    Scan for dcsim modules on import.
+
+    Finds all files in the current directory that match 'dcsim_*.py' and registers them in 'dcsim_modules',
+    keyed by the 'mode' value returned from 'dcsim_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used.
+    """
     global dcsim_modules
     # scan all files in current directory that match dcsim_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'dcsim_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'dcsim_info'):
-                info = m.dcsim_info()
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    dcsim_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            print(DCSimError('Error scanning module %s: %s' % (module_name, str(e))))
+    plugins.plugin_scan(dcsim_modules, os.path.dirname(os.path.realpath(__file__)), 'dcsim_*.py', 'dcsim_info',
+                        package_name=package_name, error=DCSimError)
 
 # scan for dcsim modules on import
 dcsim_scan()
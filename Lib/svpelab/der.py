@@ -37,12 +37,11 @@ layer. It has the purpose to help the development of new code. Look into der_com
 """
 Import section: importlib here is necessary to do the scan function located at the bottom of the code
 """
-import sys
 import os
-import glob
-import importlib
 
-der_modules = {} # Initialised during the scan function at the bottom. It includes all the driver with der_*.py
+from . import plugins
+
+der_modules = plugins.PluginModules() # Initialised during the scan function at the bottom. It includes all the driver with der_*.py
 DER_DEFAULT_ID = 'der'
 """
 Params function: This function initialise the overall parameter sections of der devices. Then, if a mode is selected,
@@ -835,40 +834,17 @@ class DER(object):
 
 def der_scan():
     """
-    Scans for DER (Distributed Energy Resource) modules in the current directory and imports them.
-    
-    This function searches for all Python files in the current directory that match the pattern 'der_*.py', imports them, and 
-    extracts the 'der_info' function from each module. The 'der_info' function is expected to return a dictionary containing 
-    information about the DER module, including the 'mode' key which is used to store the module in the 'der_modules' global dictionary.
-    
-    If a module does not have a 'der_info' function, or if an exception occurs during the import, 
-    the module is removed from the 'sys.modules' dictionary to prevent further attempts to import it.
+    Scan for der modules on import.
+
+    Finds all files in the current directory that match 'der_*.py' and registers them in 'der_modules',
+    keyed by the 'mode' value returned from 'der_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used.
     """
     global der_modules
     # scan all files in current directory that match der_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'der_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'der_info'):
-                info = m.der_info()
-                print('DER Info %s' % info)
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    der_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            print(DERError('Error scanning module %s: %s' % (module_name, str(e))))
+    plugins.plugin_scan(der_modules, os.path.dirname(os.path.realpath(__file__)), 'der_*.py', 'der_info',
+                        package_name=package_name, error=DERError)
 
 # scan for der modules on import
 der_scan()
@@ -37,12 +37,11 @@ Acronyms in this document:
 
 """
 
-import sys
 import os
-import glob
-import importlib
 
-der1547_modules = {}
+from . import plugins
+
+der1547_modules = plugins.PluginModules()
 
 
 def params(info, id=None, label='DER1547', group_name=None, active=None, active_value=None):
@@ -977,31 +976,19 @@ class DER1547(object):
 
 
 def der1547_scan():
+    """
+    Scan for der1547 modules on import.
+
+    Finds all files in the current directory that match 'der1547_*.py' and registers them in 'der1547_modules',
+    keyed by the 'mode' value returned from 'der1547_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used. Scan and module import errors
+    are raised as DER1547Error.
+    """
     global der1547_modules
     # scan all files in current directory that match der1547_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'der1547_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'der1547_info'):
-                info = m.der1547_info()
-                print('DER 1547 Info %s' % info)
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    der1547_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            raise DER1547Error('Error scanning module %s: %s' % (module_name, str(e)))
+    plugins.plugin_scan(der1547_modules, os.path.dirname(os.path.realpath(__file__)), 'der1547_*.py', 'der1547_info',
+                        package_name=package_name, error=DER1547Error, raise_errors=True)
 
 # scan for der1547 modules on import
 der1547_scan()
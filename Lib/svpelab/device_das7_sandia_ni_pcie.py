@@ -216,6 +216,9 @@ class Device(object):
 
         self.time_vector = np.linspace(0., self.n_samples/self.sample_rate, self.n_samples)
         self.n_channels = len(self.analog_channels)
+        # frequency/ROCOF estimator of each device/metered point, kept across records (see data_read())
+        self.freq_estimators = {}
+        self.record_start = None
 
         for k in range(len(self.analog_channels)):
             chan = DSM_CHANNELS[self.analog_channels[k]]['physChan']
@@ -328,6 +331,7 @@ class Device(object):
             # Start Master last so slave(s) will wait for trigger from master over RSTI bus
             print(('Starting Task: %s.' % k))
             self.analog_input[k].StartTask()
+        self.record_start = time.time()
 
         # DAQmx Read Code
         # fillMode options
@@ -381,26 +385,31 @@ class Device(object):
                    'bat_v_phC': None,
                    'bat_i_phC': None,
                    'mcc_freq': None,
+                   'mcc_rocof': None,
                    'mcc_p': None,
                    'mcc_s': None,
                    'mcc_q': None,
                    'mcc_pf': None,
                    'load_freq': None,
+                   'load_rocof': None,
                    'load_p': None,
                    'load_s': None,
                    'load_q': None,
                    'load_pf': None,
                    'genset_freq': None,
+                   'genset_rocof': None,
                    'genset_p': None,
                    'genset_s': None,
                    'genset_q': None,
                    'genset_pf': None,
                    'pv_freq': None,
+                   'pv_rocof': None,
                    'pv_p': None,
                    'pv_s': None,
                    'pv_q': None,
                    'pv_pf': None,
                    'bat_freq': None,
+                   'bat_rocof': None,
                    'bat_p': None,
                    'bat_s': None,
                    'bat_q': None,
@@ -466,9 +475,7 @@ class Device(object):
                     self.ts.log_debug('Found Channel %s' % analog_chan_name)
                     if analog_chan_name[-5:] == 'v_phA':
                         ac_voltage_a = data[dsm_name]
-                        svp_name = s + '_freq'
-                        datarec[svp_name], _ = waveform_analysis.freq_from_crossings(self.time_vector, ac_voltage_a,
-                                                                                     self.sample_rate)
+                        datarec[s + '_freq'], datarec[s + '_rocof'] = self.freq_update(s, ac_voltage_a)
                     elif analog_chan_name[-5:] == 'v_phB':
                         ac_voltage_b = data[dsm_name]
                     elif analog_chan_name[-5:] == 'v_phC':
@@ -524,6 +531,23 @@ class Device(object):
         return datarec
 
 
+    def freq_update(self, channel, samples):
+        """
+        Feed a record of a channel to its frequency estimator, the estimator of each channel is kept across records
+        so ROCOF spans consecutive records.
+
+        :return: tuple (average frequency of the cycles in the record or None, latest ROCOF or None)
+        """
+        estimator = self.freq_estimators.get(channel)
+        if estimator is None:
+            estimator = waveform_analysis.FrequencyEstimator(self.sample_rate)
+            self.freq_estimators[channel] = estimator
+        _, freqs, _ = estimator.update(samples, self.record_start)
+        freq = None
+        if len(freqs) > 0:
+            freq = len(freqs)/np.sum(1./freqs)
+        return freq, estimator.rocof
+
     def waveform_config(self, params):
         """
         Configure waveform capture.
@@ -627,9 +651,8 @@ class Device(object):
         self.wfm_trigger_cond = trig_condition
 
     def waveform_capture_dataset(self):
-        ds = dataset.Dataset()
-        ds.points.append('TIME')
-        ds.data.append(self.time_vector)
+        points = ['TIME']
+        cols = [self.time_vector]
 
         dev_idx = -1
         data = {}
@@ -648,9 +671,11 @@ class Device(object):
                 data[self.analog_channels[k]] = scaled_data
             else:
                 print('No channel index')
-            ds.points.append(dsm_points_mcc.get(self.analog_channels[k]))
-            ds.data.append(data[self.analog_channels[k]])  # first row for first signal and so on
+            points.append(dsm_points_mcc.get(self.analog_channels[k]))
+            cols.append(data[self.analog_channels[k]])  # first row for first signal and so on
 
+        ds = dataset.Dataset(points=points, ts=self.ts)
+        ds.append_block(cols)
         return ds
 
 
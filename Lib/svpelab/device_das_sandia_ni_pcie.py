@@ -68,6 +68,7 @@ data_points = [
     'AC_P',
     'AC_Q',
     'AC_FREQ',
+    'AC_ROCOF',
     'AC_PF',
     'TRIG',
     'TRIG_GRID'
@@ -352,6 +353,9 @@ class Device(object):
         self.ac_voltage_vector = None
         self.ac_current_vector = None
         self.ametek_trigger = None
+        # frequency/ROCOF estimators of the voltage and current channels, kept across records (see data_read())
+        self.freq_estimators = {}
+        self.record_start = None
 
         # waveform settings
         self.wfm_sample_rate = None
@@ -429,6 +433,7 @@ class Device(object):
             # Start Master last so slave(s) will wait for trigger from master over RSTI bus
             print(('Starting Task: %s.' % k))
             self.analog_input[k].StartTask()
+        self.record_start = time.time()
 
         # DAQmx Read Code
         # fillMode options
@@ -507,12 +512,12 @@ class Device(object):
             if self.analog_channels[k] == 'Ametek_Trigger':
                 self.ametek_trigger = data[self.analog_channels[k]]
 
+        freq = None
+        rocof = None
         if self.ac_voltage_vector is not None:
-            freq, _ = waveform_analysis.freq_from_crossings(self.time_vector, self.ac_voltage_vector, self.sample_rate)
+            freq, rocof = self.freq_update('AC_Voltage', self.ac_voltage_vector)
         elif self.ac_current_vector is not None:
-            freq, _ = waveform_analysis.freq_from_crossings(self.time_vector, self.ac_current_vector, self.sample_rate)
-        else:
-            freq = None
+            freq, rocof = self.freq_update('AC_Current', self.ac_current_vector)
 
         avg_P, S, Q1, N, PF1 = waveform_analysis.harmonic_analysis(self.time_vector, self.ac_voltage_vector,
                                                                    self.ac_current_vector,
@@ -525,6 +530,7 @@ class Device(object):
                    'AC_Q_1': Q1,
                    'AC_PF_1': PF1,
                    'AC_FREQ_1': freq,
+                   'AC_ROCOF_1': rocof,
                    'AC_VRMS_2': None,
                    'AC_IRMS_2': None,
                    'AC_P_2': None,
@@ -546,6 +552,23 @@ class Device(object):
         return datarec
 
 
+    def freq_update(self, channel, samples):
+        """
+        Feed a record of a channel to its frequency estimator, the estimator of each channel is kept across records
+        so ROCOF spans consecutive records.
+
+        :return: tuple (average frequency of the cycles in the record or None, latest ROCOF or None)
+        """
+        estimator = self.freq_estimators.get(channel)
+        if estimator is None:
+            estimator = waveform_analysis.FrequencyEstimator(self.sample_rate)
+            self.freq_estimators[channel] = estimator
+        _, freqs, _ = estimator.update(samples, self.record_start)
+        freq = None
+        if len(freqs) > 0:
+            freq = len(freqs)/np.sum(1./freqs)
+        return freq, estimator.rocof
+
     def waveform_config(self, params):
         """
         Configure waveform capture.
@@ -701,9 +724,8 @@ class Device(object):
         self.wfm_trigger_cond = trig_condition
 
     def waveform_capture_dataset(self):
-        ds = dataset.Dataset()
-        ds.points.append('TIME')
-        ds.data.append(self.time_vector)
+        points = ['TIME']
+        cols = [self.time_vector]
 
         dev_idx = -1
         data = {}
@@ -719,9 +741,11 @@ class Device(object):
                                          dsm_value=self.raw_data[dev_idx][chan_idx*self.n_samples:(chan_idx+1)*self.n_samples])
             data[self.analog_channels[k]] = scaled_data
 
-            ds.points.append(dsm_points_map.get(self.analog_channels[k]))
-            ds.data.append(data[self.analog_channels[k]])  # first row for first signal and so on
+            points.append(dsm_points_map.get(self.analog_channels[k]))
+            cols.append(data[self.analog_channels[k]])  # first row for first signal and so on
 
+        ds = dataset.Dataset(points=points, ts=self.ts)
+        ds.append_block(cols)
         return ds
 
 
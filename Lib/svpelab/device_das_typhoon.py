@@ -549,13 +549,15 @@ class Device(object):
         ds = dataset.Dataset()
         masterlist = self.analog_channels + self.digital_channels
         if len(self.signalsNames) == len(masterlist):
-            ds.points.append('TIME')
-            ds.data.append(self.time_vector[0::self.subsampling_rate])
+            points = ['TIME']
+            cols = [self.time_vector[0::self.subsampling_rate]]
             chan_count = 0
             for c in masterlist:
-                ds.points.append(wfm_typhoon_channels[c])
-                ds.data.append(self.wfm_data[chan_count][0::self.subsampling_rate])
+                points.append(wfm_typhoon_channels[c])
+                cols.append(self.wfm_data[chan_count][0::self.subsampling_rate])
                 chan_count += 1
+            ds = dataset.Dataset(points=points, ts=self.ts)
+            ds.append_block(cols)
 
         else:
             self.ts.log_error('Number of channels returned from waveform capture is unexpected. '
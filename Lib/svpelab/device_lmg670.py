@@ -4,12 +4,19 @@ import pandas as pd
 from datetime import datetime, timedelta
 import re
 import sys
+import struct
+import threading
+import collections
 
 EOS = "\n"
 TIMEOUT = 10
 START_TIMESTAMP = 0
 SEARCHING = 2
 FINISHED = 5
+STREAM_BUFFER_SIZE = 10000  # frames kept in the streaming ring buffer
+STREAM_READ_TIMEOUT = 1000  # ms, bounds how long the streaming thread takes to notice a stop request
+STREAM_DRAIN_TIMEOUT = 100  # ms of silence that ends draining of buffered frames
+VI_ERROR_TMO = -1073807339  # VISA timeout status code
 # map data points to query points
 
 query_points = {
@@ -36,6 +43,10 @@ class DeviceError(Exception):
     pass
 
 
+def _visa_timeout(e):
+    return getattr(e, 'error_code', None) == VI_ERROR_TMO
+
+
 class Device(object):
     """
       Power Analyzer interface for LMG670 hardware
@@ -53,6 +64,9 @@ class Device(object):
           goto_short_commands(): Enable short command format
           rms_config(): Configure RMS measurements
           data_read(): Read current measurement values
+          stream_start(): Start continuous binary output decoded on a background thread
+          stream_stop(): Stop continuous output
+          stream_data(): Return and clear the frames in the streaming ring buffer
           query(cmd_str): Send query command to device
           write(cmd_str): Send write command to device
           set_ranges(current, voltage): Set the current and voltage ranges
@@ -68,6 +82,19 @@ class Device(object):
         self.timestamp = params.get('timestamp')
         self._short_commands_enabled = False
         self.timeout = None
+        self.acquisition = params.get('acquisition')  # 'Polled' or 'Streaming'
+        if self.acquisition is None:
+            self.acquisition = 'Polled'
+        # Streaming state
+        self.stream_buffer = collections.deque(maxlen=STREAM_BUFFER_SIZE)
+        self.stream_frames = 0
+        self.stream_resyncs = 0
+        self.stream_error = None
+        self._stream_thread = None
+        self._stream_stop = threading.Event()
+        self._stream_lock = threading.Lock()  # serializes CONT ON/OFF of the streaming thread and stream_stop()
+        self._stream_owner = None  # thread allowed to send commands while streaming (holds _stream_lock)
+        self._stream_struct = None
         # Resource Manager for pyvisa
         self.rm = None
         # Connection object
@@ -107,6 +134,8 @@ class Device(object):
                         self.data_points.append(point_str)
                         # Config the rms values
         self.rms_config()
+        if self.acquisition == 'Streaming':
+            self.stream_start()
 
     """
     Communication
@@ -140,6 +169,7 @@ class Device(object):
         """
         if self.params['comm'] == 'Ethernet':
             try:
+                self.stream_stop()
                 if self.conn is not None:
                     self.conn.close()
             except Exception as e:
@@ -147,13 +177,22 @@ class Device(object):
         else:
             raise ValueError('Unknown communication type %s. Use Serial or Ethernet' % self.params['comm'])
 
+    def _check_streaming(self):
+        """
+        Commands and queries would consume stream frames, only the stream control is allowed while streaming.
+        """
+        if self._stream_thread is not None and self._stream_owner is not threading.current_thread():
+            raise DeviceError('lmg670 is streaming, call stream_stop() before sending commands')
+
     def cmd(self, cmd_str):
+        self._check_streaming()
         try:
             self.conn.write(cmd_str)
         except Exception as e:
             raise DeviceError('lmg670 communication error: %s' % str(e))
 
     def query(self, cmd_str):
+        self._check_streaming()
         try:
             self.cmd(cmd_str)
             resp = self.conn.read()
@@ -194,6 +233,7 @@ class Device(object):
 
     def query_short_bin(self, msg):
         self.goto_short_commands()
+        self._check_streaming()
         return self.conn.query_binary_values(msg)
 
     """
@@ -243,9 +283,11 @@ class Device(object):
         pass
 
     def data_read(self):
+        if self._stream_thread is not None:
+            return self.stream_latest()
         data = self.query_short("INIM; TSNORM?; %s" % self.query_chan_str).split(";")
         time_zimmer = data.pop(0)
-        ts = time.clock()
+        ts = time.time()
         if self.timestamp == "Zimmer":
             m = re.search('(.*)\.[0-9]{6}', time_zimmer)
             # Remove the Nano Seconds since not use at the moment
@@ -256,6 +298,167 @@ class Device(object):
         data.insert(0, ts)
         return data
 
+    """
+    Streaming Functions
+    """
+
+    def stream_start(self):
+        """
+        Start continuous output of the configured values. The instrument repeats the value query every measuring
+        cycle in packed (binary) format and a background thread decodes each frame into the streaming ring buffer,
+        so data_read() returns the latest frame without a round trip. Frames are time stamped on arrival. Other
+        commands and queries raise DeviceError until stream_stop() is called.
+        """
+        if self._stream_thread is not None:
+            return
+        self._stream_struct = struct.Struct('<%df' % (len(self.data_points) - 1))
+        self.stream_buffer.clear()
+        self.stream_frames = 0
+        self.stream_resyncs = 0
+        self.stream_error = None
+        self._stream_stop.clear()
+        self.send_short('FRMT PACKed')
+        # frames are binary blocks, read by length instead of terminator
+        self.conn.read_termination = None
+        self.conn.timeout = STREAM_READ_TIMEOUT
+        self.send_short('ACTN; %sCONT ON' % self.query_chan_str)
+        self._stream_thread = threading.Thread(target=self._stream_run, name='lmg670_stream')
+        self._stream_thread.daemon = True
+        self._stream_thread.start()
+
+    def stream_stop(self):
+        """
+        Stop continuous output and return to polled ASCII queries.
+        """
+        if self._stream_thread is None:
+            return
+        self._stream_stop.set()
+        try:
+            with self._stream_lock:
+                self._stream_owner = threading.current_thread()
+                try:
+                    self.cont_off()
+                finally:
+                    self._stream_owner = None
+        finally:
+            self._stream_thread.join()
+            self._stream_thread = None
+            # discard frames sent before the instrument processed CONT OFF
+            try:
+                self._stream_drain()
+            except Exception:
+                pass
+            self.conn.read_termination = EOS
+            self.conn.timeout = 5000
+        self.send_short('FRMT ASCii')
+
+    def _stream_frame(self):
+        """
+        Read one packed frame, an IEEE 488.2 definite length block of little-endian 32 bit floats.
+
+        Returns None if no frame started within the read timeout. A timeout after the start of the frame is raised,
+        the frame is incomplete and the stream must be resynchronized (see _stream_resync()).
+        """
+        read = self.conn.read_bytes
+        # skip the terminator of the previous frame
+        try:
+            c = read(1)
+            while c != b'#':
+                c = read(1)
+        except Exception as e:
+            if _visa_timeout(e):
+                return None
+            raise
+        try:
+            digits = int(read(1))
+            length = int(read(digits))
+        except ValueError:
+            raise DeviceError('LMG670 stream frame header error')
+        if length != self._stream_struct.size:
+            raise DeviceError('LMG670 stream frame has %d bytes, expected %d' % (length, self._stream_struct.size))
+        return self._stream_struct.unpack(read(length))
+
+    def _stream_drain(self):
+        """
+        Discard received data until the line has been silent for STREAM_DRAIN_TIMEOUT.
+        """
+        self.conn.timeout = STREAM_DRAIN_TIMEOUT
+        try:
+            while True:
+                self.conn.read_bytes(1024)
+        except Exception as e:
+            if not _visa_timeout(e):
+                raise
+        finally:
+            self.conn.timeout = STREAM_READ_TIMEOUT
+
+    def _stream_resync(self):
+        """
+        Restart continuous output after a partial or corrupt frame so the next read starts on a frame boundary.
+        """
+        with self._stream_lock:
+            if self._stream_stop.is_set():
+                return
+            self._stream_owner = threading.current_thread()
+            try:
+                self.cont_off()
+                self._stream_drain()
+                self.send_short('ACTN; %sCONT ON' % self.query_chan_str)
+            finally:
+                self._stream_owner = None
+            self.stream_resyncs += 1
+
+    def _stream_run(self):
+        while not self._stream_stop.is_set():
+            try:
+                values = self._stream_frame()
+            except Exception as e:
+                if self._stream_stop.is_set():
+                    break
+                if not (_visa_timeout(e) or isinstance(e, DeviceError)):
+                    self.stream_error = e
+                    break
+                try:
+                    self._stream_resync()
+                except Exception as e:
+                    if not self._stream_stop.is_set():
+                        self.stream_error = e
+                    break
+                continue
+            if values is None:
+                continue
+            data = [time.time()]
+            data.extend(values)
+            self.stream_buffer.append(data)
+            self.stream_frames += 1
+
+    def stream_latest(self, timeout=None):
+        """
+        Return the latest streamed frame, waiting up to timeout seconds (default two device cycles plus one
+        second) for the first frame.
+        """
+        if timeout is None:
+            timeout = 2 * float(self.sample_interval) / 1000 + 1
+        end = time.time() + timeout
+        while not self.stream_buffer:
+            if self.stream_error is not None:
+                raise DeviceError('LMG670 streaming error: %s' % str(self.stream_error))
+            if time.time() > end:
+                raise DeviceError('LMG670 streaming timeout waiting for data')
+            time.sleep(0.01)
+        if self.stream_error is not None:
+            raise DeviceError('LMG670 streaming error: %s' % str(self.stream_error))
+        return list(self.stream_buffer[-1])
+
+    def stream_data(self):
+        """
+        Return all frames in the streaming ring buffer (oldest first) and clear it, for full rate acquisition.
+        """
+        frames = []
+        while self.stream_buffer:
+            frames.append(self.stream_buffer.popleft())
+        return frames
+
     def set_ranges(self, current, voltage):
         """
         Set the current and voltage ranges.
@@ -32,7 +32,8 @@ Questions can be directed to support@sunspec.org
 
 import sys
 import time
-import socket
+
+from . import scpi
 
 EN_50530_CURVE = 'EN 50530 CURVE'
 SVP_CURVE = 'SVP CURVE'
@@ -74,35 +75,20 @@ class SPS(object):
 
     # TCP/IP command
     def _cmd(self, cmd_str):
-        try:
-            if self.conn is None or self.conn is 'Network':
-                self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.conn.settimeout(self.timeout)
-                self.conn.connect((self.ipaddr, self.ipport))
+        if self.conn is None:
+            self.conn = scpi.TCPTransport(self.ipaddr, self.ipport, term='\r', timeout=self.timeout,
+                                          buffer_size=self.buffer_size)
 
-            # print 'cmd> %s' % (cmd_str)
-            self.conn.send(cmd_str)
-        except Exception as e:
-            raise
+        # print 'cmd> %s' % (cmd_str)
+        self.conn.write(cmd_str)
 
     # TCP/IP query
     def _query(self, cmd_str):
-        resp = ''
-        more_data = True
-
         self._cmd(cmd_str)
-
-        while more_data:
-            try:
-                data = self.conn.recv(self.buffer_size)
-                if len(data) > 0:
-                    for d in data:
-                        resp += d
-                        if d == '\r':
-                            more_data = False
-                            break
-            except Exception as e:
-                raise SPSError('Timeout waiting for response')
+        try:
+            resp = self.conn.read()
+        except scpi.ScpiError as e:
+            raise SPSError('Timeout waiting for response: %s' % str(e))
 
         return resp
 
@@ -33,6 +33,7 @@ Questions can be directed to support@sunspec.org
 import time
 
 from . import vxi11
+from . import scpi
 
 '''
 data_query_str = (
@@ -92,17 +93,6 @@ def pf_scan(points, pf_points):
             except ValueError:
                 pass
 
-def pf_adjust_sign(data, pf_idx, p_idx, q_idx):
-    """
-    Power factor sign is the opposite sign of the product of active power and reactive power
-    """
-    pq = data[p_idx] * data[q_idx]
-    # sign should be opposite of product of p and q
-    pf = abs(data[pf_idx])
-    if pq >= 0:
-        pf = pf * -1
-    return pf
-
 
 class DeviceError(Exception):
     """
@@ -119,6 +109,10 @@ class Device(object):
         self.channels = params.get('channels')
         self.data_points = ['TIME']
         self.pf_points = []
+        self.numeric_format = params.get('numeric_format')  # 'Binary' or 'ASCII' numeric data transfer
+        if self.numeric_format is None:
+            self.numeric_format = 'Binary'
+        self.value_struct = None
 
         # create query string for configured channels
         query_chan_str = ''
@@ -144,7 +138,8 @@ class Device(object):
                         self.data_points.append(point_str)
         query_chan_str += '\n:NUMERIC:NORMAL:VALUE?'
 
-        self.query_str = ':NUMERIC:FORMAT ASCII\nNUMERIC:NORMAL:NUMBER %d\n' % (item) + query_chan_str
+        numeric_format = 'FLOAT' if self.numeric_format == 'Binary' else 'ASCII'
+        self.query_str = ':NUMERIC:FORMAT %s\nNUMERIC:NORMAL:NUMBER %d\n' % (numeric_format, item) + query_chan_str
 
         pf_scan(self.data_points, self.pf_points)
 
@@ -187,12 +182,18 @@ class Device(object):
         self.capture(enable)
 
     def data_read(self):
-        q = self.query(self.query_str)
-        data = [float(i) for i in q.split(',')]
-        data.insert(0, time.time())
-        for p in self.pf_points:
-            data[p[0]] = pf_adjust_sign(data, *p)
-        return data
+        data = [time.time()]
+        if self.numeric_format == 'Binary':
+            try:
+                q = self.vx.ask_raw(scpi.to_bytes(self.query_str))
+            except Exception as e:
+                raise DeviceError('PX8000 communication error: %s' % str(e))
+            values, self.value_struct = scpi.wt_float_values(q, self.value_struct)
+            data.extend(values)
+        else:
+            q = self.query(self.query_str)
+            data.extend([float(i) for i in q.split(',')])
+        return scpi.wt_pf_adjust_signs(data, self.pf_points)
 
     def capture(self, enable=None):
         """
@@ -33,9 +33,9 @@ Questions can be directed to support@sunspec.org
 import time
 from . import vxi11
 import numpy as np
-from pylab import *
 import math
 from . import dataset
+from . import scope_analysis
 
 DATA_POINTS = [  # 3 phase
     'TIME',
@@ -82,6 +82,10 @@ DATA_POINTS = [  # 3 phase
     'WAVENAME'
 ]
 
+TRANSFER_CHUNK = 1000000  # maximum CURVe? transfer size (points)
+VISA_CHUNK_SIZE = 4 * 1024 * 1024  # VISA read buffer size for binary transfers (bytes)
+WFM_PREAMBLE = ['x_incr', 'x_zero', 'y_mult', 'y_offset', 'y_zero']
+
 
 def pf_scan(points, pf_points):
     for i in range(len(points)):
@@ -113,6 +117,9 @@ class Device(object):
         self.ts = params.get('ts')
         self.sample_interval = params.get('sample_interval')
         self.save_wave = params.get('save_wave')
+        self.transfer = params.get('transfer')  # 'Fast' or 'Legacy' waveform transfer
+        if self.transfer is None:
+            self.transfer = 'Fast'
 
         self.data_points = []
         for x in range(len(DATA_POINTS)):
@@ -161,6 +168,8 @@ class Device(object):
                 self.conn = self.rm.open_resource(params.get('visa_id'))
                 self.conn.encoding = 'latin_1'
                 self.conn.write_termination = '\n'
+                if self.transfer == 'Fast':
+                    self.conn.chunk_size = VISA_CHUNK_SIZE
 
                 try:
                     if self.ts is not None:
@@ -303,19 +312,27 @@ class Device(object):
         wfm_bus_v = None
         wfm_bus_i = None
         times = None
-        for i in range(1, 5):  # pull data from each channel
+        channels = [i for i in range(1, 5) if self.chan_types.get(i) != 'None']
+        curves = {}
+        if self.transfer == 'Fast' and channels:
+            # pull all channels in one pass
+            times, curves = self.read_channels(channels)
+        for i in channels:  # pull data from each channel
             self.ts.log_debug('Pulling data from Channel %i' % i)
-            if self.chan_types.get(i) != 'None':
-                # self.ts.log_debug('Bus Type = %s' % self.chan_types.get(i))
-                if self.chan_types.get(i) == 'Switch_Current':
-                    times, wfm_sw_i = self.bitstream_to_analog(channel=i)
-                if self.chan_types.get(i) == 'Switch_Voltage':
-                    times, wfm_sw_v = self.bitstream_to_analog(channel=i)
-                if self.chan_types.get(i) == 'Bus_Voltage':
-                    times, wfm_bus_v = self.bitstream_to_analog(channel=i)
-                    # self.ts.log(wfm_bus_v)
-                if self.chan_types.get(i) == 'Bus_Current':
-                    times, wfm_bus_i = self.bitstream_to_analog(channel=i)
+            if i in curves:
+                wfm = curves[i]
+            else:
+                times, wfm = self.bitstream_to_analog(channel=i)
+            # self.ts.log_debug('Bus Type = %s' % self.chan_types.get(i))
+            if self.chan_types.get(i) == 'Switch_Current':
+                wfm_sw_i = wfm
+            if self.chan_types.get(i) == 'Switch_Voltage':
+                wfm_sw_v = wfm
+            if self.chan_types.get(i) == 'Bus_Voltage':
+                wfm_bus_v = wfm
+                # self.ts.log(wfm_bus_v)
+            if self.chan_types.get(i) == 'Bus_Current':
+                wfm_bus_i = wfm
 
         # save the waveform data to a csv in the test manifest
         wave_filename = None
@@ -472,49 +489,13 @@ class Device(object):
         pass
 
     def calc_bus_ripple(self, time_vect=None, data=None):
-        # number of slices in data to calculate ripple
-        # num_slice = 1000
-        # slice_length = int(self.length) / num_slice
-        # rip = []
-        # for n in range(0, num_slice - 1):
-        #     start = n * slice_length
-        #     stop = (n + 1) * slice_length
-        #     temp = [n, num_slice, slice_length, start, stop, len(data)]
-        #     # self.ts.log_debug(temp)
-        #     rip.append(max(data[start:stop])-min(data[start:stop]))
-        # # self.ts.log_debug('Measured Ripple = %s' % rip)
-        # bus_rip = mean(rip)
-        # bus_rip = min(rip)
-        # bus_rip = max(data) - min(data)
-        bus_mag = mean(data)
-
-        f_s = 1 / (time_vect[1] - time_vect[0])  # Hz  sampling frequency
-        f = 1.0  # Hz
-        N = len(time_vect)
-        T = 1 / f_s
-
-        FFT = np.fft.fft(data)
-        n = len(FFT)
-        yf = np.linspace(0.0, 1.0 / (2.0 * T), N // 2)
-        # print('f_s = ', f_s, f_s/N, yf[round(120/(f_s/N))], 2.0/N * np.abs(FFT[round(120/(f_s/N))]),
-        #       sum(2.0/N * np.abs(FFT)))
-        subset = FFT[0:N // 2]
-
-        # self.ts.log_debug(yf[round(110/(f_s/N)):round(130/(f_s/N))])
-        # self.ts.log_debug(2.0/N * np.abs(FFT[round(110/(f_s/N)):round(130/(f_s/N))]))
-        # self.ts.log_debug(sum(2.0/N * np.abs(FFT[round(110/(f_s/N)):round(130/(f_s/N))])))
-
-        amplitude_120 = sum(2.0 / N * np.abs(FFT[round(110 / (f_s / N)):round(130 / (f_s / N))]))
-        pk_pk_120 = 2 * amplitude_120
-        # amplitude_mppt = sum(2/N * np.abs(FFT[round(1/(f_s/N)):round(10/(f_s/N))]))
-        # pk_pk_mppt = 2 * sum(2/N * np.abs(FFT[round(1/(f_s/N)):round(10/(f_s/N))]))
-        bus_rip = pk_pk_120
-        # self.ts.log_debug(pk_pk_120)
-        # self.ts.log_debug(bus_rip)
-
-        self.ts.log_debug('Measured 120Hz Ripple = %s' % pk_pk_120)
+        """
+        Calculate the DC bus magnitude and 120 Hz peak to peak ripple (see scope_analysis.bus_ripple()).
+        """
+        bus_rip, bus_mag = scope_analysis.bus_ripple(time_vect, data)
+
+        self.ts.log_debug('Measured 120Hz Ripple = %s' % bus_rip)
         self.ts.log_debug('Bus Mag = %s' % bus_mag)
-        # self.ts.log_debug('Max Ripple = %s' % max(rip))
 
         return bus_rip, bus_mag
 
@@ -522,167 +503,48 @@ class Device(object):
         """
         Calculate total dissipated energy (J/s)
 
-         param: time_vect - time vector list
-         param: current - current list
-         param: voltage - voltage list
+         param: time_vect - time vector (numpy or list)
+         param: current - current (numpy or list)
+         param: voltage - voltage (numpy or list)
 
         """
 
         # determine time step
-        dt = round(time_vect[-1] - time_vect[-2], 11)
-        # self.ts.log('dT = ', dT)
-        for i in range(1, len(time_vect)):
-            temp = round(time_vect[i] - time_vect[i - 1], 11)
-            if temp != dt:
-                self.ts.log_warning('Uneven time step!')
-                self.ts.log_warning(temp, dt)
+        dt, uneven = scope_analysis.uneven_time_steps(time_vect)
+        if uneven:
+            self.ts.log_warning('Uneven time step! %d steps differ from %s' % (uneven, dt))
 
         # need to determine I_offset and V_offset automatically
-        print('voltage offset')
         volt_offset, volt_max = self.get_probe_offset(voltage)
-        print(volt_offset)
-        print('current offset')
         curr_offset, curr_max = self.get_probe_offset(current)
-        print(curr_offset)
         self.ts.log_debug('Voltage Offset = %s' % volt_offset)
         self.ts.log_debug('Current Offset = %s' % curr_offset)
         self.ts.log_debug('Voltage Max = %s' % volt_max)
 
-        # self.ts.log('Voltage offset = %s' % volt_offset)
-        # self.ts.log('Current offset = %s' % curr_offset)
+        loss = scope_analysis.switch_loss(time_vect, current, voltage, volt_offset, volt_max, curr_offset)
 
-        # re-bias time so it always starts at 0
-        start = time_vect[0]
-        for i in range(0, len(time_vect)):
-            time_vect[i] = time_vect[i] - start
-
-            if curr_offset <= 0:
-                current[i] = current[i] - curr_offset
-            else:
-                current[i] = current[i] + curr_offset
-            if volt_offset <= 0:
-                voltage[i] = voltage[i] + volt_offset
-            else:
-                voltage[i] = voltage[i] - volt_offset
-
-        # Calculate the instantaneous power
-        # Calculate the cumulative energy
-
-        power = []
-        block_power = []
-        conduct_power = []
-
-        energy = []
-        block_energy = []
-        conduct_energy = []
-
-        cum_energy = [0]
-        cum_block_energy = [0]
-        cum_conduct_energy = [0]
-
-        unknown = []
-
-        high = 0.90
-        low = 0.10
-        current_status = []
-        for i in range(0, len(current)):
-            if voltage[i] < (low * volt_max):
-                power.append(0)
-                block_power.append(0)
-                conduct_power.append(current[i] * voltage[i])
-                unknown.append(0)
-                current_status.append('conducting')
-            elif (high * volt_max) >= voltage[i] >= (low * volt_max):
-                power.append(current[i] * voltage[i])
-                conduct_power.append(0)
-                block_power.append(0)
-                unknown.append(0)
-                current_status.append('switching')
-            elif voltage[i] > (high * volt_max):
-                power.append(0)
-                conduct_power.append(0)
-                block_power.append(current[i] * voltage[i])
-                unknown.append(0)
-                current_status.append('blocking')
-            else:
-                power.append(0)
-                conduct_power.append(0)
-                block_power.append(0)
-                unknown.append(current[i] * voltage[i])
-                current_status.append('unknown')
-        pre = 20
-        for i in range(pre, len(current_status)):
-            if current_status[i] == 'switching' and current_status[i - 1] == 'blocking':
-                # print(block_power[i - pre:i - 1], power[i - pre:i - 1])
-                current_status[i - pre:i - 1] = ['switching'] * len(current_status[i - pre:i - 1])
-                power[i - pre:i - 1] = block_power[i - pre:i - 1]
-                block_power[i - pre:i - 1] = [0] * len(block_power[i - pre:i - 1])
-                # print(block_power[i-pre:i-1], power[i-pre:i-1])
-            else:
-                pass
-
-        for i in range(len(current_status), pre, -1):
-            # self.ts.log_debug('i is %s' % i)
-            if current_status[i - 1] == 'switching' and current_status[i] == 'blocking':
-                # print(block_power[i:i + pre], power[i:i + pre])
-                current_status[i:i + pre] = ['switching'] * len(current_status[i:i + pre])
-                power[i:i + pre] = block_power[i:i + pre]
-                block_power[i:i + pre] = [0] * len(block_power[i:i + pre])
-                # print(block_power[i:i+pre], power[i:i+pre])
-            else:
-                pass
-        for i in range(0, len(current)):
-            energy.append(power[i] * dt)
-            cum_energy.append(energy[i] + cum_energy[-1])
-
-            block_energy.append(block_power[i] * dt)
-            cum_block_energy.append(block_energy[i] + cum_block_energy[-1])
-
-            conduct_energy.append(conduct_power[i] * dt)
-            cum_conduct_energy.append(conduct_energy[i] + cum_conduct_energy[-1])
-        self.ts.log_debug('Average Switch Power (W) = %s' % str(mean(power)))
-        self.ts.log_debug('Average Conducting Power (W) = %s' % str(mean(conduct_power)))
-        self.ts.log_debug('Average Blocking Power (W) = %s' % str(mean(block_power)))
+        self.ts.log_debug('Average Switch Power (W) = %s' % str(loss['switch_power']))
+        self.ts.log_debug('Average Conducting Power (W) = %s' % str(loss['conduct_power']))
+        self.ts.log_debug('Average Blocking Power (W) = %s' % str(loss['block_power']))
         self.ts.log_debug('')
-        self.ts.log_debug('Cumulative Switch Energy (J) = %s' % str(cum_energy[-1]))
-        self.ts.log_debug('Switch Energy (J) per cycle (J/cycle)= %s' % str(cum_energy[-1] / time_vect[-1] * 16.66e-3))
-        self.ts.log_debug('Cumulative Conducting Energy (J) = %s' % str(cum_conduct_energy[-1]))
-        self.ts.log_debug('Conducting Energy (J) per cycle (J/cycle)= %s' %
-                          str(cum_conduct_energy[-1] / time_vect[-1] * 16.66e-3))
-        self.ts.log_debug('Cumulative Blocking Energy (J) = %s' % str(cum_block_energy[-1]))
-        self.ts.log_debug('Blocking Energy (J) per cycle (J/cycle)= %s' %
-                          str(cum_block_energy[-1] / time_vect[-1] * 16.66e-3))
+        self.ts.log_debug('Cumulative Switch Energy (J) = %s' % str(loss['switch_energy']))
+        self.ts.log_debug('Switch Energy (J) per cycle (J/cycle)= %s' % str(loss['switch'] * 16.66e-3))
+        self.ts.log_debug('Cumulative Conducting Energy (J) = %s' % str(loss['conduct_energy']))
+        self.ts.log_debug('Conducting Energy (J) per cycle (J/cycle)= %s' % str(loss['conduct'] * 16.66e-3))
+        self.ts.log_debug('Cumulative Blocking Energy (J) = %s' % str(loss['block_energy']))
+        self.ts.log_debug('Blocking Energy (J) per cycle (J/cycle)= %s' % str(loss['block'] * 16.66e-3))
         self.ts.log_debug('')
-        self.ts.log_debug('Switch Power (J/s) = %s' % str(cum_energy[-1] / time_vect[-1]))
-        self.ts.log_debug('Conducting Power (J/s) = %s' % str(cum_conduct_energy[-1] / time_vect[-1]))
-        self.ts.log_debug('Blocking Power (J/s) = %s' % str(cum_block_energy[-1] / time_vect[-1]))
+        self.ts.log_debug('Switch Power (J/s) = %s' % str(loss['switch']))
+        self.ts.log_debug('Conducting Power (J/s) = %s' % str(loss['conduct']))
+        self.ts.log_debug('Blocking Power (J/s) = %s' % str(loss['block']))
         self.ts.log_debug('')
-        return cum_energy[-1] / time_vect[-1], cum_block_energy[-1] / time_vect[-1], \
-               cum_conduct_energy[-1] / time_vect[-1], volt_offset, curr_offset  # Total dissipated energy (J/s)
+        return loss['switch'], loss['block'], loss['conduct'], volt_offset, curr_offset  # Total dissipated energy (J/s)
 
     def get_probe_offset(self, data):
         """
         Determine probe offset using histogram
         """
-        sor = sort(data)
-        sor_min = sor[sor <= (0.5 * sor[-1])]
-        sor_max = sor[sor > (0.5 * sor[-1])]
-
-        # find min
-        data_gram = histogram(data, bins=np.arange(sor_min[0], sor_min[-1], (sor_min[-1] - sor_min[0]) / 500))
-        loc = np.where(data_gram[0] == max(data_gram[0]))
-        data_offset = data_gram[1][loc][0]
-        # find max
-        data_gram = histogram(data, bins=np.arange(sor_max[0], sor_max[-1], (sor_max[-1] - sor_max[0]) / 500))
-        loc2 = np.where(data_gram[0] == max(data_gram[0]))
-        data_max = data_gram[1][loc2][0]
-        # sor = sort(data)
-        # hgram = histogram(data, bins=np.arange(sor[0], sor[-1], float(sor[-1]-sor[0]) / 100.))
-        # loc = np.where(hgram[0] == max(hgram[0][0:int(round(len(hgram[0])/2))]))
-        # loc2 = np.where(hgram[0] == max(hgram[0][round(len(hgram[0])/2):]))
-        # data_max = hgram[1][loc2][0]
-        # data_offset = hgram[1][loc][0]
-        return data_offset, data_max
+        return scope_analysis.probe_offset(data)
 
     def start_acquisition(self):
         # trigger a measurement
@@ -753,10 +615,81 @@ class Device(object):
         """
         pass
 
+    def waveform_preamble(self):
+        """
+        Read the conversion parameters of the current data source with a single combined WFMOutpre query.
+
+        Returns dict with the WFM_PREAMBLE entries.
+        """
+        resp = self.query('WFMOutpre:XINcr?;XZEro?;YMUlt?;YOFf?;YZEro?')
+        try:
+            # values may be preceded by their header if HEADer is ON
+            values = [float(v.split()[-1]) for v in resp.strip().split(';')]
+        except Exception:
+            values = []
+        if len(values) != len(WFM_PREAMBLE):
+            raise DeviceError('Invalid waveform preamble: %s' % resp)
+        return dict(zip(WFM_PREAMBLE, values))
+
+    def read_curve(self, channel, length, out=None):
+        """
+        Transfer the record of a channel in binary chunks of TRANSFER_CHUNK points into a float64 buffer and scale
+        it in place to voltage/current values.
+
+        Returns tuple (buffer, preamble dict).
+        """
+        self.cmd('DATa:SOUrce CH' + str(channel))  # setup the channel to read
+        preamble = self.waveform_preamble()
+        if out is None:
+            out = np.empty(length, dtype=np.float64)
+        for start in range(0, length, TRANSFER_CHUNK):
+            stop = min(start + TRANSFER_CHUNK, length)
+            self.cmd('DATa:STARt %d' % (start + 1))
+            self.cmd('DATa:STOP %d' % stop)
+            try:
+                chunk = self.conn.query_binary_values('CURVe?', datatype=self.dType, is_big_endian=self.bigEndian,
+                                                      container=np.array)
+            except Exception as e:
+                raise DeviceError('DPO3000 communication error: %s' % str(e))
+            if len(chunk) != stop - start:
+                raise DeviceError('Incomplete curve transfer from CH%s: %d of %d points' %
+                                  (channel, len(chunk), stop - start))
+            out[start:stop] = chunk
+
+        pos_clip, neg_clip, count = scope_analysis.clip_stats(out)
+        if pos_clip:
+            self.ts.log_warning('Positive Clipping at %s of %s elements on CH%s!!! Increase Channel Scale' %
+                                (pos_clip, count, channel))
+        if neg_clip:
+            self.ts.log_warning('Negative Clipping at %s of %s elements on CH%s!!! Reduce Channel Scale' %
+                                (neg_clip, count, channel))
+
+        scope_analysis.scale_curve(out, preamble['y_offset'], preamble['y_mult'], preamble['y_zero'], out=out)
+        return out, preamble
+
+    def read_channels(self, channels):
+        """
+        Fast waveform transfer of several channels of the last acquisition over the open connection.
+
+        Returns tuple (time vector, dict of channel number -> waveform), all numpy arrays.
+        """
+        self.query('*OPC?')  # wait for the acquisition to complete
+        length = int(float(self.query('HORizontal:RECOrdlength?').split('\n')[0]))
+        curves = {}
+        x_incr = None
+        for channel in channels:
+            curves[channel], preamble = self.read_curve(channel, length)
+            x_incr = preamble['x_incr']
+        times = np.arange(length) * x_incr if x_incr is not None else None
+        return times, curves
+
     def bitstream_to_analog(self, channel=1):
         """
         Collect data and convert channels to current/voltage values
         """
+        if self.transfer == 'Fast':
+            times, curves = self.read_channels([channel])
+            return times, curves[channel]
 
         self.cmd('DATa:SOUrce CH' + str(channel))  # setup the channel to read
 
@@ -776,9 +709,6 @@ class Device(object):
         # self.ts.log(y_offset)
         # self.ts.log(y_mu)
         # self.ts.log(y_zero)
-        waveform = []  # single channel data set as list
-        x = []  # time vector as list
-
         """
         Can only transfer 1M points at a time, so if the number of points is greater than 1M, then have to break it up
         """
@@ -821,42 +751,30 @@ class Device(object):
             else:
                 time.sleep(2)
 
-            lst = [int(i) for i in data]
-            # self.ts.log_debug(lst)
-            rst = [tmp == int(127) for tmp in lst]
-            rst_2 = [tmp == int(-127) for tmp in lst]
-            # self.ts.log_debug(rst)
-            if True in rst:
-                # self.ts.log(rst)
-                self.ts.log_warning('Positive Clipping at ' + str(len([i for i in lst if i == int(127)])) + ' of ' +
-                                    str(len(rst)) + ' elements!!! Increase Channel Scale')
-            if True in rst_2:
-                # self.ts.log(rst_2)
-                self.ts.log_warning('Negative Clipping at ' + str(len([i for i in lst if i == int(-127)])) + ' of ' +
-                                    str(len(rst_2)) + ' elements!!! Reduce Channel Scale')
-
-            # self.ts.log('data length = ', len(data))
-            # Formula for computing horizontal (time) point value:
-            # Xi= XZEro + XINcr * (i - 1)
-            #
-            # Formula for computing vertical (amplitude) point value:
-            # Yi= YZEro + (YMUlt * DataPoint_i)
-            # where:
-            # i is the index of a curve data point 1 based: first data point is point number 1
-            # Xi is the ith horizontal value in XUNits
-            # Yi is the ith vertical value in YUNits
-
-            """
-            Convert data from bitstream into voltage/current values
-            """
-
-        for n in range(0, len(data)):
-            # data[n] = (float(data[n]) * y_mu) + y_zero
-            data[n] = ((float(data[n]) - y_offset) * y_mu) + y_zero
-            waveform.append(data[n])
-            # x.append(x_zero + len(x) * x_incr)
-            x.append(len(x) * x_incr)
-        # self.ts.log('number of datapoints = ', len(waveform), i)
+        raw = np.asarray(data)
+        pos_clip, neg_clip, count = scope_analysis.clip_stats(raw)
+        if pos_clip:
+            self.ts.log_warning('Positive Clipping at ' + str(pos_clip) + ' of ' + str(count) +
+                                ' elements!!! Increase Channel Scale')
+        if neg_clip:
+            self.ts.log_warning('Negative Clipping at ' + str(neg_clip) + ' of ' + str(count) +
+                                ' elements!!! Reduce Channel Scale')
+
+        # Formula for computing horizontal (time) point value:
+        # Xi= XZEro + XINcr * (i - 1)
+        #
+        # Formula for computing vertical (amplitude) point value:
+        # Yi= YZEro + (YMUlt * DataPoint_i)
+        # where:
+        # i is the index of a curve data point 1 based: first data point is point number 1
+        # Xi is the ith horizontal value in XUNits
+        # Yi is the ith vertical value in YUNits
+
+        """
+        Convert data from bitstream into voltage/current values
+        """
+        waveform = scope_analysis.scale_curve(raw, y_offset, y_mu, y_zero)
+        x = np.arange(len(waveform)) * x_incr
 
         return x, waveform
 
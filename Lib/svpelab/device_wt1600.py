@@ -1,8 +1,8 @@
 import os
-import socket
 import sys
 import time
 from . import vxi11
+from . import scpi
 """
 data_query_str = (
 ':NUMERIC:FORMAT ASCII\n'
@@ -89,17 +89,6 @@ def pf_scan(points, pf_points):
             except ValueError:
                 pass
 
-def pf_adjust_sign(data, pf_idx, p_idx, q_idx):
-    """
-    Power factor sign is the opposite sign of the product of active power and reactive power
-    """
-    pq = data[p_idx] * data[q_idx]
-    # sign should be opposite of product of p and q
-    pf = abs(data[pf_idx])
-    if pq >= 0:
-        pf = pf * -1
-    return pf
-
 
 class DeviceError(Exception):
     """
@@ -123,9 +112,11 @@ class Device(object):
         self.ts = params.get('ts')
         self.data_points = ['TIME']
         self.pf_points = []
-        self.buffer_size=255
         self.config_array= []
-        self.b_expct=6
+        self.numeric_format = params.get('numeric_format')  # 'Binary' or 'ASCII' numeric data transfer
+        if self.numeric_format is None:
+            self.numeric_format = 'Binary'
+        self.value_struct = None
 
         # create query string for configured channels
         query_chan_str = ''
@@ -152,15 +143,17 @@ class Device(object):
                         self.data_points.append(point_str)
         #query_chan_str += '\n:NUMERIC:NORMAL:VALUE?'
         # self.query_str = ':NUMERIC:FORMAT ASCII\nNUMERIC:NORMAL:NUMBER %d\n' % (item) + query_chan_str
-        self.query_str = ':NUMERIC:NORMAL:VALUE?'
-        self.config_array.insert(0,':NUMERIC:FORMAT ASCII\nNUMERIC:NORMAL:NUMBER %d\n' % item)
+        if self.numeric_format == 'Binary':
+            self.query_str = ':NUMERIC:FORMAT FLOAT;:NUMERIC:NORMAL:VALUE?'
+            self.config_array.insert(0, ':NUMERIC:FORMAT FLOAT\nNUMERIC:NORMAL:NUMBER %d\n' % item)
+        else:
+            self.query_str = ':NUMERIC:NORMAL:VALUE?'
+            self.config_array.insert(0,':NUMERIC:FORMAT ASCII\nNUMERIC:NORMAL:NUMBER %d\n' % item)
         pf_scan(self.data_points, self.pf_points)
         if self.params.get('comm') == 'Network':
             # self.vx = vxi11.Instrument(self.params['ip_addr'])
-            self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            server_address = (self.ip_addr, self.ip_port)
-            self.conn.connect(server_address)
-            self.conn.settimeout(2.0)
+            self.conn = scpi.TCPTransport(self.ip_addr, self.ip_port, timeout=2.0)
+            self.conn.open()
               
             self.ts.log_debug('WT1600 is Connected')
 
@@ -169,21 +162,19 @@ class Device(object):
 
             # Read the WT1600 device asking for username
             resp = self._query(None)
-            self.ts.log_debug('WT1600 response: %s' % resp[4:len(resp)])
+            self.ts.log_debug('WT1600 response: %s' % resp)
 
             # Provide the username
             resp = self.query(self.username)  # Read the WT1600 device asking for password, but ignore response
-            self.ts.log_debug('WT1600 response: %s' % resp[4:len(resp)])
+            self.ts.log_debug('WT1600 response: %s' % resp)
 
             resp = self.query(self.password)  # Read the WT1600 device asking for password, but ignore response
-            self.ts.log_debug('WT1600 response: %s' % resp[4:len(resp)])  # Should print a password OK message
+            self.ts.log_debug('WT1600 response: %s' % resp)  # Should print a password OK message
 
-            self.b_expct = 4
             for n in range(1,24):
                 resp = self.query(self.config_array[n])  # Send channel configuration
-            self.b_expct = 6
             resp = self.query(':NUMERIC:NORMAL?')  # Read the WT1600 Channel configuration
-            self.ts.log_debug('WT1600 Channel Configuration: %s' % resp[4:len(resp)])  # Print Channel Configuration
+            self.ts.log_debug('WT1600 Channel Configuration: %s' % resp)  # Print Channel Configuration
 
         elif self.params.get('comm') == 'VISA':
             try:
@@ -205,36 +196,24 @@ class Device(object):
 
     def _cmd(self, cmd_str):
         """ low-level TCP/IP socket connection to WT1600 """
-        try:
-            if self.conn is None:
-                self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.conn.settimeout(self.timeout)
-                self.conn.connect((self.ip_addr, self.ip_port))
-            # print 'cmd> %s' % (cmd_str)
-
-            framesize = len(cmd_str)
-            frame = chr(0x80) + chr(0x00) + chr((framesize >> 8) & 0xFF) + chr(framesize & 0xFF) + cmd_str
-            self.conn.send(frame)
-
-        except Exception as e:
-            raise
+        data = scpi.to_bytes(cmd_str)
+        self.conn.write(scpi.WT_HEADER.pack(scpi.WT_LAST_BLOCK | len(data)) + data)
 
     def _query(self, cmd_str):
         """ low-level query to WT1600 """
-        resp = ''
-        more_data = True
-
         if cmd_str is not None:
             self._cmd(cmd_str)
-        b_recv = 0
-        b_expct = self.b_expct
-        while b_recv < b_expct:
-           # try:
-            data = self.conn.recv(self.buffer_size)
-            b_recv+= len(data)
-            #except Exception, e:
-             #   raise DeviceError('Timeout waiting for response')
-        return data
+
+        resp = bytearray()
+        try:
+            while True:
+                header, = scpi.WT_HEADER.unpack(self.conn.read_bytes(scpi.WT_HEADER.size))
+                resp += self.conn.read_bytes(header & ~scpi.WT_LAST_BLOCK)
+                if header & scpi.WT_LAST_BLOCK:
+                    break
+        except scpi.ScpiError as e:
+            raise DeviceError('Timeout waiting for response: %s' % str(e))
+        return resp.decode(scpi.SCPI_ENCODING)
 
     def cmd(self, cmd_str):
         if self.params['comm'] == 'Network':
@@ -286,15 +265,24 @@ class Device(object):
         self.capture(enable)
 
     def data_read(self):
-        q = self.query(self.query_str)
-        #q = self.query(self.query_str2)
-        m = q[4:len(q)]
-        # self.ts.log(m)
-        data = [float(i) for i in m.split(',')]
-        data.insert(0, time.time())
-        for p in self.pf_points:
-            data[p[0]] = pf_adjust_sign(data, *p)
-        return data
+        data = [time.time()]
+        if self.numeric_format == 'Binary':
+            try:
+                if self.params.get('comm') == 'Network':
+                    q = scpi.to_bytes(self._query(self.query_str))
+                else:
+                    self.conn.write(self.query_str)
+                    q = self.conn.read_raw()
+            except Exception as e:
+                raise DeviceError('WT1600 communication error: %s' % str(e))
+            values, self.value_struct = scpi.wt_float_values(q, self.value_struct)
+            data.extend(values)
+        else:
+            q = self.query(self.query_str)
+            #q = self.query(self.query_str2)
+            # self.ts.log(q)
+            data.extend([float(i) for i in q.split(',')])
+        return scpi.wt_pf_adjust_signs(data, self.pf_points)
 
     def capture(self, enable=None):
         """
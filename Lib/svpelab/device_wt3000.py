@@ -32,6 +32,7 @@ Questions can be directed to support@sunspec.org
 
 import time
 from . import vxi11
+from . import scpi
 
 '''
 data_query_str = (
@@ -92,17 +93,6 @@ def pf_scan(points, pf_points):
             except ValueError:
                 pass
 
-def pf_adjust_sign(data, pf_idx, p_idx, q_idx):
-    """
-    Power factor sign is the opposite sign of the product of active power and reactive power
-    """
-    pq = data[p_idx] * data[q_idx]
-    # sign should be opposite of product of p and q
-    pf = abs(data[pf_idx])
-    if pq >= 0:
-        pf = pf * -1
-    return pf
-
 
 class DeviceError(Exception):
     """
@@ -126,6 +116,9 @@ class Device(object):
         self.ts = params.get('ts')
         self.data_points = ['TIME']
         self.pf_points = []
+        self.numeric_format = params.get('numeric_format')  # 'Binary' or 'ASCII' numeric data transfer
+        if self.numeric_format is None:
+            self.numeric_format = 'Binary'
 
         # create query string for configured channels
         query_chan_str = ''
@@ -151,16 +144,16 @@ class Device(object):
                         self.data_points.append(point_str)
         query_chan_str += '\n:NUMERIC:NORMAL:VALUE?'
 
-        self.query_str = ':NUMERIC:FORMAT ASCII\nNUMERIC:NORMAL:NUMBER %d\n' % (item) + query_chan_str
+        numeric_format = 'FLOAT' if self.numeric_format == 'Binary' else 'ASCII'
+        self.query_str = ':NUMERIC:FORMAT %s\nNUMERIC:NORMAL:NUMBER %d\n' % (numeric_format, item) + query_chan_str
         # self.ts.log(self.query_str)    #  plot command string
         pf_scan(self.data_points, self.pf_points)
+        self.value_struct = None
 
         if self.params.get('comm') == 'Network':
             # self.vx = vxi11.Instrument(self.params['ip_addr'])
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            server_address = (self.ip_addr, self.ip_port)
-            self.sock.connect(server_address)
-            self.sock.settimeout(2.0)
+            self.conn = scpi.TCPTransport(self.ip_addr, self.ip_port, timeout=2.0)
+            self.conn.open()
 
             # Enter the username "anoymous" and password "".
             # If the WT3000 is not configured correctly, a connection cannot be made.
@@ -195,40 +188,24 @@ class Device(object):
 
     def _cmd(self, cmd_str):
         """ low-level TCP/IP socket connection to WT3000 """
-        try:
-            if self.conn is None:
-                self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.conn.settimeout(self.timeout)
-                self.conn.connect((self.ip_addr, self.ip_port))
-            # print 'cmd> %s' % (cmd_str)
-
-            framesize = len(cmd_str)
-            frame = chr(0x80) + chr(0x00) + chr((framesize >> 8) & 0xFF) + chr(framesize & 0xFF) + cmd_str
-            self.conn.send(frame)
-
-        except Exception as e:
-            raise
+        data = scpi.to_bytes(cmd_str)
+        self.conn.write(scpi.WT_HEADER.pack(scpi.WT_LAST_BLOCK | len(data)) + data)
 
     def _query(self, cmd_str):
         """ low-level query to WT3000 """
-        resp = ''
-        more_data = True
-
         if cmd_str is not None:
             self._cmd(cmd_str)
 
-        while more_data:
-            try:
-                data = self.conn.recv(self.buffer_size)
-                if len(data) > 0:
-                    for d in data:
-                        resp += d
-                        if d == '\r':
-                            more_data = False
-                            break
-            except Exception as e:
-                raise DeviceError('Timeout waiting for response')
-        return resp
+        resp = bytearray()
+        try:
+            while True:
+                header, = scpi.WT_HEADER.unpack(self.conn.read_bytes(scpi.WT_HEADER.size))
+                resp += self.conn.read_bytes(header & ~scpi.WT_LAST_BLOCK)
+                if header & scpi.WT_LAST_BLOCK:
+                    break
+        except scpi.ScpiError as e:
+            raise DeviceError('Timeout waiting for response: %s' % str(e))
+        return resp.decode(scpi.SCPI_ENCODING)
 
     def cmd(self, cmd_str):
         if self.params['comm'] == 'Network':
@@ -280,13 +257,36 @@ class Device(object):
     def data_capture(self, enable=True):
         self.capture(enable)
 
+    def data_read_raw(self):
+        """
+        Read the numeric values without parsing them. Returns (time, response), the response is the IEEE 488.2
+        block of big-endian 32 bit floats in Binary mode and the comma separated values string in ASCII mode.
+        """
+        if self.numeric_format != 'Binary':
+            q = self.query(self.query_str)
+        else:
+            try:
+                if self.params.get('comm') == 'Network':
+                    q = scpi.to_bytes(self._query(self.query_str))
+                else:
+                    self.conn.write(self.query_str)
+                    q = self.conn.read_raw()
+            except Exception as e:
+                raise DeviceError('WT3000 communication error: %s' % str(e))
+        return time.time(), q
+
+    def data_parse(self, raw):
+        t, q = raw
+        data = [t]
+        if self.numeric_format == 'Binary':
+            values, self.value_struct = scpi.wt_float_values(q, self.value_struct)
+            data.extend(values)
+        else:
+            data.extend([float(i) for i in q.split(',')])
+        return scpi.wt_pf_adjust_signs(data, self.pf_points)
+
     def data_read(self):
-        q = self.query(self.query_str)
-        data = [float(i) for i in q.split(',')]
-        data.insert(0, time.time())
-        for p in self.pf_points:
-            data[p[0]] = pf_adjust_sign(data, *p)
-        return data
+        return self.data_parse(self.data_read_raw())
 
     def capture(self, enable=None):
         """
@@ -5,12 +5,11 @@ All rights reserved.
 V1.0 - Jay Johnson - 7/31/2018
 """
 
-import sys
 import os
-import glob
-import importlib
 
-genset_modules = {}
+from . import plugins
+
+genset_modules = plugins.PluginModules()
 
 def params(info, id=None, label='Genset', group_name=None, active=None, active_value=None):
     if group_name is None:
@@ -138,30 +137,19 @@ class Genset(object):
 
 
 def genset_scan():
+    """
+    Scan for genset modules on import.
+
+    Finds all files in the current directory that match 'genset_*.py' and registers them in 'genset_modules',
+    keyed by the 'mode' value returned from 'genset_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used. Scan and module import errors
+    are raised as GensetError.
+    """
     global genset_modules
     # scan all files in current directory that match genset_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'genset_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'genset_info'):
-                info = m.genset_info()
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    genset_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            raise GensetError('Error scanning module %s: %s' % (module_name, str(e)))
+    plugins.plugin_scan(genset_modules, os.path.dirname(os.path.realpath(__file__)), 'genset_*.py', 'genset_info',
+                        package_name=package_name, error=GensetError, raise_errors=True)
 
 # scan for genset modules on import
 genset_scan()
@@ -30,10 +30,10 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 Questions can be directed to support@sunspec.org
 """
 
-import sys
 import os
-import glob
-import importlib
+import re
+
+from . import plugins
 
 # Import all gridsim extensions in current directory.
 # A gridsim extension has a file name of gridsim_*.py and contains a function gridsim_params(info) that contains
@@ -41,7 +41,7 @@ import importlib
 
 # dict of modules found, entries are: name : module_name
 
-gridsim_modules = {}
+gridsim_modules = plugins.PluginModules()
 
 
 def params(info, id=None, label='Grid Simulator', group_name=None, active=None, active_value=None):
@@ -99,6 +99,43 @@ RELAY_OPEN = 'open'
 RELAY_CLOSED = 'closed'
 RELAY_UNKNOWN = 'unknown'
 
+# per phase points returned by meas_all(), in measurement order, keys are '<point>_<phase>' plus 'AC_FREQ'
+MEAS_POINTS = ('AC_VRMS', 'AC_IRMS', 'AC_P', 'AC_S', 'AC_PF')
+MEAS_FLOAT = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+def meas_values(resp):
+    """
+    Extract the numeric values from a (compound) query response, e.g. '120.1;2.05;+2.46E-01'.
+    """
+    return [float(v) for v in MEAS_FLOAT.findall(resp)]
+
+
+def meas_record(values, ph_list=(1, 2, 3), scale=None):
+    """
+    Build a meas_all() record from values ordered phase by phase (the MEAS_POINTS for each phase in ph_list)
+    followed by the frequency.
+
+    :param values: list of measured values
+    :param ph_list: list of measured phases
+    :param scale: dict of point name to multiplier, e.g. {'AC_P': 1000.} for a simulator reporting kW
+    :return: dict of measurements keyed by point name
+    """
+    expected = len(MEAS_POINTS) * len(ph_list) + 1
+    if len(values) != expected:
+        raise GridSimError('Measurement response has %d values, expected %d' % (len(values), expected))
+    record = {}
+    k = 0
+    for ph in ph_list:
+        for name in MEAS_POINTS:
+            value = values[k]
+            if scale is not None and name in scale:
+                value *= scale[name]
+            record['%s_%d' % (name, ph)] = value
+            k += 1
+    record['AC_FREQ'] = values[k]
+    return record
+
 class GridSimError(Exception):
     """
     Exception to wrap all grid simulator generated exceptions.
@@ -138,6 +175,7 @@ class GridSim(object):
     - meas_voltage(ph_list=(1,2,3))                      : Measure RMS voltage on specified phases
     - meas_freq                                          : Measure frequency
     - meas_pf(ph_list=(1,2,3))                           : Measure power factors on specified phases    
+    - meas_all(ph_list=(1,2,3))                          : Measure all quantities on specified phases
     """
 
     def __init__(self, ts, group_name, params=None, support_interfaces=None):
@@ -409,41 +447,36 @@ class GridSim(object):
         """
         return None, None, None
 
+    def meas_all(self, ph_list=(1,2,3)):
+        """
+        Measure RMS voltage, current, active power, apparent power and power factor on each phase and the
+        frequency. Drivers that support it implement this as a single compound query of one acquisition, this
+        default combines the individual meas_*() methods.
+        :param ph_list: list of phases to be measured
+        :return: dict keyed by point name, e.g. 'AC_VRMS_1', 'AC_P_2', 'AC_FREQ'
+        """
+        meas = (self.meas_voltage(ph_list), self.meas_current(ph_list), self.meas_power(ph_list),
+                self.meas_va(ph_list), self.meas_pf(ph_list))
+        record = {}
+        for ph in ph_list:
+            for name, values in zip(MEAS_POINTS, meas):
+                record['%s_%d' % (name, ph)] = values[ph - 1]
+        record['AC_FREQ'] = self.meas_freq()
+        return record
+
 def gridsim_scan():
     """
-    Scan for grid simulator modules on import.
-    
-    This function scans all files in the current directory that match the pattern 'gridsim_*.py' and 
-    imports them. It then extracts the 'gridsim_info' function from each module and stores the module in the 
-    'gridsim_modules' dictionary, keyed by the 'mode' value returned from 'gridsim_info'.
-    
-    If a module does not have a 'gridsim_info' function, or if an exception occurs during the import, the module is 
-    removed from sys.modules to prevent further attempts to import it.
+    Scan for gridsim modules on import.
+
+    Finds all files in the current directory that match 'gridsim_*.py' and registers them in 'gridsim_modules',
+    keyed by the 'mode' value returned from 'gridsim_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used.
     """
     global gridsim_modules
     # scan all files in current directory that match gridsim_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'gridsim_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'gridsim_info'):
-                info = m.gridsim_info()
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    gridsim_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            print(GridSimError('Error scanning module %s: %s' % (module_name, str(e))))
+    plugins.plugin_scan(gridsim_modules, os.path.dirname(os.path.realpath(__file__)), 'gridsim_*.py', 'gridsim_info',
+                        package_name=package_name, error=GridSimError)
 
 # scan for gridsim modules on import
 gridsim_scan()
@@ -32,10 +32,9 @@ Questions can be directed to support@sunspec.org
 
 import os
 import time
-import socket
-import serial
 from . import grid_profiles
 from . import gridsim
+from . import scpi
 
 ametek_info = {
     'name': os.path.splitext(os.path.basename(__file__))[0],
@@ -116,6 +115,7 @@ class GridSim(gridsim.GridSim):
       
       query_tcp(cmd_str): Queries the simulator via TCP interface
       cmd(cmd_str): Sends a command using the configured interface
+      cmd_batch(cmd_list, checkpoints=None): Sends a sequence of commands with deferred error checking
       query(cmd_str): Queries using the configured interface
       info(): Returns information about the simulator
       config_phase_angles(config=False): Configures the voltage angles
@@ -139,6 +139,7 @@ class GridSim(gridsim.GridSim):
       meas_power(ph_list=(1, 2, 3)): Gets the measured power values
       meas_var(ph_list=(1, 2, 3)): Gets the measured VAR values
       meas_pf(ph_list=(1, 2, 3)): Gets the measured power factor values
+      meas_all(ph_list=(1, 2, 3)): Gets all measured values of one acquisition with a single query
       fetch_current(): Fetches the current values
       fetch_voltage(): Fetches the voltage values
       fetch_freq(): Fetches the frequency
@@ -169,8 +170,8 @@ class GridSim(gridsim.GridSim):
         self._query = None
         self.profile_name = ts.param_value('profile.profile_name')
 
+        self.open()  # open communications
         if self.comm == 'Serial':
-            self.open()  # open communications
             self._cmd = self.cmd_serial
             self._query = self.query_serial
         elif self.comm == 'TCP/IP':
@@ -205,7 +206,7 @@ class GridSim(gridsim.GridSim):
             if self.conn is None:
                 raise gridsim.GridSimError('Communications port not open')
 
-            self.conn.flushInput()
+            self.conn.clear()
             self.conn.write(cmd_str)
         except Exception as e:
              raise gridsim.GridSimError(str(e))
@@ -222,29 +223,11 @@ class GridSim(gridsim.GridSim):
         --------
         str: The response from the simulator.
         """
-        resp = ''
-        more_data = True
-
         self.cmd_serial(cmd_str)
-
-        while more_data:
-            try:
-                count = self.conn.inWaiting()
-                if count < 1:
-                    count = 1
-                data = self.conn.read(count)
-                if len(data) > 0:
-                    for d in data:
-                        resp += d
-                        if d == '\n':
-                            more_data = False
-                            break
-                else:
-                    raise gridsim.GridSimError('Timeout waiting for response')
-            except gridsim.GridSimError:
-                raise
-            except Exception as e:
-                raise gridsim.GridSimError('Timeout waiting for response - More data problem')
+        try:
+            resp = self.conn.read()
+        except scpi.ScpiError as e:
+            raise gridsim.GridSimError(str(e))
 
         return resp
 
@@ -262,33 +245,19 @@ class GridSim(gridsim.GridSim):
         """
         try:
             if self.conn is None:
-                self.ts.log('ipaddr = %s  ipport = %s' % (self.ipaddr, self.ipport))
-                self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.conn.settimeout(self.timeout)
-                self.conn.connect((self.ipaddr, self.ipport))
+                self.open()
 
             # print 'cmd> %s' % (cmd_str)
-            self.conn.send(cmd_str)
+            self.conn.write(cmd_str)
         except Exception as e:
             raise gridsim.GridSimError(str(e))
 
     def query_tcp(self, cmd_str):
-        resp = ''
-        more_data = True
-
         self._cmd(cmd_str)
-
-        while more_data:
-            try:
-                data = self.conn.recv(self.buffer_size)
-                if len(data) > 0:
-                    for d in data:
-                        resp += d
-                        if d == '\n': #\r
-                            more_data = False
-                            break
-            except Exception as e:
-                raise gridsim.GridSimError('Timeout waiting for response')
+        try:
+            resp = self.conn.read()
+        except scpi.ScpiError as e:
+            raise gridsim.GridSimError(str(e))
 
         return resp
 
@@ -304,6 +273,29 @@ class GridSim(gridsim.GridSim):
         except Exception as e:
             raise gridsim.GridSimError(str(e))
 
+    def cmd_batch(self, cmd_list, checkpoints=None):
+        """
+        Sends a sequence of commands in as few writes as possible. The error queue is checked once at the end of
+        the batch and after the commands at the checkpoint indices instead of after every command.
+
+        Parameters:
+        -----------
+        cmd_list (list): The command strings to be sent.
+        checkpoints (list): Indices of the commands after which the error queue is checked.
+
+        Returns:
+        --------
+        list: The responses to the queries in the batch.
+        """
+        try:
+            if self.conn is None:
+                self.open()
+            if self.comm == 'Serial':
+                self.conn.clear()
+            return scpi.batch(self.conn, cmd_list, checkpoints=checkpoints, error_query='SYSTem:ERRor?\n')
+        except Exception as e:
+            raise gridsim.GridSimError(str(e))
+
     def query(self, cmd_str):
         try:
             resp = self._query(cmd_str).strip()
@@ -328,37 +320,39 @@ class GridSim(gridsim.GridSim):
         The phase of each voltage waveform A,B and C.
         """
         if config:
+            cmd_list = []
             if self.phases_param == 1:
-                self.cmd('inst:coup none;:inst:nsel 1;:phas 0.0\n')
-                self.cmd('inst:coup none;:inst:nsel 1;:phas 0.0\n')
-                self.cmd('inst:coup none;:inst:nsel 2;:phas 180.0\n')
-                self.cmd('inst:coup none;:inst:nsel 2;:phas 180.0\n')
-                self.cmd('inst:coup none;:inst:nsel 1;:func sin\n')
-                self.cmd('inst:coup none;:inst:nsel 2;:func sin\n')
+                cmd_list.append('inst:coup none;:inst:nsel 1;:phas 0.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 1;:phas 0.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 2;:phas 180.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 2;:phas 180.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 1;:func sin\n')
+                cmd_list.append('inst:coup none;:inst:nsel 2;:func sin\n')
             elif self.phases_param == 3:
                 # set the phase angles for the 3 phases
-                self.cmd('inst:coup none;:inst:nsel 1;:phas 0.0\n')
-                self.cmd('inst:coup none;:inst:nsel 1;:phas 0.0\n')
-                self.cmd('inst:coup none;:inst:nsel 2;:phas 120.0\n')
-                self.cmd('inst:coup none;:inst:nsel 2;:phas 120.0\n')
-                self.cmd('inst:coup none;:inst:nsel 3;:phas 240.0\n')
-                self.cmd('inst:coup none;:inst:nsel 3;:phas 240.0\n')
-                self.cmd('inst:coup none;:inst:nsel 1;:func sin\n')
-                self.cmd('inst:coup none;:inst:nsel 2;:func sin\n')
-                self.cmd('inst:coup none;:inst:nsel 3;:func sin\n')
+                cmd_list.append('inst:coup none;:inst:nsel 1;:phas 0.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 1;:phas 0.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 2;:phas 120.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 2;:phas 120.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 3;:phas 240.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 3;:phas 240.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 1;:func sin\n')
+                cmd_list.append('inst:coup none;:inst:nsel 2;:func sin\n')
+                cmd_list.append('inst:coup none;:inst:nsel 3;:func sin\n')
             elif self.phases_param == 2:
                 # set the phase angles for the 2 phases
-                self.cmd('inst:coup none;:inst:nsel 1;:phas 0.0\n')
-                self.cmd('inst:coup none;:inst:nsel 1;:phas 0.0\n')
-                self.cmd('inst:coup none;:inst:nsel 2;:phas 180.0\n')
-                self.cmd('inst:coup none;:inst:nsel 2;:phas 180.0\n')
-                self.cmd('inst:coup none;:inst:nsel 3;:phas 0.0\n')
-                self.cmd('inst:coup none;:inst:nsel 3;:phas 0.0\n')
-                self.cmd('inst:coup none;:inst:nsel 1;:func sin\n')
-                self.cmd('inst:coup none;:inst:nsel 2;:func sin\n')
-                self.cmd('inst:coup none;:inst:nsel 3;:func sin\n')
+                cmd_list.append('inst:coup none;:inst:nsel 1;:phas 0.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 1;:phas 0.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 2;:phas 180.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 2;:phas 180.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 3;:phas 0.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 3;:phas 0.0\n')
+                cmd_list.append('inst:coup none;:inst:nsel 1;:func sin\n')
+                cmd_list.append('inst:coup none;:inst:nsel 2;:func sin\n')
+                cmd_list.append('inst:coup none;:inst:nsel 3;:func sin\n')
             else:
                 raise gridsim.GridSimError('Unsupported phase parameter: %s' % (self.phases_param))
+            self.cmd_batch(cmd_list)
 
         ph1 = float(self.query('inst:coup none;:inst:nsel 1;:phas?\n'))
         ph2 = float(self.query('inst:coup none;:inst:nsel 2;:phas?\n'))
@@ -447,9 +441,15 @@ class GridSim(gridsim.GridSim):
         Open the communications resources associated with the grid simulator.
         """
         try:
-            self.conn = serial.Serial(port=self.serial_port, baudrate=self.baudrate, bytesize=8, stopbits=1, xonxoff=0,
-                                      timeout=self.timeout, writeTimeout=self.write_timeout)
-            time.sleep(2)
+            if self.comm == 'Serial':
+                self.conn = scpi.SerialTransport(self.serial_port, baudrate=self.baudrate,
+                                                 write_timeout=self.write_timeout, settle_time=2, timeout=self.timeout,
+                                                 buffer_size=self.buffer_size)
+            elif self.comm == 'TCP/IP':
+                self.ts.log('ipaddr = %s  ipport = %s' % (self.ipaddr, self.ipport))
+                self.conn = scpi.TCPTransport(self.ipaddr, self.ipport, timeout=self.timeout,
+                                              buffer_size=self.buffer_size)
+            self.conn.open()
         except Exception as e:
             raise gridsim.GridSimError(str(e))
 
@@ -604,8 +604,8 @@ class GridSim(gridsim.GridSim):
         Start the loaded profile.
         """
         if self.profile is not None:
-            for entry in self.profile:
-                self.cmd(entry)
+            # check the error queue once the list is loaded, before the trigger source and init commands
+            self.cmd_batch(self.profile, checkpoints=[len(self.profile) - 3])
 
     def profile_stop(self):
         """
@@ -817,6 +817,20 @@ class GridSim(gridsim.GridSim):
             pf3 = None
         return pf1, pf2, pf3
 
+    def meas_all(self, ph_list=(1, 2, 3)):
+        """
+        Measures voltage, current, power, apparent power and power factor on each phase and the frequency with one
+        compound query. The first query triggers a new acquisition and the others fetch from it, so all values
+        are from the same acquisition.
+        """
+        query_str = 'inst:coup none'
+        for ph in ph_list:
+            query_str += ';:inst:nsel %d;:fetc:volt:ac?;:fetc:curr:ac?;:fetc:pow:ac?;:fetc:pow:ac:app?;' \
+                         ':fetc:pow:pfac?' % ph
+        query_str = query_str.replace(':fetc:volt:ac?', ':meas:volt:ac?', 1) + ';:fetc:freq?\n'
+        values = gridsim.meas_values(self.query(query_str))
+        return gridsim.meas_record(values, ph_list, scale={'AC_P': 1000., 'AC_S': 1000.})  # kW, kVA to W, VA
+
     def fetch_current(self):
         self.cmd('inst:coup none;:inst:nsel 1\n')
         i1 = self.query('fetc:curr:ac?\n')
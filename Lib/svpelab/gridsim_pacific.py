@@ -32,14 +32,11 @@ Questions can be directed to support@sunspec.org
 
 import os
 import time
-import socket
 import re
 
-import serial
-import pyvisa as visa
-
 from . import grid_profiles
 from . import gridsim
+from . import scpi
 
 pacific_info = {
     'name': os.path.splitext(os.path.basename(__file__))[0],
@@ -286,35 +283,17 @@ class GridSim(gridsim.GridSim):
             if self.conn is None:
                 raise gridsim.GridSimError('Communications port not open')
 
-            self.conn.flushInput()
+            self.conn.clear()
             self.conn.write(cmd_str)
         except Exception as e:
              raise gridsim.GridSimError(str(e))
 
     def query_serial(self, cmd_str):
-        resp = ''
-        more_data = True
-
         self.cmd_serial(cmd_str)
-
-        while more_data:
-            try:
-                count = self.conn.inWaiting()
-                if count < 1:
-                    count = 1
-                data = self.conn.read(count)
-                if len(data) > 0:
-                    for d in data:
-                        resp += d
-                        if d == '\n':
-                            more_data = False
-                            break
-                else:
-                    raise gridsim.GridSimError('Timeout waiting for response')
-            except gridsim.GridSimError:
-                raise
-            except Exception as e:
-                raise gridsim.GridSimError('Timeout waiting for response - More data problem')
+        try:
+            resp = self.conn.read()
+        except scpi.ScpiError as e:
+            raise gridsim.GridSimError(str(e))
 
         return resp
 
@@ -322,33 +301,21 @@ class GridSim(gridsim.GridSim):
         try:
             if self.conn is None:
                 self.ts.log('ipaddr = %s  ipport = %s' % (self.ipaddr, self.ipport))
-                self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.conn.settimeout(self.timeout)
-                self.conn.connect((self.ipaddr, self.ipport))
+                self.conn = scpi.TCPTransport(self.ipaddr, self.ipport, timeout=self.timeout,
+                                              buffer_size=self.buffer_size)
 
             # print 'cmd> %s' % (cmd_str)
-            self.conn.send(cmd_str)
+            self.conn.write(cmd_str)
             self.ts.sleep(1)
         except Exception as e:
             raise gridsim.GridSimError(str(e))
 
     def query_tcp(self, cmd_str):
-        resp = ''
-        more_data = True
-
         self._cmd(cmd_str)
-
-        while more_data:
-            try:
-                data = self.conn.recv(self.buffer_size)
-                if len(data) > 0:
-                    for d in data:
-                        resp += d
-                        if d == '\n': #\r
-                            more_data = False
-                            break
-            except Exception as e:
-                raise gridsim.GridSimError('Timeout waiting for response')
+        try:
+            resp = self.conn.read()
+        except scpi.ScpiError as e:
+            raise gridsim.GridSimError(str(e))
 
         return resp
 
@@ -356,13 +323,14 @@ class GridSim(gridsim.GridSim):
         try:
             if self.conn is None:
                 self.ts.log('remote_ipaddr = %s  gpib_addr = %s' % (self.remote_ipaddr, self.gpib_addr))
-                rm = visa.ResourceManager('@py')
                 rsc = "TCPIP::" + str(self.remote_ipaddr) + "::gpib0," + str(self.gpib_addr) + "::INSTR"
-                self.conn = rm.open_resource(str(rsc))						
+                self.conn = scpi.VISATransport(rsc, backend='@py', timeout=self.timeout,
+                                               buffer_size=self.buffer_size)
+                self.conn.open()
                 print(("Success when opening remote GPIB resource " +  str(rsc)))
-                self.conn.write('*IDN?')
-                time.sleep(2)	
-                self.conn.read()                            							
+                self.conn.write('*IDN?\n')
+                time.sleep(2)
+                self.conn.read()
             # print 'cmd> %s' % (cmd_str)
             self.conn.write(cmd_str)
             self.ts.sleep(1)
@@ -370,24 +338,13 @@ class GridSim(gridsim.GridSim):
             raise gridsim.GridSimError(str(e))
 
     def query_remote_tcp(self, cmd_str):
-        resp = ''
-        more_data = True
-
         self._cmd(cmd_str)
+        try:
+            resp = self.conn.read()
+        except scpi.ScpiError as e:
+            raise gridsim.GridSimError(str(e))
 
-        while more_data:
-            try:
-                data = self.conn.read()
-                if len(data) > 0:
-                    for d in data:
-                        resp += d
-                        if d == '\n': #\r
-                            more_data = False
-                            break
-            except Exception as e:
-                raise gridsim.GridSimError('Timeout waiting for response')
-
-        return resp		
+        return resp
 
     def cmd(self, cmd_str):
         self.cmd_str = cmd_str
@@ -452,9 +409,9 @@ class GridSim(gridsim.GridSim):
         Open the communications resources associated with the grid simulator.
         """
         try:
-            self.conn = serial.Serial(port=self.serial_port, baudrate=self.baudrate, bytesize=8, stopbits=1, xonxoff=0,
-                                      timeout=self.timeout, writeTimeout=self.write_timeout)
-            time.sleep(2)
+            self.conn = scpi.SerialTransport(self.serial_port, baudrate=self.baudrate, write_timeout=self.write_timeout,
+                                             settle_time=2, timeout=self.timeout, buffer_size=self.buffer_size)
+            self.conn.open()
         except Exception as e:
             raise gridsim.GridSimError(str(e))
 		
@@ -789,6 +746,16 @@ class GridSim(gridsim.GridSim):
             self.cmd(':SOUR:FREQ:LIM:MIN %0.0f\n' % freq)
         return self.query(':SOUR:FREQ:LIM:MIN?\n')
 
+    def meas_all(self, ph_list=(1, 2, 3)):
+        """
+        Measure voltage, current, power, apparent power and power factor on each phase and the frequency with one
+        compound query.
+        """
+        query_str = ':MEASure:' + ';'.join(['VOLTage%d?;CURRent%d?;POWer%d?;VA%d?;PF%d?' % ((ph,) * 5)
+                                            for ph in ph_list]) + ';FREQuency?\n'
+        values = gridsim.meas_values(self.query(query_str))
+        return gridsim.meas_record(values, ph_list)
+
 if __name__ == "__main__":
     pass
 
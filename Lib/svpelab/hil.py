@@ -29,10 +29,9 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 Questions can be directed to support@sunspec.org
 """
-import sys
 import os
-import glob
-import importlib
+
+from . import plugins
 
 
 class HILGenericException(Exception):
@@ -60,7 +59,7 @@ class HILSimulationException(Exception):
 
 # dict of modules found, entries are: name : module_name
 
-hil_modules = {}
+hil_modules = plugins.PluginModules()
 
 HIL_DEFAULT_ID = 'hil'
 
@@ -222,40 +221,17 @@ class HIL(object):
 
 def hil_scan():
     """
-    Scans for HIL (Hardware-in-the-Loop) modules in the current directory and imports them.
-
-    This function searches for all Python files in the current directory that match the pattern 'hil_*.py', imports them, 
-    and extracts the 'hil_info' function from each module. The 'hil_info' function is expected to return a dictionary containing 
-    information about the HIL module, including the 'mode' key which is used to store the module in the global 'hil_modules' dictionary.
+    Scan for hil modules on import.
 
-    If a module is successfully imported and has a 'hil_info' function, the module is added to the 'hil_modules' dictionary using the 
-    'mode' value as the key. If a module fails to import or does not have a 'hil_info' function, the module is removed from the 'sys.modules' 
-    dictionary to prevent further attempts to import it.
+    Finds all files in the current directory that match 'hil_*.py' and registers them in 'hil_modules',
+    keyed by the 'mode' value returned from 'hil_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used.
     """
     global hil_modules
     # scan all files in current directory that match hil_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'hil_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'hil_info'):
-                info = m.hil_info()
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    hil_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            print(HILError('Error scanning module %s: %s' % (module_name, str(e))))
+    plugins.plugin_scan(hil_modules, os.path.dirname(os.path.realpath(__file__)), 'hil_*.py', 'hil_info',
+                        package_name=package_name, error=HILError)
 
 
 # scan for hil modules on import
@@ -30,12 +30,11 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 Questions can be directed to support@sunspec.org
 """
 
-import sys
 import os
-import glob
-import importlib
 
-loadsim_modules = {}
+from . import plugins
+
+loadsim_modules = plugins.PluginModules()
 
 def params(info, id=None, label='Load Simulator', group_name=None, active=None, active_value=None):
     if group_name is None:
@@ -191,41 +190,17 @@ class LoadSim(object):
 def loadsim_scan():
     """
     Scan for loadsim modules on import.
-    
-    This function scans all files in the current directory that match the pattern 'loadsim_*.py' and imports any modules that have a 
-    'loadsim_info' function. The 'loadsim_info' function is expected to return a dictionary with a 'mode' key, which is used to store 
-    the module in the 'loadsim_modules' global dictionary.
-    
-    If a module is successfully imported, its 'loadsim_info' function is called and the returned dictionary is used to store 
-    the module in the 'loadsim_modules' global dictionary. If the 'loadsim_info' function is not present or does not return a 
-    'mode' key, the module is not stored.
-    
-    If an exception occurs during the import or scanning process, the module is removed from 'sys.modules' to prevent any further issues.
+
+    Finds all files in the current directory that match 'loadsim_*.py' and registers them in 'loadsim_modules',
+    keyed by the 'mode' value returned from 'loadsim_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used. Scan and module import errors
+    are raised as LoadSimError.
     """
     global loadsim_modules
     # scan all files in current directory that match loadsim_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'loadsim_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'loadsim_info'):
-                info = m.loadsim_info()
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    loadsim_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            raise LoadSimError('Error scanning module %s: %s' % (module_name, str(e)))
+    plugins.plugin_scan(loadsim_modules, os.path.dirname(os.path.realpath(__file__)), 'loadsim_*.py', 'loadsim_info',
+                        package_name=package_name, error=LoadSimError, raise_errors=True)
 
 # scan for loadsim modules on import
 loadsim_scan()
@@ -1,8 +1,7 @@
 
-import sys
 import os
-import glob
-import importlib
+
+from . import plugins
 
 
 '''
@@ -11,7 +10,7 @@ The network module is designed to capture network traffic
 Initial design - 8/10/22 - jayatsandia
 '''
 
-NET_modules = {}
+NET_modules = plugins.PluginModules()
 
 def params(info, id=None, label='Network Capture System', group_name=None, active=None, active_value=None):
     if group_name is None:
@@ -150,39 +149,17 @@ class NET(object):
 
 def net_scan():
     """
-    Scans for NET modules in the current directory and imports them.
-    
-    The `net_scan()` function scans all files in the current directory that match the pattern `net_*.py`, imports the corresponding 
-    modules, and adds them to the `NET_modules` dictionary, keyed by the 'mode' value from the `net_info()` function of the module.
-    
-    If a module does not have a `net_info()` function, or if an exception occurs during the import, the module is removed from 
-    `sys.modules` to prevent further attempts to import it.
+    Scan for net modules on import.
+
+    Finds all files in the current directory that match 'net_*.py' and registers them in 'NET_modules',
+    keyed by the 'mode' value returned from 'net_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used.
     """
     global NET_modules
     # scan all files in current directory that match net_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'net_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            # print(module_name)
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'net_info'):
-                info = m.net_info()
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    NET_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            print(NETError('Error scanning module %s: %s' % (module_name, str(e))))
+    plugins.plugin_scan(NET_modules, os.path.dirname(os.path.realpath(__file__)), 'net_*.py', 'net_info',
+                        package_name=package_name, error=NETError)
 
 # scan for NET modules on import
 net_scan()
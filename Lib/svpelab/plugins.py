@@ -0,0 +1,244 @@
+"""
+Copyright (c) 2017, Sandia National Labs and SunSpec Alliance
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of the Sandia National Labs and SunSpec Alliance nor the names of its
+contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Questions can be directed to support@sunspec.org
+"""
+
+import ast
+import glob
+import importlib
+import json
+import os
+import sys
+
+'''
+Device module discovery for the SVP abstraction layers (das, gridsim, pvsim, der, ...).
+
+Each abstraction layer finds its device modules by file name pattern (das_*.py, gridsim_*.py, ...) and keys them
+by the 'mode' entry returned by the module info function (das_info(), gridsim_info(), ...). Importing every device
+module to read its mode pulls in all of the instrument/vendor packages, so the mode is instead read statically from
+the module source and recorded in a manifest cached in __pycache__. A manifest entry is reused until the module
+file modification time or size changes. Modules are only imported when their mode is used, either by *_init()
+selecting the mode or by params() building the parameters of all modes.
+
+A module whose mode can not be determined statically is imported during the scan, as before.
+'''
+
+MANIFEST_NAME = 'svpelab_plugins.json'
+
+
+class PluginModules(dict):
+    """
+    Dict of mode name to device module that imports each module on first access.
+
+    get(), [] and 'in' only import the requested module. Iterating over the dict (items(), values(), ...) imports all
+    remaining modules. Modules that fail to import are reported and left out, as they were when all modules were
+    imported by the scan, or raised as error when raise_errors is set. modes() returns all mode names without
+    importing anything.
+    """
+
+    def __init__(self, error=Exception, raise_errors=False):
+        dict.__init__(self)
+        self._pending = {}
+        self.error = error
+        self.raise_errors = raise_errors
+
+    def add(self, mode, module_name):
+        """
+        Register a module to be imported when the mode is first used.
+        """
+        if not dict.__contains__(self, mode):
+            self._pending[mode] = module_name
+
+    def _load(self, mode):
+        module_name = self._pending.pop(mode, None)
+        if module_name is not None:
+            try:
+                dict.__setitem__(self, mode, importlib.import_module(module_name))
+            except Exception as e:
+                if module_name in sys.modules:
+                    del sys.modules[module_name]
+                if self.raise_errors:
+                    raise self.error('Error scanning module %s: %s' % (module_name, str(e)))
+                print(self.error('Error scanning module %s: %s' % (module_name, str(e))))
+
+    def _load_all(self):
+        for mode in list(self._pending.keys()):
+            self._load(mode)
+
+    def modes(self):
+        return list(dict.keys(self)) + list(self._pending.keys())
+
+    def get(self, mode, default=None):
+        self._load(mode)
+        return dict.get(self, mode, default)
+
+    def __getitem__(self, mode):
+        self._load(mode)
+        return dict.__getitem__(self, mode)
+
+    def __contains__(self, mode):
+        return dict.__contains__(self, mode) or mode in self._pending
+
+    def __iter__(self):
+        self._load_all()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._load_all()
+        return dict.__len__(self)
+
+    def keys(self):
+        self._load_all()
+        return dict.keys(self)
+
+    def values(self):
+        self._load_all()
+        return dict.values(self)
+
+    def items(self):
+        self._load_all()
+        return dict.items(self)
+
+
+def _manifest_path(path):
+    return os.path.join(path, '__pycache__', MANIFEST_NAME)
+
+
+def _manifest_load(path):
+    try:
+        with open(_manifest_path(path), 'r') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _manifest_save(path, manifest):
+    filename = _manifest_path(path)
+    try:
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        tmp = '%s.%s.tmp' % (filename, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, filename)
+    except Exception:
+        # the manifest is only a cache
+        pass
+
+
+def static_mode(filename, info_func):
+    """
+    Read the mode of a device module from its source without importing it.
+
+    Handles info functions returning a dict literal or a module level dict, for example:
+
+        wt3000_info = {'name': ..., 'mode': 'Yokogawa WT3000'}
+
+        def das_info():
+            return wt3000_info
+
+    :return: tuple (found, mode). found is False if the module has no info function. mode is None if the info
+             function was found but the mode could not be determined statically.
+    """
+    with open(filename, 'rb') as f:
+        tree = ast.parse(f.read(), filename=filename)
+    dicts = {}
+    func = None
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Dict):
+            for t in node.targets:
+                if isinstance(t, ast.Name):
+                    dicts[t.id] = node.value
+        elif isinstance(node, ast.FunctionDef) and node.name == info_func:
+            func = node
+    if func is None:
+        return False, None
+    returns = [n for n in ast.walk(func) if isinstance(n, ast.Return)]
+    if len(returns) != 1:
+        return True, None
+    value = returns[0].value
+    if isinstance(value, ast.Name):
+        value = dicts.get(value.id)
+    if not isinstance(value, ast.Dict):
+        return True, None
+    for k, v in zip(value.keys, value.values):
+        if isinstance(k, ast.Constant) and k.value == 'mode':
+            if isinstance(v, ast.Constant) and isinstance(v.value, str):
+                return True, v.value
+    return True, None
+
+
+def plugin_scan(modules, path, pattern, info_func, package_name=None, error=Exception, raise_errors=False):
+    """
+    Find the device modules matching pattern in path and register them by mode in modules (PluginModules).
+
+    :param modules: PluginModules to register the modules in
+    :param path: directory of the device modules
+    :param pattern: file name pattern of the device modules ('das_*.py')
+    :param info_func: name of the module info function ('das_info')
+    :param package_name: package containing the modules
+    :param error: exception class used to report scan errors
+    :param raise_errors: raise scan and module import errors as error instead of printing them
+    """
+    modules.error = error
+    modules.raise_errors = raise_errors
+    manifest = _manifest_load(path)
+    updated = False
+    for f in sorted(glob.glob(os.path.join(path, pattern))):
+        base = os.path.basename(f)
+        module_name = os.path.splitext(base)[0]
+        if package_name:
+            module_name = package_name + '.' + module_name
+        try:
+            st = os.stat(f)
+            entry = manifest.get(base)
+            if entry is None or entry.get('mtime') != st.st_mtime or entry.get('size') != st.st_size:
+                found, mode = static_mode(f, info_func)
+                if found and mode is None:
+                    # info function too dynamic to read statically, import the module to get the mode
+                    m = importlib.import_module(module_name)
+                    mode = getattr(m, info_func)().get('mode')
+                    if mode is not None:
+                        dict.__setitem__(modules, mode, m)
+                entry = {'mtime': st.st_mtime, 'size': st.st_size, 'mode': mode}
+                manifest[base] = entry
+                updated = True
+            if entry.get('mode') is not None:
+                modules.add(entry.get('mode'), module_name)
+        except Exception as e:
+            if module_name in sys.modules:
+                del sys.modules[module_name]
+            if raise_errors:
+                if updated:
+                    _manifest_save(path, manifest)
+                raise error('Error scanning module %s: %s' % (module_name, str(e)))
+            print(error('Error scanning module %s: %s' % (module_name, str(e))))
+    if updated:
+        _manifest_save(path, manifest)
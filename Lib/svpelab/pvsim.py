@@ -30,12 +30,11 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 Questions can be directed to support@sunspec.org
 """
 
-import sys
 import os
-import glob
-import importlib
 
-pvsim_modules = {}
+from . import plugins
+
+pvsim_modules = plugins.PluginModules()
 
 def params(info, id=None, label='PV Simulator', group_name=None, active=None, active_value=None):
     """
@@ -196,38 +195,17 @@ class PVSim(object):
 
 def pvsim_scan():
     """
-    Scans for PV simulator modules in the current directory and imports them into the `pvsim_modules` global dictionary.
-    
-    This function is used to automatically discover and load PV simulator modules that follow the naming convention `pvsim_*.py`. 
-    Each discovered module should have a `pvsim_info()` function that returns a dictionary with a `'mode'` key, which is used to 
-    associate the module with a specific PV simulator mode.
-    
-    The discovered modules are stored in the `pvsim_modules` global dictionary, keyed by their `'mode'` value.
+    Scan for pvsim modules on import.
+
+    Finds all files in the current directory that match 'pvsim_*.py' and registers them in 'pvsim_modules',
+    keyed by the 'mode' value returned from 'pvsim_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used.
     """
     global pvsim_modules
-    # scan all files in current directory that match gridsim_*.py
+    # scan all files in current directory that match pvsim_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'pvsim_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'pvsim_info'):
-                info = m.pvsim_info()
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    pvsim_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            print(PVSimError('Error scanning module %s: %s' % (module_name, str(e))))
+    plugins.plugin_scan(pvsim_modules, os.path.dirname(os.path.realpath(__file__)), 'pvsim_*.py', 'pvsim_info',
+                        package_name=package_name, error=PVSimError)
 
 # scan for gridsim modules on import
 pvsim_scan()
@@ -1,6 +1,9 @@
 import os
 import xml.etree.ElementTree as ET
+import collections
+import concurrent.futures
 import csv
+import json
 import math
 import xlsxwriter
 
@@ -52,28 +55,213 @@ XL_COL_WIDTH_DEFAULT = 10
 def xl_col(index):
     return chr(index + 65)
 
+RESULT_INDEX_EXT = '.idx'
+
+# csv files parsed ahead of the workbook writer per worker process
+CSV_SHEETS_AHEAD = 2
+
+# result file name -> (mtime, size, result dict, path index) of the result trees loaded in this process, the path
+# index (see result_paths()) is built on the first lookup
+result_trees = {}
+
+
+def _file_stamp(filename):
+    st = os.stat(filename)
+    return st.st_mtime_ns, st.st_size
+
+
+def write_result_index(filename, result):
+    """
+    Save a result tree next to its .rlt file (filename + RESULT_INDEX_EXT) so it can be reloaded without parsing the
+    XML. The index is stamped with the .rlt modification time and size and is ignored once the .rlt changes.
+    """
+    try:
+        mtime, size = _file_stamp(filename)
+        tmp = filename + RESULT_INDEX_EXT + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'mtime': mtime, 'size': size, 'result': result.to_dict()}, f)
+        os.replace(tmp, filename + RESULT_INDEX_EXT)
+    except Exception as e:
+        print('write_result_index error: %s' % (str(e)))
+
+
+def result_paths(tree):
+    """
+    Flatten a result tree dict (see Result.to_dict()) into a dict of name path tuple -> (position in the parent
+    results, result dict). As in Result.find(), only the last child with a given name is indexed, along with its
+    descendants.
+    """
+    paths = {}
+    pending = [((), tree)]
+    while pending:
+        prefix, node = pending.pop()
+        last = {}
+        for i, child in enumerate(node.get('results', [])):
+            last[child.get('name')] = (i, child)
+        for name, entry in last.items():
+            path = prefix + (name,)
+            paths[path] = entry
+            pending.append((path, entry[1]))
+    return paths
+
+
+def _result_entry(filename):
+    """
+    Return the cache entry of a .rlt file, reloading it from the saved index or the XML when the file has changed.
+    """
+    stamp = _file_stamp(filename)
+    cached = result_trees.get(filename)
+    if cached is None or tuple(cached[:2]) != stamp:
+        cached = None
+        try:
+            with open(filename + RESULT_INDEX_EXT) as f:
+                index = json.load(f)
+            if (index.get('mtime'), index.get('size')) == stamp:
+                cached = [stamp[0], stamp[1], index['result'], None]
+        except Exception:
+            cached = None
+        if cached is None:
+            r = Result()
+            r.from_xml(filename=filename)
+            write_result_index(filename, r)
+            cached = [stamp[0], stamp[1], r.to_dict(), None]
+        result_trees[filename] = cached
+    return cached
+
+
+def load_result(filename):
+    """
+    Return the result tree of a .rlt file.
+
+    The tree is built from the in-process cache or the saved index (see write_result_index()) when their
+    modification stamp matches the file, otherwise the XML is parsed and the index is rewritten. Each call returns a
+    new tree that the caller is free to modify.
+    """
+    r = Result()
+    r.from_dict(_result_entry(filename)[2], result_path=os.path.split(filename)[0])
+    return r
+
+
 def find_result(results_dir, result_dir, ts=None):
-    r_target = None
+    """
+    Return the result at result_dir in the result tree of results_dir, or None if there is none.
+
+    The result is looked up in the cached path index of the tree (see result_paths()) and only the matching subtree
+    is built, as a new tree the caller is free to modify.
+    """
     rlt_name = os.path.split(results_dir)[1]
     rlt_file = os.path.join(results_dir, rlt_name) + '.rlt'
     path = os.path.normpath(result_dir)
     path = path.split(os.sep)
+    entry = _result_entry(rlt_file)
+    if entry[3] is None:
+        entry[3] = result_paths(entry[2])
+    paths = entry[3]
+    prefix = ()
+    node = None
+    for name in path:
+        # the later of the children named name or name with '__' as '/' is followed, as in Result.find()
+        match = max(paths.get(prefix + (name,), (-1, None)), paths.get(prefix + (name.replace('__', '/'),), (-1, None)),
+                    key=lambda e: e[0])
+        if match[1] is None:
+            return None
+        prefix += (match[1].get('name'),)
+        node = match[1]
+    if node is None:
+        return None
     r = Result()
-    r.from_xml(filename=rlt_file)
-    r_target = r.find(path, ts)
-    return r_target
+    r.from_dict(node, result_path=os.path.split(rlt_file)[0])
+    return r
 
-def result_workbook(file, results_dir, result_dir, index=True, ts=None):
+def result_workbook(file, results_dir, result_dir, index=True, ts=None, processes=None):
 
     r = find_result(results_dir, result_dir, ts)
 
     if r is not None:
         r.to_xlsx(filename=os.path.join(results_dir, result_dir, file), results_dir=results_dir, index=index,
-                  index_row=0, ts=ts)
+                  index_row=0, ts=ts, processes=processes)
     else:
         raise ResultError('Error creating summary workbook - resource not found: %s %s' % (results_dir, result_dir))
 
 
+def _sheet_text(value):
+    """
+    Return the worksheet cell of a non-numeric csv field, numeric text (nan, inf) is written as an empty cell.
+    """
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return value
+    return ''
+
+
+def csv_sheet(filename, relative_value_names=None):
+    """
+    Parse a result csv file into worksheet data.
+
+    The file is read by the pandas based dataset reader, column widths are computed once per column and relative
+    value columns are offset by their first value.
+
+    :param filename: csv file name
+    :param relative_value_names: names of the columns to be written relative to their first value
+
+    :return: dict with 'names' (header row), 'columns' (list of cell value lists), 'widths' (column widths) and
+             'count' (number of rows including the header)
+    """
+    import numpy as np
+    from . import dataset
+
+    try:
+        names, cols = dataset.read_csv(filename)
+    except dataset.DatasetError as e:
+        raise ResultError(str(e))
+    columns = []
+    widths = []
+    for name, col in zip(names, cols):
+        values = col.values
+        width = max([len(s) for s in col.strings()] + [len(name)]) + 4
+        widths.append(max(width, XL_COL_WIDTH_DEFAULT))
+        if relative_value_names and name in relative_value_names and len(col) > 0 and not col.mask[0]:
+            values = values - values[0]
+        cells = values.tolist()
+        for i in np.flatnonzero(col.mask | np.isinf(values)).tolist():
+            cells[i] = _sheet_text(col[i]) if col.mask[i] else ''
+        columns.append(cells)
+    return {'names': list(names), 'columns': columns, 'widths': widths,
+            'count': (len(cols[0]) if cols else 0) + 1}
+
+
+def csv_sheets(filenames, relative_value_names=None, processes=None):
+    """
+    Parse several result csv files (see csv_sheet()) in parallel worker processes.
+
+    The parsed sheets are yielded in file order as (file name, worksheet data) and only a few files per worker are
+    parsed ahead of the consumer, so the whole result tree is never held in memory at once. The worksheet data is
+    None for files that could not be parsed.
+    """
+    if not filenames:
+        return
+    files = iter(filenames)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = collections.deque()
+        for f in files:
+            pending.append((f, pool.submit(csv_sheet, f, relative_value_names)))
+            if len(pending) >= CSV_SHEETS_AHEAD*(processes or os.cpu_count() or 1):
+                break
+        while pending:
+            f, future = pending.popleft()
+            for f_next in files:
+                pending.append((f_next, pool.submit(csv_sheet, f_next, relative_value_names)))
+                break
+            try:
+                sheet = future.result()
+            except Exception as e:
+                print('csv_sheets error: %s %s' % (f, str(e)))
+                sheet = None
+            future = None
+            yield f, sheet
+
+
 class ResultError(Exception):
     pass
 
@@ -95,19 +283,34 @@ class Result(object):
         else:
             self.params = {}
         self.results = []
+        self._names = {}  # child name -> position of the last child with that name in self.results
+        self._indexed = None  # (results list, number of results in self._names)
 
     def __str__(self):
         return self.to_str()
 
+    def _child(self, name):
+        """
+        Return the position of the last child result named name, the name index is extended with results appended
+        since the last lookup.
+        """
+        if self._indexed is None or self._indexed[0] is not self.results or self._indexed[1] > len(self.results):
+            self._names = {}
+            self._indexed = (self.results, 0)
+        for i in range(self._indexed[1], len(self.results)):
+            self._names[self.results[i].name] = i
+        self._indexed = (self.results, len(self.results))
+        return self._names.get(name, -1)
+
     def find(self, path, ts=None):
-        result = None
-        for r in self.results:
-            if r.name == path[0] or r.name== path[0].replace('__','/'):
-                if len(path) > 1:
-                    result = r.find(path[1:],ts)
-                else:
-                    result = r
-        return result
+        # the last child matching the path name (as in a linear scan) is followed
+        index = max(self._child(path[0]), self._child(path[0].replace('__', '/')))
+        if index < 0:
+            return None
+        r = self.results[index]
+        if len(path) > 1:
+            return r.find(path[1:], ts)
+        return r
 
     def next_result(self):
         if self.results_index < len(self.results):
@@ -163,6 +366,23 @@ class Result(object):
                         self.results.append(result)
                         result.from_xml(e_param)
 
+    def to_dict(self):
+        return {'name': self.name, 'type': self.type, 'status': self.status, 'filename': self.filename,
+                'params': self.params, 'results': [r.to_dict() for r in self.results]}
+
+    def from_dict(self, d, result_path=None):
+        self.name = d.get('name')
+        self.type = d.get('type')
+        self.status = d.get('status')
+        self.filename = d.get('filename')
+        self.params = dict(d.get('params') or {})
+        self.result_path = result_path
+        self.results = []
+        for rd in d.get('results', []):
+            result = Result(result_path=result_path)
+            result.from_dict(rd, result_path=result_path)
+            self.results.append(result)
+
     def to_xml(self, parent=None, filename=None):
         attr = {}
         if self.name:
@@ -219,13 +439,30 @@ class Result(object):
         if filename is not None:
             if replace_existing is False and os.path.exists(filename):
                 raise ResultError('File %s already exists' % (filename))
-            f = open(filename, 'w')
+            f = open(filename, 'wb')
             f.write(xml)
             f.close()
+            # the cached tree and saved index are rebuilt on the next lookup
+            result_trees.pop(filename, None)
         else:
             print(xml)
 
-    def to_xlsx(self, wb=None, filename=None, results_dir=None, index=True, index_row=0, ts=None):
+    def csv_files(self, results_dir=None):
+        """
+        Return the paths of the csv file results in this result tree, in workbook order.
+        """
+        files = []
+        if self.type == RESULT_TYPE_FILE and os.path.splitext(self.filename)[1] == '.csv':
+            files.append(os.path.join(results_dir, self.filename))
+        for r in self.results:
+            files.extend(r.csv_files(results_dir))
+        return files
+
+    def to_xlsx(self, wb=None, filename=None, results_dir=None, index=True, index_row=0, ts=None, processes=None):
+        """
+        Write the result tree to a workbook. When a new workbook is created, the csv files of the tree are parsed in
+        parallel worker processes, a few files ahead of the writer (processes=1 parses them serially while writing).
+        """
         print('to_xlsx: %s %s' % (wb, filename))
         result_wb = wb
         if result_wb is None:
@@ -233,6 +470,9 @@ class Result(object):
             if index:
                 result_wb.add_index()
                 index_row = 1
+            if processes != 1:
+                result_wb.sheets = csv_sheets(self.csv_files(results_dir), relative_value_names=['TIME'],
+                                              processes=processes)
         if self.type == RESULT_TYPE_FILE:
             name, ext = os.path.splitext(self.filename)
             if ext == '.csv':
@@ -256,6 +496,7 @@ class ResultWorkbook(object):
         self.wb = xlsxwriter.Workbook(filename)
         self.ts = ts
         self.ws_index = None
+        self.sheets = None  # (csv file name, parsed worksheet data) iterator in writing order (see csv_sheets())
         self.hdr_format = self.wb.add_format()
         self.link_format = self.wb.add_format({'font_color': 'blue', 'underline': 1})
 
@@ -427,83 +668,33 @@ class ResultWorkbook(object):
 
     def add_csv_file(self, filename, title, relative_value_names=None, params=None, index_row=None):
         print('add_csv_file: %s' % (title))
-        col_width = []
-        line = 1
         # if the excel sheet name is greater than 31 char it can't be added to excel. Truncate it here.
         if len(title) > 31:
             title = title[:31]
         ws = self.wb.add_worksheet(title)
         if index_row is not None:
             index_row = self.add_index_entry(title, index_row)
-        f = None
-        relative_value_index = []
-        relative_value_start = []
-        if relative_value_names is None:
-            relative_value_names = []
         if params is None:
             params = {}
         try:
-            f = open(filename)
-            '''
-            reader = csv.reader(f, skipinitialspace=True)
-            print 'reader = %s %s' % (filename, reader)
-            for row in reader:
-            '''
-            print('filename = %s %s' % (filename, f))
-            for rec in f:
-                row = [x.strip() for x in rec.split(',')]
-                # print 'row = %s' % (row)
-                for i in range(len(row)):
-                    try:
-                        v = float(row[i])
-                        if math.isnan(v) or math.isinf(v):
-                            row[i] = ''
-                        else:
-                            row[i] = v
-                    except ValueError:
-                        pass
-                    # adjust column width if necessary
-                    width = len(str(row[i])) + 4
-                    if width < XL_COL_WIDTH_DEFAULT:
-                        width = XL_COL_WIDTH_DEFAULT
-                    try:
-                        curr_width = col_width[i]
-                    except IndexError:
-                        curr_width = 0
-                    if width > curr_width:
-                        col_width.insert(i, width)
-                        ws.set_column(i, i, width)
-                # find fields to be treated as relative value
-                if line == 1:
-                    params['plot.point_names'] = row
-                    for i in range(len(row)):
-                        width = len(row[i]) + 4
-                        if width < XL_COL_WIDTH_DEFAULT:
-                            width = XL_COL_WIDTH_DEFAULT
-                        ws.set_column(i, i, width)
-                    if relative_value_names is not None:
-                        for name in relative_value_names:
-                            try:
-                                index = row.index(name)
-                                relative_value_index.append(index)
-                            except ValueError:
-                                print('Value error for relative value name: %s' % (name))
-                # get initial value for relative value fields
-                elif line == 2:
-                    for index in relative_value_index:
-                        relative_value_start.append(row[index])
-                        row[index] = 0
-                else:
-                    for index in relative_value_index:
-                        row[index] = row[index] - relative_value_start[index]
-                ws.write_row(line - 1, 0, row)
+            sheet = None
+            if self.sheets is not None:
+                sheet_file, sheet = next(self.sheets, (None, None))
+                if sheet_file != filename:
+                    sheet = None
+            if sheet is None:
+                sheet = csv_sheet(filename, relative_value_names=relative_value_names)
+
+            names = sheet['names']
+            for i in range(len(names)):
+                ws.set_column(i, i, sheet['widths'][i])
+            ws.write_row(0, 0, names)
+            line = 1
+            for row in zip(*sheet['columns']):
+                ws.write_row(line, 0, row)
                 line += 1
-            params['plot.point_value_count'] = line - 1
-
-            if title[-4:] == '.csv':
-                chart_title = title[:-4]
-            else:
-                chart_title = title + '_chart'
+            params['plot.point_names'] = names
+            params['plot.point_value_count'] = sheet['count']
 
             print('params - plot: %s - %s' % (params, params.get('plot.title')))
             if params is not None and params.get('plot.title') is not None:
@@ -512,9 +703,6 @@ class ResultWorkbook(object):
         except Exception as e:
             print('add_csv_file error: %s' % (str(e)))
             raise
-        finally:
-            if f:
-                f.close()
 
         return index_row
 
@@ -522,6 +710,9 @@ class ResultWorkbook(object):
         pass
 
     def close(self):
+        if self.sheets is not None:
+            self.sheets.close()
+            self.sheets = None
         if self.wb is not None:
             self.wb.close()
 
@@ -0,0 +1,230 @@
+"""
+Copyright (c) 2017, Sandia National Labs and SunSpec Alliance
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of the Sandia National Labs and SunSpec Alliance nor the names of its
+contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Questions can be directed to support@sunspec.org
+"""
+
+import numpy as np
+
+from . import dataset
+
+RIDE_THROUGH_CYCLES = 1.
+RIDE_THROUGH_TRIG_THRESH = 3.
+
+
+class RideThroughError(Exception):
+    """
+    Exception to wrap all ride-through analysis generated exceptions.
+    """
+    pass
+
+
+def rms_envelope(data, sample_rate, freq=60., cycles=RIDE_THROUGH_CYCLES, step=None):
+    """
+    Sliding window RMS (window mean removed) of each row of data, all windows of all rows at once from cumulative
+    sums.
+
+    :param data: numpy array (n_channels x n_samples), a vector is one channel
+    :param sample_rate: sampling rate (Hz)
+    :param freq: nominal grid frequency (Hz)
+    :param cycles: window length in cycles of freq
+    :param step: samples between consecutive windows, default is two thirds of the window
+
+    :return: tuple (window center sample indices, RMS array (n_channels x n_windows))
+    """
+    data = np.atleast_2d(np.asarray(data, dtype=float))
+    window = max(int(round(cycles*sample_rate/float(freq))), 1)
+    if step is None:
+        step = window - window//3
+    n = data.shape[1]
+    if n < window:
+        return np.empty(0, dtype=int), np.empty((data.shape[0], 0))
+    left = np.arange(0, n - window + 1, max(int(step), 1))
+    right = left + window
+
+    # offset by the mean of each channel to limit cancellation error in the sums
+    x = data - data.mean(axis=1, keepdims=True)
+    c1 = np.zeros((data.shape[0], n + 1))
+    c2 = np.zeros((data.shape[0], n + 1))
+    np.cumsum(x, axis=1, out=c1[:, 1:])
+    np.cumsum(x*x, axis=1, out=c2[:, 1:])
+    mean = (c1[:, right] - c1[:, left])/window
+    sq = (c2[:, right] - c2[:, left])/window
+    return left + window//2, np.sqrt(np.maximum(sq - mean*mean, 0.))
+
+
+def first_index(mask, axis=-1):
+    """
+    Return the index of the first True element of mask along axis, -1 where there is none.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    return np.where(np.any(mask, axis=axis), np.argmax(mask, axis=axis), -1)
+
+
+def next_index(mask):
+    """
+    Return, for every position along the last axis of mask, the index of the first True element at or after it
+    (mask.shape[-1] where there is none).
+    """
+    mask = np.asarray(mask, dtype=bool)
+    n = mask.shape[-1]
+    idx = np.where(mask, np.arange(n), n)
+    return np.minimum.accumulate(idx[..., ::-1], axis=-1)[..., ::-1]
+
+
+def ride_through_analysis(wfmtime, ac_current, sample_rate, ac_voltage=None, grid_trig=None, v_nom=240.,
+                          v_window=20., trip_thresh=3., freq=60., cycles=RIDE_THROUGH_CYCLES,
+                          trig_thresh=RIDE_THROUGH_TRIG_THRESH):
+    """
+    Find the voltage ride-through events of a capture and the time each phase of the EUT tripped.
+
+    An event starts when the RMS voltage of any phase leaves v_nom +/- v_window (or when grid_trig rises above
+    trig_thresh if grid_trig is given) and ends when all phases are back in the window. A phase is considered tripped
+    when its RMS current falls to trip_thresh or below before the next event starts.
+
+    :param wfmtime: time vector (numpy)
+    :param ac_current: current array (n_phases x n_samples), a vector is one phase
+    :param sample_rate: sampling rate (Hz)
+    :param ac_voltage: voltage array, same shape as ac_current, required if grid_trig is None
+    :param grid_trig: grid simulator trigger vector used to start the events
+    :param v_nom: nominal RMS voltage (V)
+    :param v_window: voltage window around v_nom (V)
+    :param trip_thresh: RMS current level where the EUT is considered tripped (A)
+    :param freq: nominal grid frequency (Hz)
+    :param cycles: RMS window length in cycles
+    :param trig_thresh: grid_trig threshold
+
+    :return: numpy structured array with one record per event, fields:
+             start, end, duration - event times (s), end is NaN if the voltage did not recover in the capture
+             v_min, v_max - (n_phases) minimum and maximum RMS voltage during the event, NaN without ac_voltage
+             trip_time, trip_delay - (n_phases) trip time and time from the event start, NaN if not tripped
+             tripped - (n_phases) bool
+    """
+    t = np.asarray(wfmtime, dtype=float)
+    i = np.atleast_2d(np.asarray(ac_current, dtype=float))
+    phases = i.shape[0]
+    if i.shape[1] != len(t):
+        raise RideThroughError('Current and time vectors are not the same length')
+    if ac_voltage is not None:
+        v = np.atleast_2d(np.asarray(ac_voltage, dtype=float))
+        if v.shape != i.shape:
+            raise RideThroughError('Voltage and current arrays are not the same shape')
+    elif grid_trig is None:
+        raise RideThroughError('Ride-through analysis requires ac_voltage or grid_trig')
+
+    centers, i_rms = rms_envelope(i, sample_rate, freq, cycles)
+    times = t[centers]
+    n_windows = len(centers)
+    v_rms = None
+    if ac_voltage is not None:
+        _, v_rms = rms_envelope(v, sample_rate, freq, cycles)
+
+    if grid_trig is not None:
+        # the trigger edges are found on the raw samples so short pulses are not missed between window centers and
+        # the events start at the exact trigger time
+        trig = np.asarray(grid_trig, dtype=float) >= trig_thresh
+        if len(trig) != len(t):
+            raise RideThroughError('Trigger and time vectors are not the same length')
+        edges = np.diff(np.concatenate(([False], trig, [False])).astype(int))
+        start_samples = np.flatnonzero(edges == 1)
+        end_samples = np.flatnonzero(edges == -1)
+        start_times = t[start_samples]
+        end_times = np.where(end_samples < len(t), t[np.minimum(end_samples, len(t) - 1)], np.nan)
+        # first window centered at or after each event start/end
+        starts = np.searchsorted(centers, start_samples)
+        ends = np.searchsorted(centers, end_samples)
+    else:
+        disturbed = np.any(np.abs(v_rms - v_nom) >= v_window, axis=0)
+        edges = np.diff(np.concatenate(([False], disturbed, [False])).astype(int))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        start_times = times[starts]
+        end_times = np.where(ends < n_windows, times[np.minimum(ends, n_windows - 1)], np.nan)
+
+    # first tripped window at or after each event start, for all phases and events at once
+    trip = np.column_stack((next_index(i_rms <= trip_thresh), np.full(phases, n_windows)))[:, starts]
+    tripped = trip < np.concatenate((starts[1:], [n_windows]))
+    trip_time = np.full(trip.shape, np.nan)
+    trip_time[tripped] = times[trip[tripped]]
+
+    events = np.zeros(len(starts), dtype=[('start', float), ('end', float), ('duration', float),
+                                          ('v_min', float, (phases,)), ('v_max', float, (phases,)),
+                                          ('trip_time', float, (phases,)), ('trip_delay', float, (phases,)),
+                                          ('tripped', bool, (phases,))])
+    if len(starts) == 0:
+        return events
+    events['start'] = start_times
+    events['end'] = end_times
+    events['duration'] = events['end'] - events['start']
+    events['trip_time'] = trip_time.T
+    events['trip_delay'] = (trip_time - start_times).T
+    events['tripped'] = tripped.T
+    events['v_min'] = np.nan
+    events['v_max'] = np.nan
+    if v_rms is not None:
+        # trigger events shorter than a window step may contain no window center
+        valid = starts < ends
+        bounds = np.column_stack((starts[valid], ends[valid])).ravel()
+        if len(bounds) and bounds[-1] == n_windows:
+            bounds = bounds[:-1]
+        if len(bounds):
+            events['v_min'][valid] = np.minimum.reduceat(v_rms, bounds, axis=1)[:, ::2].T
+            events['v_max'][valid] = np.maximum.reduceat(v_rms, bounds, axis=1)[:, ::2].T
+    return events
+
+
+def ride_through_csv(filename, phases=(1, 2, 3), sep=',', **kwargs):
+    """
+    Run ride_through_analysis() on a waveform csv file with TIME, AC_V_<phase> and AC_I_<phase> channels.
+
+    :param filename: String Path and name of the csv file
+    :param phases: phases to analyze
+    :param sep: field separator
+    :param kwargs: ride_through_analysis() parameters, sample_rate defaults to the rate of the time channel
+
+    :return: ride_through_analysis() events
+    """
+    try:
+        points, data = dataset.read_csv(filename, sep=sep)
+    except dataset.DatasetError as e:
+        raise RideThroughError('Waveform file error: %s' % e)
+    columns = dict(zip(points, data))
+    time_chan = columns.get('TIME', columns.get('Time'))
+    if time_chan is None:
+        raise RideThroughError('Time channel not found: %s' % filename)
+    t = np.asarray(time_chan, dtype=float)
+    try:
+        i = [np.asarray(columns['AC_I_%s' % p], dtype=float) for p in phases]
+        if kwargs.get('grid_trig') is None:
+            kwargs['ac_voltage'] = [np.asarray(columns['AC_V_%s' % p], dtype=float) for p in phases]
+    except KeyError as e:
+        raise RideThroughError('Channel not found: %s' % e)
+    if kwargs.get('sample_rate') is None:
+        kwargs['sample_rate'] = (len(t) - 1)/(t[-1] - t[0])
+    return ride_through_analysis(t, i, **kwargs)
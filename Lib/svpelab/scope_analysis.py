@@ -0,0 +1,197 @@
+"""
+Copyright (c) 2017, Sandia National Labs and SunSpec Alliance
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of the Sandia National Labs and SunSpec Alliance nor the names of its
+contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Questions can be directed to support@sunspec.org
+"""
+
+import numpy as np
+
+SCOPE_CLIP_HIGH = 127
+SCOPE_CLIP_LOW = -127
+SWITCH_HIGH = 0.90
+SWITCH_LOW = 0.10
+SWITCH_PRE = 20
+CONDUCTING = 0
+SWITCHING = 1
+BLOCKING = 2
+UNKNOWN = 3
+
+
+def clip_stats(raw, low=SCOPE_CLIP_LOW, high=SCOPE_CLIP_HIGH):
+    """
+    Count the samples of a raw digitizer record at the clipping levels.
+
+    :param raw: raw curve data (numpy)
+    :param low: negative clipping level
+    :param high: positive clipping level
+
+    :return: tuple (positive clipped count, negative clipped count, total count)
+    """
+    raw = np.asarray(raw)
+    return int(np.count_nonzero(raw == high)), int(np.count_nonzero(raw == low)), raw.size
+
+
+def scale_curve(raw, y_offset, y_mult, y_zero, out=None):
+    """
+    Convert raw curve data to vertical units: Yi = YZEro + YMUlt * (DataPoint_i - YOFf).
+
+    :param raw: raw curve data (numpy)
+    :param out: optional float64 array the result is written to (may be raw itself if it is float64)
+
+    :return: float64 numpy array
+    """
+    if out is None:
+        out = np.empty(len(raw), dtype=np.float64)
+    np.subtract(raw, y_offset, out=out)
+    out *= y_mult
+    out += y_zero
+    return out
+
+
+def uneven_time_steps(time_vect, decimals=11):
+    """
+    Return (dt, count) where dt is the last time step of time_vect rounded to decimals and count is the number of
+    steps that differ from it.
+    """
+    steps = np.round(np.diff(np.asarray(time_vect, dtype=float)), decimals)
+    dt = steps[-1]
+    return dt, int(np.count_nonzero(steps != dt))
+
+
+def probe_offset(data, bins=500):
+    """
+    Determine probe offset and maximum level of a switching waveform using histograms: the most frequent level in
+    the lower and upper half of the data range.
+
+    :return: tuple (offset, max)
+    """
+    sor = np.sort(np.asarray(data, dtype=float))
+    sor_min = sor[sor <= (0.5 * sor[-1])]
+    sor_max = sor[sor > (0.5 * sor[-1])]
+
+    levels = []
+    for part in (sor_min, sor_max):
+        hist, edges = np.histogram(part, bins=np.arange(part[0], part[-1], (part[-1] - part[0]) / bins))
+        levels.append(edges[np.argmax(hist)])
+    return levels[0], levels[1]
+
+
+def _coverage(starts, length, n):
+    """
+    Number of the ranges [start, start + length) (clipped to [0, n)) covering each of n samples.
+    """
+    count = np.zeros(n + 1, dtype=int)
+    np.add.at(count, np.clip(starts, 0, n), 1)
+    np.add.at(count, np.clip(starts + length, 0, n), -1)
+    return np.cumsum(count[:-1])
+
+
+def switch_states(voltage, volt_max, high=SWITCH_HIGH, low=SWITCH_LOW):
+    """
+    Classify each sample of a switch voltage waveform as CONDUCTING, SWITCHING, BLOCKING or UNKNOWN.
+    """
+    voltage = np.asarray(voltage, dtype=float)
+    states = np.full(len(voltage), UNKNOWN, dtype=np.int8)
+    states[voltage > high * volt_max] = BLOCKING
+    states[(voltage >= low * volt_max) & (voltage <= high * volt_max)] = SWITCHING
+    states[voltage < low * volt_max] = CONDUCTING
+    return states
+
+
+def switch_loss(time_vect, current, voltage, volt_offset, volt_max, curr_offset, high=SWITCH_HIGH, low=SWITCH_LOW,
+                pre=SWITCH_PRE):
+    """
+    Split the energy dissipated by a switch into switching, blocking and conducting energy.
+
+    Samples are classified by switch_states() on the offset corrected voltage. The pre samples ahead of each
+    blocking to switching transition and following each switching to blocking transition are counted as switching
+    (the power of a sample moved more than once is discarded, as in the original sample loop).
+
+    :param time_vect: time vector (numpy)
+    :param current: switch current (numpy)
+    :param voltage: switch voltage (numpy)
+    :param volt_offset: voltage probe offset (see probe_offset())
+    :param volt_max: voltage blocking level (see probe_offset())
+    :param curr_offset: current probe offset (see probe_offset())
+
+    :return: dict with the switching, blocking and conducting energy per second ('switch', 'block', 'conduct', J/s),
+             their average power ('switch_power', 'block_power', 'conduct_power', W), the cumulative energies
+             ('switch_energy', 'block_energy', 'conduct_energy', J), the time step 'dt' and the record 'duration'
+    """
+    t = np.asarray(time_vect, dtype=float)
+    current = np.asarray(current, dtype=float) + abs(curr_offset)
+    voltage = np.asarray(voltage, dtype=float) - abs(volt_offset)
+    n = len(t)
+    dt, _ = uneven_time_steps(t)
+    duration = t[-1] - t[0]
+
+    states = switch_states(voltage, volt_max, high, low)
+    p = current * voltage
+    power = np.where(states == SWITCHING, p, 0.)
+    block_power = np.where(states == BLOCKING, p, 0.)
+    conduct_power = np.where(states == CONDUCTING, p, 0.)
+
+    # blocking -> switching transitions at i extend switching over [i - pre, i - 1)
+    rising = np.flatnonzero((states[pre:] == SWITCHING) & (states[pre - 1:-1] == BLOCKING)) + pre
+    covered = _coverage(rising - pre, pre - 1, n)
+    states = np.where(covered > 0, SWITCHING, states)
+    # switching -> blocking transitions at i extend switching over [i, i + pre)
+    falling = np.flatnonzero((states[pre + 1:] == BLOCKING) & (states[pre:-1] == SWITCHING)) + pre + 1
+    covered += _coverage(falling, pre, n)
+
+    # the first move transfers the blocking power to switching, any further move of the same sample clears it
+    power = np.where(covered == 1, block_power, np.where(covered > 1, 0., power))
+    block_power = np.where(covered > 0, 0., block_power)
+
+    result = {'dt': dt, 'duration': duration,
+              'switch_power': np.mean(power), 'block_power': np.mean(block_power),
+              'conduct_power': np.mean(conduct_power),
+              'switch_energy': np.sum(power) * dt, 'block_energy': np.sum(block_power) * dt,
+              'conduct_energy': np.sum(conduct_power) * dt}
+    result['switch'] = result['switch_energy'] / duration
+    result['block'] = result['block_energy'] / duration
+    result['conduct'] = result['conduct_energy'] / duration
+    return result
+
+
+def bus_ripple(time_vect, data, f_low=110., f_high=130.):
+    """
+    DC bus magnitude and peak to peak ripple in the [f_low, f_high) band (120 Hz ripple of a single phase inverter
+    by default).
+
+    :return: tuple (peak to peak ripple, mean value)
+    """
+    data = np.asarray(data, dtype=float)
+    f_s = 1. / (time_vect[1] - time_vect[0])
+    N = len(data)
+    lo = int(round(f_low / (f_s / N)))
+    hi = int(round(f_high / (f_s / N)))
+    spectrum = np.fft.rfft(data)
+    amplitude = np.sum(2.0 / N * np.abs(spectrum[lo:hi]))
+    return 2 * amplitude, np.mean(data)
@@ -0,0 +1,507 @@
+"""
+Copyright (c) 2017, Sandia National Labs and SunSpec Alliance
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of the Sandia National Labs and SunSpec Alliance nor the names of its
+contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Questions can be directed to support@sunspec.org
+"""
+
+import socket
+import struct
+import time
+
+SCPI_TERM = '\n'
+SCPI_TIMEOUT = 5.
+SCPI_BUFFER_SIZE = 4096
+# latin-1 maps every byte to one character, so binary headers and blocks survive the str round trip
+SCPI_ENCODING = 'latin-1'
+SCPI_ERROR_QUERY = 'SYSTem:ERRor?\n'
+SCPI_MAX_ERRORS = 32
+# largest single write when sending a batch, kept below typical instrument input buffer sizes
+SCPI_BATCH_MAX_WRITE = 1024
+
+# Yokogawa Ethernet (WTViewer) protocol: every message block carries a 4 byte big-endian header with the block
+# length in the low 31 bits and the last block flag in the high bit
+WT_HEADER = struct.Struct('>I')
+WT_LAST_BLOCK = 0x80000000
+
+
+class ScpiError(Exception):
+    """
+    Exception to wrap all SCPI transport generated exceptions.
+    """
+    pass
+
+
+class ScpiBatchError(ScpiError):
+    """
+    Error queue entries reported after a command batch segment.
+
+    Attributes:
+        errors (list): error queue entries
+        commands (list): commands sent since the previous error check, the offending command is one of these
+        index (int): batch index of the first command in commands
+    """
+
+    def __init__(self, errors, commands, index):
+        self.errors = errors
+        self.commands = commands
+        self.index = index
+        ScpiError.__init__(self, '%s - commands %d-%d: %s' % (
+            '; '.join(errors), index, index + len(commands) - 1, ' | '.join([c.strip() for c in commands])))
+
+
+def to_bytes(data, encoding=SCPI_ENCODING):
+    """
+    Convert a command to bytes for writing, str commands are encoded, bytes-like commands are passed through.
+    """
+    if isinstance(data, str):
+        return data.encode(encoding)
+    return bytes(data)
+
+
+def block_data(data):
+    """
+    Return the payload of an IEEE 488.2 definite length arbitrary block ('#', number of length digits, length,
+    payload), anything before the '#' and after the payload (e.g. the terminator) is ignored. An indefinite length
+    block ('#0') extends to the terminating newline.
+
+    Parameters:
+        data (bytes or str): response containing the block
+
+    Returns:
+        bytes: block payload
+    """
+    data = to_bytes(data)
+    start = data.find(b'#')
+    if start < 0 or start + 2 > len(data):
+        raise ScpiError('Response is not an IEEE 488.2 block')
+    digits = int(data[start + 1:start + 2])
+    if digits == 0:
+        return data[start + 2:].rstrip(b'\n')
+    length = int(data[start + 2:start + 2 + digits])
+    start += 2 + digits
+    if start + length > len(data):
+        raise ScpiError('Incomplete IEEE 488.2 block, %d of %d bytes' % (len(data) - start, length))
+    return data[start:start + length]
+
+
+class Transport(object):
+    """
+    Buffered, terminator aware SCPI transport. Received data is accumulated in a bytearray and searched for the
+    terminator with find(), anything received past the terminator is kept for the next read. The connection is
+    opened on first use and reused until close() is called or a communication error occurs, in which case the next
+    write reconnects.
+
+    Subclasses implement _connect(), _send() and _recv() for the physical interface.
+
+    Parameters:
+        term (str): response terminator
+        timeout (float): response timeout in seconds, applies to a complete read
+        buffer_size (int): maximum number of bytes requested per receive
+        encoding (str): encoding used to convert between str and bytes
+    """
+
+    def __init__(self, term=SCPI_TERM, timeout=SCPI_TIMEOUT, buffer_size=SCPI_BUFFER_SIZE, encoding=SCPI_ENCODING):
+        self.term = term
+        self.timeout = timeout
+        self.buffer_size = buffer_size
+        self.encoding = encoding
+        self.conn = None
+        self._buf = bytearray()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _connect(self):
+        """
+        Open the interface and return the connection object.
+        """
+        raise NotImplementedError
+
+    def _send(self, data):
+        """
+        Write all of the bytes in data to the connection.
+        """
+        raise NotImplementedError
+
+    def _recv(self, timeout):
+        """
+        Return the bytes available on the connection (at most buffer_size), waiting up to timeout seconds for at
+        least one. Returns an empty bytes object on timeout.
+        """
+        raise NotImplementedError
+
+    def _flush(self):
+        """
+        Discard any input pending on the connection.
+        """
+        pass
+
+    def is_open(self):
+        return self.conn is not None
+
+    def open(self):
+        if self.conn is None:
+            try:
+                self.conn = self._connect()
+            except ScpiError:
+                raise
+            except Exception as e:
+                raise ScpiError('Unable to open connection: %s' % str(e))
+            self._buf = bytearray()
+
+    def close(self):
+        try:
+            if self.conn is not None:
+                self.conn.close()
+        except Exception:
+            pass
+        finally:
+            self.conn = None
+            self._buf = bytearray()
+
+    def clear(self):
+        """
+        Discard any buffered and pending input.
+        """
+        self._buf = bytearray()
+        if self.conn is not None:
+            try:
+                self._flush()
+            except Exception as e:
+                self.close()
+                raise ScpiError(str(e))
+
+    def write(self, data):
+        """
+        Write a command (str or bytes), the command must include any required terminator.
+        """
+        self.open()
+        try:
+            self._send(to_bytes(data, self.encoding))
+        except Exception as e:
+            self.close()
+            raise ScpiError(str(e))
+
+    def _fill(self, deadline):
+        """
+        Receive more data into the buffer, raise ScpiError if nothing arrives before the deadline.
+        """
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise ScpiError('Timeout waiting for response')
+        self.open()
+        try:
+            data = self._recv(remaining)
+        except ScpiError:
+            self.close()
+            raise
+        except Exception as e:
+            self.close()
+            raise ScpiError(str(e))
+        if data:
+            self._buf += data
+        elif time.time() >= deadline:
+            raise ScpiError('Timeout waiting for response')
+
+    def read_until(self, term=None, timeout=None):
+        """
+        Read bytes up to and including the terminator.
+
+        Parameters:
+            term (str or bytes): terminator, default is the transport terminator
+            timeout (float): timeout in seconds, default is the transport timeout
+
+        Returns:
+            bytes: response including the terminator
+        """
+        term = to_bytes(self.term if term is None else term, self.encoding)
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+        start = 0
+        while True:
+            idx = self._buf.find(term, start)
+            if idx >= 0:
+                end = idx + len(term)
+                data = bytes(self._buf[:end])
+                del self._buf[:end]
+                return data
+            # only search the newly received bytes (and a possible partial terminator) on the next pass
+            start = max(0, len(self._buf) - len(term) + 1)
+            self._fill(deadline)
+
+    def read_bytes(self, size, timeout=None):
+        """
+        Read exactly size bytes.
+        """
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+        while len(self._buf) < size:
+            self._fill(deadline)
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        return data
+
+    def read(self, term=None, timeout=None):
+        """
+        Read a response up to and including the terminator and return it as a str.
+        """
+        return self.read_until(term, timeout).decode(self.encoding)
+
+    def query(self, cmd_str, term=None, timeout=None):
+        """
+        Write a command and return the response, including the terminator, as a str.
+        """
+        self.write(cmd_str)
+        return self.read(term, timeout)
+
+
+class TCPTransport(Transport):
+    """
+    SCPI transport over a TCP socket (raw socket SCPI port).
+
+    Parameters:
+        ipaddr (str): instrument IP address
+        ipport (int): instrument TCP port
+    """
+
+    def __init__(self, ipaddr, ipport, **kwargs):
+        Transport.__init__(self, **kwargs)
+        self.ipaddr = ipaddr
+        self.ipport = int(ipport)
+
+    def _connect(self):
+        conn = socket.create_connection((self.ipaddr, self.ipport), timeout=self.timeout)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+    def _send(self, data):
+        self.conn.settimeout(self.timeout)
+        self.conn.sendall(data)
+
+    def _recv(self, timeout):
+        self.conn.settimeout(timeout)
+        try:
+            data = self.conn.recv(self.buffer_size)
+        except socket.timeout:
+            return b''
+        if not data:
+            raise ScpiError('Connection closed by instrument')
+        return data
+
+    def _flush(self):
+        self.conn.settimeout(0)
+        try:
+            while self.conn.recv(self.buffer_size):
+                pass
+        except (socket.timeout, BlockingIOError):
+            pass
+        finally:
+            self.conn.settimeout(self.timeout)
+
+
+class SerialTransport(Transport):
+    """
+    SCPI transport over a serial port (requires pyserial).
+
+    Parameters:
+        port (str): serial port name, e.g. 'COM3' or '/dev/ttyUSB0'
+        baudrate (int): baud rate
+        write_timeout (float): write timeout in seconds
+        settle_time (float): delay after opening the port before it is used
+    """
+
+    def __init__(self, port, baudrate=115200, write_timeout=2., settle_time=0., **kwargs):
+        Transport.__init__(self, **kwargs)
+        self.port = port
+        self.baudrate = baudrate
+        self.write_timeout = write_timeout
+        self.settle_time = settle_time
+
+    def _connect(self):
+        try:
+            import serial
+        except ImportError:
+            raise ScpiError('Serial communication requires pyserial')
+        conn = serial.Serial(port=self.port, baudrate=self.baudrate, bytesize=8, stopbits=1, xonxoff=0,
+                             timeout=self.timeout, write_timeout=self.write_timeout)
+        if self.settle_time:
+            time.sleep(self.settle_time)
+        return conn
+
+    def _send(self, data):
+        self.conn.write(data)
+
+    def _recv(self, timeout):
+        self.conn.timeout = timeout
+        return self.conn.read(min(max(self.conn.in_waiting, 1), self.buffer_size))
+
+    def _flush(self):
+        self.conn.reset_input_buffer()
+
+
+class VISATransport(Transport):
+    """
+    SCPI transport over a VISA resource (requires pyvisa). Reads are done with read_raw() so responses go through
+    the same buffered terminator handling as the other transports.
+
+    Parameters:
+        visa_id (str): VISA resource name
+        backend (str): pyvisa backend, e.g. '@py', default is the pyvisa default backend
+    """
+
+    def __init__(self, visa_id, backend=None, **kwargs):
+        Transport.__init__(self, **kwargs)
+        self.visa_id = visa_id
+        self.backend = backend
+        self.rm = None
+
+    def _connect(self):
+        try:
+            import pyvisa as visa
+        except ImportError:
+            raise ScpiError('VISA communication requires pyvisa')
+        if self.rm is None:
+            self.rm = visa.ResourceManager() if self.backend is None else visa.ResourceManager(self.backend)
+        conn = self.rm.open_resource(str(self.visa_id))
+        conn.timeout = int(self.timeout * 1000)
+        return conn
+
+    def _send(self, data):
+        self.conn.write_raw(data)
+
+    def _recv(self, timeout):
+        import pyvisa as visa
+        self.conn.timeout = max(int(timeout * 1000), 1)
+        try:
+            return self.conn.read_raw(self.buffer_size)
+        except visa.errors.VisaIOError as e:
+            if e.error_code == visa.constants.StatusCode.error_timeout:
+                return b''
+            raise
+
+    def _flush(self):
+        self.conn.clear()
+
+
+def is_error(resp):
+    """
+    Return True if an error queue response reports an error, i.e. the error number is not 0.
+    """
+    code = resp.strip().split(',', 1)[0]
+    try:
+        return int(code) != 0
+    except ValueError:
+        return not code.startswith('0')
+
+
+def error_queue(transport, error_query=SCPI_ERROR_QUERY, max_errors=SCPI_MAX_ERRORS):
+    """
+    Read the instrument error queue until it is empty.
+
+    Returns:
+        list: error queue entries, empty if there are no errors
+    """
+    errors = []
+    for i in range(max_errors):
+        resp = transport.query(error_query).strip()
+        if not resp or not is_error(resp):
+            break
+        errors.append(resp)
+    return errors
+
+
+def batch(transport, commands, checkpoints=None, error_query=SCPI_ERROR_QUERY, max_write=SCPI_BATCH_MAX_WRITE):
+    """
+    Send a sequence of commands with deferred error checking. Consecutive commands are concatenated into as few
+    writes as possible (each at most max_write bytes unless a single command is longer) and the error queue is
+    read once at the end of the batch and after each checkpoint instead of after every command. Commands
+    containing a query end the current write and their response is read before sending more.
+
+    Parameters:
+        transport (Transport): open or openable transport
+        commands (list): command strings, each including its terminator
+        checkpoints (list): indices of commands after which the error queue is checked
+        error_query (str): error queue query, an empty queue responds with error number 0
+        max_write (int): maximum number of bytes per write
+
+    Returns:
+        list: responses to the queries in the batch, in order
+
+    Raises:
+        ScpiBatchError: the error queue reported errors, the exception identifies the commands sent since the
+        previous error check
+    """
+    checks = set(checkpoints or ())
+    checks.add(len(commands) - 1)
+    responses = []
+    pending = bytearray()
+    start = 0
+    for i, cmd_str in enumerate(commands):
+        data = to_bytes(cmd_str, transport.encoding)
+        if pending and len(pending) + len(data) > max_write:
+            transport.write(pending)
+            pending = bytearray()
+        pending += data
+        query = '?' in cmd_str
+        if query or i in checks:
+            transport.write(pending)
+            pending = bytearray()
+            if query:
+                responses.append(transport.read())
+        if i in checks:
+            errors = error_queue(transport, error_query)
+            if errors:
+                raise ScpiBatchError(errors, list(commands[start:i + 1]), start)
+            start = i + 1
+    return responses
+
+
+def wt_float_values(block, value_struct=None):
+    """
+    Decode a Yokogawa IEEE 488.2 block of big-endian 32 bit floats (:NUMERIC:FORMAT FLOAT). Returns (values,
+    value_struct), pass value_struct back in to reuse the compiled format for the next block of the same size.
+    """
+    payload = block_data(block)
+    if value_struct is None or value_struct.size != len(payload):
+        value_struct = struct.Struct('>%df' % (len(payload) // 4))
+    return value_struct.unpack(payload), value_struct
+
+
+def wt_pf_adjust_signs(data, pf_points):
+    """
+    Set the sign of the Yokogawa power factor points of the data list in place, the power factor sign is the
+    opposite sign of the product of active and reactive power. pf_points holds (pf index, p index, q index) tuples
+    from the driver pf_scan().
+    """
+    for pf_idx, p_idx, q_idx in pf_points:
+        pf = abs(data[pf_idx])
+        data[pf_idx] = -pf if data[p_idx] * data[q_idx] >= 0 else pf
+    return data
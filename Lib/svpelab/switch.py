@@ -30,16 +30,15 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 Questions can be directed to support@sunspec.org
 """
 
-import sys
 import os
-import glob
-import importlib
+
+from . import plugins
 
 # switch controller
 SWITCH_CLOSED = True
 SWITCH_OPEN = False
 
-switch_modules = {}
+switch_modules = plugins.PluginModules()
 
 
 def params(info, id=None, label='Switch Controller', group_name=None, active=None, active_value=None):
@@ -225,39 +224,18 @@ class Switch(object):
 
 def switch_scan():
     """
-    Scans for switch modules in the current directory and imports them into the `switch_modules` dictionary, keyed by the 
-    'mode' attribute of the module's `switch_info()` function.
-    
-    This function is responsible for dynamically loading and registering switch modules in the system. It searches for 
-    files matching the pattern 'switch_*.py' in the current directory, imports each module, and extracts the 'mode' attribute 
-    from the module's `switch_info()` function. The imported modules are then stored in the `switch_modules` dictionary, keyed by their 'mode' value.
-    
-    This allows the system to dynamically discover and load new switch modules without having to explicitly register them.
-    """  
+    Scan for switch modules on import.
+
+    Finds all files in the current directory that match 'switch_*.py' and registers them in 'switch_modules',
+    keyed by the 'mode' value returned from 'switch_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used. Scan and module import errors
+    are raised as SwitchError.
+    """
     global switch_modules
     # scan all files in current directory that match switch_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'switch_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'switch_info'):
-                info = m.switch_info()
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    switch_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            raise SwitchError('Error scanning module %s: %s' % (module_name, str(e)))
+    plugins.plugin_scan(switch_modules, os.path.dirname(os.path.realpath(__file__)), 'switch_*.py', 'switch_info',
+                        package_name=package_name, error=SwitchError, raise_errors=True)
 
 # scan for switch modules on import
 switch_scan()
@@ -32,6 +32,15 @@ Questions can be directed to support@sunspec.org
 
 import math
 
+import numpy as np
+
+from . import dataset
+
+CYCLE_CHUNK_SIZE = 100000
+CYCLE_MAX_TIME = 1.0
+CYCLE_POINTS = ('TIME', 'VRMS', 'IRMS', 'P', 'Q', 'S', 'PF', 'FREQ')
+
+
 class WaveformError(Exception):
     """
     Exception to wrap all waveform generated exceptions.
@@ -39,6 +48,137 @@ class WaveformError(Exception):
     pass
 
 
+def rising_crossings(data):
+    """
+    Return the indices of the samples where data goes from negative to zero or positive.
+    """
+    data = np.asarray(data, dtype=float)
+    return np.flatnonzero((data[1:] >= 0) & (data[:-1] < 0)) + 1
+
+
+def cycle_rms(data, crossings):
+    """
+    Return the rms value of data between each pair of consecutive crossings (see rising_crossings()).
+    """
+    if len(crossings) < 2:
+        return np.empty(0)
+    data = np.asarray(data, dtype=float)
+    return np.sqrt(np.add.reduceat(np.square(data), crossings)[:-1]/np.diff(crossings))
+
+
+def cycle_pq(t, v, i, crossings):
+    """
+    Compute the power quality data of each cycle delimited by consecutive rising zero crossings of the voltage.
+
+    P is the mean instantaneous power, S = VRMS * IRMS, Q is the fundamental reactive power of the cycle (positive
+    when the current lags the voltage), PF = P/S and FREQ is computed from the crossing times interpolated between
+    samples. TIME is the time of the sample closing the cycle.
+
+    :param t: time vector (numpy)
+    :param v: voltage vector (numpy)
+    :param i: current vector (numpy)
+    :param crossings: rising zero crossing indices of v, the first one must be > 0
+
+    :return: dict of CYCLE_POINTS -> numpy vector with one entry per cycle
+    """
+    if len(crossings) < 2:
+        return dict((p, np.empty(0)) for p in CYCLE_POINTS)
+    r = np.asarray(crossings)
+    n = np.diff(r)
+    offsets = r[:-1] - r[0]
+    vc = v[r[0]:r[-1]]
+    ic = i[r[0]:r[-1]]
+
+    vrms = np.sqrt(np.add.reduceat(vc * vc, offsets)/n)
+    irms = np.sqrt(np.add.reduceat(ic * ic, offsets)/n)
+    p = np.add.reduceat(vc * ic, offsets)/n
+    s = vrms * irms
+
+    # fundamental phasors of each cycle, one DFT bin per cycle
+    k = np.arange(len(vc)) - np.repeat(offsets, n)
+    e = np.exp(-2j * np.pi * k/np.repeat(n, n))
+    v1 = np.add.reduceat(vc * e, offsets)
+    i1 = np.add.reduceat(ic * e, offsets)
+    q = np.imag(v1 * np.conj(i1)) * 2/np.square(n)
+
+    tc = t[r - 1] + (t[r] - t[r - 1]) * -v[r - 1]/(v[r] - v[r - 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pf = p/s
+        freq = 1./np.diff(tc)
+
+    return {'TIME': t[r[1:]], 'VRMS': vrms, 'IRMS': irms, 'P': p, 'Q': q, 'S': s, 'PF': pf, 'FREQ': freq}
+
+
+class CycleCalculator(object):
+    """
+    Streaming per-cycle power quality calculator (see cycle_pq()).
+
+    Blocks of samples are fed to process(). Each phase is segmented on the rising zero crossings of its voltage and
+    the samples of the unfinished cycle at the end of a block are carried over to the next block, so a capture can be
+    processed in chunks of any size with the same result as in one piece. A cycle longer than max_cycle_time (loss of
+    voltage) is dropped.
+    """
+
+    def __init__(self, phases=(1, 2, 3), max_cycle_time=CYCLE_MAX_TIME):
+        self.phases = [str(p) for p in phases]
+        self.max_cycle_time = max_cycle_time
+        self._carry = dict((p, None) for p in self.phases)
+        self._results = dict((p, dict((c, []) for c in CYCLE_POINTS)) for p in self.phases)
+
+    def process(self, t, v, i):
+        """
+        Process a block of samples.
+
+        :param t: time vector of the block
+        :param v: voltage array of the block, one row per phase (n_phases x n_samples)
+        :param i: current array of the block, same shape as v
+
+        :return: dict phase -> dict of CYCLE_POINTS -> numpy vector of the cycles completed in the block
+        """
+        t = np.asarray(t, dtype=float)
+        v = np.atleast_2d(np.asarray(v, dtype=float))
+        i = np.atleast_2d(np.asarray(i, dtype=float))
+        if v.shape != (len(self.phases), len(t)) or i.shape != v.shape:
+            raise WaveformError('Block shape does not match %d phases of %d samples' % (len(self.phases), len(t)))
+
+        cycles = {}
+        for index, phase in enumerate(self.phases):
+            bt, bv, bi = t, v[index], i[index]
+            carry = self._carry[phase]
+            if carry is not None:
+                bt = np.concatenate((carry[0], bt))
+                bv = np.concatenate((carry[1], bv))
+                bi = np.concatenate((carry[2], bi))
+            crossings = rising_crossings(bv)
+            pq = cycle_pq(bt, bv, bi, crossings)
+            if len(pq['TIME']) > 0:
+                keep = np.diff(np.concatenate((bt[crossings[:1]], pq['TIME']))) <= self.max_cycle_time
+                pq = dict((c, pq[c][keep]) for c in CYCLE_POINTS)
+
+            # keep the sample ahead of the last crossing for the crossing time interpolation
+            start = len(bt) - 1
+            if len(crossings) > 0 and bt[-1] - bt[crossings[-1]] <= self.max_cycle_time:
+                start = crossings[-1] - 1
+            self._carry[phase] = (bt[start:].copy(), bv[start:].copy(), bi[start:].copy())
+
+            for c in CYCLE_POINTS:
+                self._results[phase][c].append(pq[c])
+            cycles[phase] = pq
+        return cycles
+
+    def results(self):
+        """
+        Return the cycles processed so far as dict phase -> dict of CYCLE_POINTS -> numpy vector.
+        """
+        results = {}
+        for phase in self.phases:
+            results[phase] = dict((c, np.concatenate(self._results[phase][c]) if self._results[phase][c]
+                                   else np.empty(0)) for c in CYCLE_POINTS)
+            for c in CYCLE_POINTS:
+                self._results[phase][c] = [results[phase][c]]
+        return results
+
+
 class Waveform(object):
 
     def __init__(self, ts=None):
@@ -49,28 +189,14 @@ class Waveform(object):
         self.channels = []           # channel names
         self.channel_data = []       # waveform curves
         self.rms_data = {}           # rms data calculated from waveform data
+        self.cycle_data = {}         # per-cycle power quality data calculated from waveform data
         self.ts = ts
 
-    def from_csv(self, filename, sep=','):
-        f = open(filename, 'r')
-        ids = f.readline().split(sep)
-        chans = []
-        chan_count = len(ids)
-        for i in range(chan_count):
-            self.channels.append(ids[i].strip())
-            chans.append([])
-        # print self.channels
-        line = 1
-        for data in f:
-            line += 1
-            values = data.split(sep)
-            if len(values) != chan_count:
-                raise WaveformError('Channel data error: line %s' % (line))
-            for i in range(chan_count):
-                chans[i].append(float(values[i]))
-
-        for i in range(chan_count):
-            self.channel_data.append(chans[i])
+    def from_csv(self, filename, sep=',', mmap=False):
+        try:
+            self.channels, self.channel_data = dataset.read_csv(filename, sep=sep, mmap=mmap)
+        except dataset.DatasetError as e:
+            raise WaveformError('Channel data error: %s' % e)
 
     def from_dataset(self, ds=None):
         if ds is not None:
@@ -90,13 +216,8 @@ class Waveform(object):
             f.write('%s\n' % ','.join(str(v) for v in data))
 
     def compute_rms(self, data):
-        tmp = 0
-        size = len(data)
-        for i in range(size):
-            v = data[i]
-            tmp += v * v
-        tmp /= float(size)
-        return math.sqrt(tmp)
+        data = np.asarray(data, dtype=float)
+        return math.sqrt(np.dot(data, data)/float(len(data)))
 
     def compute_cycle_rms(self, chan_id):
         c = None
@@ -114,36 +235,12 @@ class Waveform(object):
             except Exception:
                 raise WaveformError('Channel not found: %s' % (c))
 
-        time_chan = self.channel_data[time_index]
-        data_chan = self.channel_data[chan_index]
-        scanning = False
-        calculating = False
-        neg = False
-        start_index = 0
-        rms_time = []
-        rms_data = []
-
-        for i in range(len(data_chan)):
-            pos = data_chan[i] >= 0
-            if calculating:
-                if not pos:
-                    neg = True
-                elif neg:
-                    # calculate rms [start_index:i]
-                    rms_time.append(time_chan[i])
-                    rms = self.compute_rms(data_chan[start_index:i])
-                    rms_data.append(rms)
-                    start_index = i
-                    neg = False
-            elif scanning:
-                if pos:
-                    start_index = i
-                    calculating = True
-            else:
-                if not pos:
-                    scanning = True
-
-        return rms_time, rms_data
+        time_chan = np.asarray(self.channel_data[time_index], dtype=float)
+        data_chan = np.asarray(self.channel_data[chan_index], dtype=float)
+
+        # cycles run from one rising zero crossing to the next
+        crossings = rising_crossings(data_chan)
+        return time_chan[crossings[1:]], cycle_rms(data_chan, crossings)
 
     def compute_rms_data(self, phase):
         phase = str(phase)
@@ -154,6 +251,54 @@ class Waveform(object):
         count = min(len(rms_time_v), len(rms_time_i))
         self.rms_data[phase] = [rms_time_v[:count], rms_data_v[:count], rms_data_i[:count]]
 
+    def _phase_channels(self, phases, channels=None):
+        if channels is None:
+            channels = self.channels
+        names = [str(c).strip() for c in channels]
+        points = []
+        for c in ['TIME' if 'TIME' in names else 'Time'] + \
+                ['AC_V_%s' % p for p in phases] + ['AC_I_%s' % p for p in phases]:
+            if c not in names:
+                raise WaveformError('Channel not found: %s' % (c))
+            points.append(c)
+        return points
+
+    def compute_cycle_pq(self, phases=(1, 2, 3)):
+        """
+        Compute the per-cycle power quality data (see CycleCalculator) of the AC_V_<phase>/AC_I_<phase> channels
+        of the waveform into self.cycle_data.
+        """
+        phases = [str(p) for p in phases]
+        points = self._phase_channels(phases)
+        names = [str(c).strip() for c in self.channels]
+        data = [np.asarray(self.channel_data[names.index(c)], dtype=float) for c in points]
+        calc = CycleCalculator(phases)
+        calc.process(data[0], data[1:len(phases) + 1], data[len(phases) + 1:])
+        self.cycle_data = calc.results()
+        return self.cycle_data
+
+    def compute_cycle_pq_csv(self, filename, phases=(1, 2, 3), sep=',', chunk_size=CYCLE_CHUNK_SIZE):
+        """
+        Compute the per-cycle power quality data of a waveform csv file into self.cycle_data without loading the
+        file: it is read and processed chunk_size rows at a time.
+        """
+        phases = [str(p) for p in phases]
+        calc = CycleCalculator(phases)
+        chunks = 0
+        try:
+            # the phase channels are selected from the file header, self.channels and self.channel_data are not changed
+            for points, data in dataset.iter_csv(filename, sep=sep, points=lambda c: self._phase_channels(phases, c),
+                                                 chunk_size=chunk_size):
+                calc.process(data[0], data[1:len(phases) + 1], data[len(phases) + 1:])
+                chunks += 1
+        except dataset.DatasetError as e:
+            raise WaveformError('Channel data error: %s' % e)
+        if chunks == 0:
+            raise WaveformError('No channel data in file: %s' % filename)
+        self.cycle_data = calc.results()
+        return self.cycle_data
+
+
 if __name__ == "__main__":
 
     wf = Waveform()
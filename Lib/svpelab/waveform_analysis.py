@@ -42,7 +42,6 @@ except Exception as e:
     print('Error: prettytable python package not found!')  # This will appear in the SVP log file.
 
 try:
-    from matplotlib.mlab import find
     import matplotlib.pyplot as plt
 except Exception as e:
     print('Error: matplotlib python package not found!')  # This will appear in the SVP log file.
@@ -57,7 +56,8 @@ try:
 except Exception as e:
     print('Error: math python package not found!')  # This will appear in the SVP log file.
 
-def calc_ride_through_duration(wfmtime, ac_current, ac_voltage=None, grid_trig=None, v_window=20., trip_thresh=3.):
+def calc_ride_through_duration(wfmtime, ac_current, ac_voltage=None, grid_trig=None, v_window=20., trip_thresh=3.,
+                               sample_rate=24e3, v_nom=240., f_grid=60.):
     """ Returns the time between the voltage change and when the EUT tripped
 
     wfmtime is the time vector from the waveform
@@ -66,146 +66,165 @@ def calc_ride_through_duration(wfmtime, ac_current, ac_voltage=None, grid_trig=N
     grid_trig is the trigger measurement corresponding to wfmtime times
     v_window is the window around the nominal RMS voltage where the VRT test is started
     trip_thresh is the RMS current level where the EUT is believe to be tripped or ceasing to energize
+    sample_rate, v_nom and f_grid are the sampling rate, nominal RMS voltage and nominal grid frequency
 
     There are two options for determining the start of the VRT test (the latter is used when ac_voltage != None)
     1. Using the trigger channel from the grid simulator
     2. Using the RMS calculation of the ac voltage to determine when the voltage exits v_nominal +/- v_window
-    """
-
-    f_grid = 60.
-    cycles_in_window = 1.
-    window_size = cycles_in_window*(1./f_grid)*1000.  # in ms
-
-    if ac_voltage is not None:  # use the ac voltage RMS values to determine when the vrt test starts
-        time_RMS, ac_voltage_RMS = calculateRmsOfSignal(ac_voltage, windowSize=window_size,
-                                                        samplingFrequency=24e3,
-                                                        overlap=int(window_size/3))
-        v_nom = 240.
-        volt_idx = [idx for idx, i in enumerate(ac_voltage_RMS) if (i <= (v_nom - v_window) or i >= (v_nom + v_window))]
-        if len(volt_idx) != 0:
-            try:
-                vrt_start = time_RMS[min(volt_idx)]
-            except:
-                raise script.ScriptFail('Error in Waveform File. Unable to get voltage time from wfmtime: %s' % str(e))
-        else:
-            raise script.ScriptFail('No voltage deviation in the waveform file.')
-
-        '''
-        # for comparison
-        trig_thresh = 3.
-        trig_idx = [idx for idx, i in enumerate(grid_trig) if i >= trig_thresh]
-        if len(trig_idx) != 0:
-            try:
-                vrt_start = wfmtime[min(trig_idx)]
-            except:
-                raise script.ScriptFail('Error in Waveform File. Unable to get trig time from wfmtime: %s' % str(e))
-        else:
-            raise script.ScriptFail('No daq trigger in the waveform file.')
-        '''
-
-    else:  # use the trigger to indicate when the grid simulator started the VRT test
-        trig_thresh = 3.
-        trig_idx = [idx for idx, i in enumerate(grid_trig) if i >= trig_thresh]
-        if len(trig_idx) != 0:
-            try:
-                vrt_start = wfmtime[min(trig_idx)]
-            except:
-                raise script.ScriptFail('Error in Waveform File. Unable to get trig time from wfmtime: %s' % str(e))
-        else:
-            raise script.ScriptFail('No daq trigger in the waveform file.')
-
-    ac_current_thresh = trip_thresh  # Amps
-    time_RMS, ac_current_RMS = calculateRmsOfSignal(ac_current, windowSize=window_size,
-                                                    samplingFrequency=24e3,
-                                                    overlap=int(window_size/3))
-
-    ac_current_idx = [idx for idx, i in enumerate(ac_current_RMS) if i <= ac_current_thresh]
-    if len(ac_current_idx) != 0:
-        try:
-            trip_time = time_RMS[min(ac_current_idx)]
-        except:
-            raise script.ScriptFail('Error in Waveform File. Unable to get trip time from wfmtime: %s' % str(e))
-
-        '''
-        plt.plot(wfmtime, ac_current, color='blue', label='ac_current')
-        plt.plot(time_RMS, ac_current_RMS, color='black', label='ac_current_RMS')
-        plt.plot(wfmtime, grid_trig, color='g', label='grid_trig')
-        plt.plot([vrt_start, vrt_start], [min(ac_current), max(ac_current)], color='red', label='VRT start-trig')
-        # plt.plot([vrt_start_RMS, vrt_start_RMS], [min(ac_current), max(ac_current)], 'r-.', label='VRT start-RMS')
-        plt.plot([trip_time, trip_time], [min(ac_current), max(ac_current)], 'r--', label='EUT trip')
-        plt.legend()
-        plt.grid(which='both', axis='both')
-        plt.show()
-        '''
-
-        return trip_time - vrt_start
 
+    Only the first event of a single phase is reported, see ride_through.ride_through_analysis() for multiple
+    phases and events.
+    """
+    from . import ride_through
+
+    events = ride_through.ride_through_analysis(wfmtime, ac_current, sample_rate, ac_voltage=ac_voltage,
+                                                grid_trig=grid_trig if ac_voltage is None else None, v_nom=v_nom,
+                                                v_window=v_window, trip_thresh=trip_thresh, freq=f_grid)
+    if len(events) == 0:
+        if ac_voltage is not None:
+            raise ride_through.RideThroughError('No voltage deviation in the waveform file.')
+        raise ride_through.RideThroughError('No daq trigger in the waveform file.')
+
+    if events[0]['tripped'][0]:
+        return events[0]['trip_delay'][0]
     else:
         trip_time = 0.  # no trip occurred
         return trip_time
 
 
-def freq_from_crossings(wfmtime, sig, fs):
-    """Estimate frequency by counting zero crossings
+FREQ_ROCOF_CYCLES = 6
+FREQ_SETTLE_CYCLES = 1
 
-    Doesn't work if there are multiple zero crossings per cycle.
 
+class FrequencyEstimator(object):
+    """
+    Causal, chunk-at-a-time frequency and ROCOF estimator.
+
+    Samples are low-pass filtered by a Butterworth filter whose state persists between chunks, the rising zero
+    crossings of the filtered signal are interpolated between samples and the frequency of each cycle is computed
+    from the time between consecutive crossings. The filter delay is constant so it does not bias the cycle periods.
+    ROCOF is the frequency change over the last rocof_cycles cycles.
+
+    The estimator can be fed a stored waveform in one call or the blocks of a live capture as they arrive; when a
+    block does not continue the previous one (start time gap, e.g. consecutive finite acquisitions) the filter and
+    zero crossing tracking restart while the cycle history used for ROCOF is kept, so ROCOF spans the blocks. The
+    cycles starting within settle_cycles nominal cycles of a (re)start are dropped as they are distorted by the
+    filter start transient.
+
+    :param sample_rate - sampling rate (Hz)
+    :param nominal_freq - nominal grid frequency (Hz)
+    :param cutoff - low-pass cutoff frequency (Hz), default is pi * nominal_freq
+    :param order - Butterworth filter order
+    :param rocof_cycles - number of cycles of the ROCOF difference
+    :param settle_cycles - nominal cycles dropped after a (re)start
     """
-    try:
+
+    def __init__(self, sample_rate, nominal_freq=60., cutoff=None, order=4, rocof_cycles=FREQ_ROCOF_CYCLES,
+                 settle_cycles=FREQ_SETTLE_CYCLES):
         from scipy import signal
-    except Exception as e:
-        print('Error: scipy python package not found!')  # This will appear in the SVP log file.
-
-    # FILTER THE WAVEFORM WITH LOWPASS BUTTERWORTH FILTER
-    # todo: revisit the wn calculation to be sure it works for multiple sampling rates
-    wn = (2*math.pi*60)/fs  #Wn is normalized from 0 to 1, where 1 is the Nyquist frequency, pi radians/sample
-    b, a = signal.butter(4, wn, analog=False)
-    sig_ff = signal.filtfilt(b, a, sig)
-
-    #check the frequency response
-    '''
-    w, h = signal.freqs(b, a)
-    plt.plot(w, 20 * np.log10(abs(h)))
-    plt.xscale('log')
-    plt.title('Butterworth filter frequency response')
-    plt.xlabel('Frequency [radians / second]')
-    plt.ylabel('Amplitude [dB]')
-    plt.margins(0, 0.1)
-    plt.grid(which='both', axis='both')
-    plt.show()
-    '''
 
-    # Find the zero crossings of the filtered data
-    # Linear interpolation to find truer zero crossings
+        self._signal = signal
+        self.sample_rate = float(sample_rate)
+        if cutoff is None:
+            cutoff = math.pi*nominal_freq
+        self._sos = signal.butter(order, min(cutoff/(self.sample_rate/2.), 0.99), output='sos')
+        self.rocof_cycles = max(int(rocof_cycles), 1)
+        self._settle = settle_cycles*self.sample_rate/nominal_freq
+        self.freq = None
+        self.rocof = None
+        self.reset()
+
+    def reset(self, start_time=0.):
+        """
+        Restart the estimator, the next sample is at start_time.
+        """
+        self._restart(start_time)
+        self._hist_t = np.empty(0)
+        self._hist_f = np.empty(0)
+
+    def _restart(self, start_time):
+        """
+        Restart the filter and zero crossing tracking, keeping the cycle history.
+        """
+        self.start_time = start_time
+        self._zi = None
+        self._count = 0
+        self._last = None
+        self._crossing = None
+
+    def update(self, samples, start_time=None):
+        """
+        Process a chunk of samples.
+
+        :param samples: sample vector (numpy)
+        :param start_time: time of the first sample, used to detect gaps, samples are assumed to be contiguous with
+                           the previous chunk if None
+
+        :return: tuple of numpy vectors (times, freqs, rocofs) for the cycles completed in the chunk, times are the
+                 middle of the cycles and rocof is NaN until rocof_cycles cycles have been seen
+        """
+        samples = np.asarray(samples, dtype=float)
+        if start_time is not None and \
+                abs(start_time - (self.start_time + self._count/self.sample_rate)) > .5/self.sample_rate:
+            self._restart(start_time)
+        if len(samples) == 0:
+            return np.empty(0), np.empty(0), np.empty(0)
+
+        if self._zi is None:
+            self._zi = self._signal.sosfilt_zi(self._sos)*samples[0]
+        filtered, self._zi = self._signal.sosfilt(self._sos, samples, zi=self._zi)
+
+        # rising crossings, including the one between the previous chunk and this one
+        offset = self._count
+        if self._last is not None:
+            filtered = np.concatenate(([self._last], filtered))
+            offset -= 1
+        self._last = filtered[-1]
+        self._count += len(samples)
+        idx = np.flatnonzero((filtered[1:] >= 0.) & (filtered[:-1] < 0.))
+        crossings = offset + idx - filtered[idx]/(filtered[idx + 1] - filtered[idx])
+        crossings = crossings[crossings >= self._settle]
+        if self._crossing is not None:
+            crossings = np.concatenate(([self._crossing], crossings))
+        if len(crossings) == 0:
+            return np.empty(0), np.empty(0), np.empty(0)
+        self._crossing = crossings[-1]
+
+        cross_times = self.start_time + crossings/self.sample_rate
+        with np.errstate(divide='ignore'):
+            freqs = 1./np.diff(cross_times)
+        times = (cross_times[1:] + cross_times[:-1])/2.
+
+        hist_t = np.concatenate((self._hist_t, times))
+        hist_f = np.concatenate((self._hist_f, freqs))
+        n = self.rocof_cycles
+        rocof = np.full(len(hist_f), np.nan)
+        rocof[n:] = (hist_f[n:] - hist_f[:-n])/(hist_t[n:] - hist_t[:-n])
+        rocof = rocof[len(self._hist_f):]
+        self._hist_t = hist_t[-n:]
+        self._hist_f = hist_f[-n:]
+
+        if len(freqs) > 0:
+            self.freq = freqs[-1]
+            self.rocof = rocof[-1]
+        return times, freqs, rocof
 
-    indices = find(np.logical_and(sig_ff[1:] >= 0., sig_ff[:-1] < 0.))
-    crossings = [i - sig_ff[i] / (sig_ff[i+1] - sig_ff[i]) for i in indices]  #interpolate
-    cross_times = wfmtime[0] + np.array(crossings)/fs
 
-    '''
-    plt.plot(wfmtime, sig, color='red', label='Original')
-    plt.plot(wfmtime, sig_ff, color='blue', label='filtered data')
-    plt.plot(cross_times, np.zeros(len(cross_times)), 'ro', label='Zero Crossings')
-    plt.legend()
-    plt.grid(which='both', axis='both')
-    plt.axis([0, 5/60, min(sig)/2, max(sig)/2])
-    plt.show()
-    '''
+def freq_from_crossings(wfmtime, sig, fs):
+    """Estimate frequency by counting zero crossings
 
-    time_steps = np.diff(crossings)
-    avg_freq = fs / np.average(time_steps)
-    freqs = [fs/time_steps[i] for i in range(0, len(cross_times)-1)]  #interpolate
-    freq_times = [(cross_times[i]+cross_times[i+1])/2 for i in range(0, len(freqs)-1)]  #interpolate
+    Doesn't work if there are multiple zero crossings per cycle. The signal is filtered causally (see
+    FrequencyEstimator), use a FrequencyEstimator directly to track frequency across consecutive captures.
 
-    # plt.plot(wfmtime, sig, color='red', label='Original')
-    # plt.plot(wfmtime, sig_ff, color='blue', label='Filtered data')
-    # plt.plot(freq_times, freqs[:-1], 'g', label='Frequency')
-    # plt.legend(loc=4)
-    # plt.grid(which='both', axis='both')
-    # plt.axis([0, freq_times[-1], 50, 61])
-    # plt.show()
+    :return: tuple (average frequency, list of the frequency of each cycle)
+    """
+    estimator = FrequencyEstimator(fs)
+    _, freqs, _ = estimator.update(sig, wfmtime[0])
+    if len(freqs) == 0:
+        return float('nan'), []
+    avg_freq = len(freqs)/np.sum(1./freqs)
 
-    return avg_freq, freqs
+    return avg_freq, freqs.tolist()
 
 
 def calculateRMS(data):
@@ -214,18 +233,35 @@ def calculateRMS(data):
     #   @param a list or a numpy array
     #   @return a scalar containing either an RMS value
     #   http://homepage.univie.ac.at/christian.herbst//python/dsp_util_8py_source.html
-    tmp = 0
-    size = len(data)
-    for i in range(size):
-        tmp += data[i]
-    mean = tmp / float(size)
-    #print "mean: ", mean
-    tmp = 0
-    for i in range(size):
-        tmp2 = data[i] - mean
-        tmp += tmp2 * tmp2
-    tmp /= float(size)
-    return math.sqrt(tmp)
+    data = np.asarray(data, dtype=float)
+    tmp = data - data.mean()
+    return math.sqrt(np.dot(tmp, tmp) / float(len(data)))
+
+
+def _window_rms(data, left, right, remove_mean=True):
+    """
+    RMS of the windows data[left:right] for arrays of window bounds, computed for all windows at once from
+    cumulative sums.
+
+    :param data: numpy array
+    :param left: numpy array of window start indexes
+    :param right: numpy array of window end indexes (exclusive), right > left
+    :param remove_mean: subtract the window mean before calculating the RMS (as calculateRMS())
+    :return: numpy array of RMS values
+    """
+    # offset by the mean of the whole signal to limit cancellation error in the sums
+    offset = data.mean() if len(data) > 0 else 0.
+    x = data - offset
+    c1 = np.concatenate(([0.], np.cumsum(x)))
+    c2 = np.concatenate(([0.], np.cumsum(x * x)))
+    n = (right - left).astype(float)
+    mean = (c1[right] - c1[left]) / n
+    sq = (c2[right] - c2[left]) / n
+    if remove_mean:
+        ms = sq - mean * mean
+    else:
+        ms = sq + 2. * offset * mean + offset * offset
+    return np.sqrt(np.maximum(ms, 0.))
 
 
 def calculateRmsOfSignal(data, windowSize, samplingFrequency, overlap=0):
@@ -239,41 +275,89 @@ def calculateRmsOfSignal(data, windowSize, samplingFrequency, overlap=0):
     #   @return a tuple containing two numpy arrays for the temporal offset and the
     #       RMS value at the respective temporal offset.
     #   http://homepage.univie.ac.at/christian.herbst//python/dsp_util_8py_source.html
+    #   All windows are calculated at once from cumulative sums (see _window_rms()).
 
     if windowSize < 1:
         raise Exception("window size must not below 1 ms")
     if overlap >= windowSize:
         raise Exception("overlap must not exceed window size")
 
+    data = np.asarray(data, dtype=float)
     numFrames = len(data)
     duration = numFrames / float(samplingFrequency)
 
     readProgress = (windowSize - overlap) / 1000.0
     outputSize = int(duration / readProgress)
-    dataX = np.zeros(outputSize)
-    dataY = np.zeros(outputSize)
-    t = 0
+    if outputSize <= 0:
+        return np.zeros(0), np.zeros(0)
+    # window times accumulated the same way as the original sample by sample loop
+    dataX = np.concatenate(([0.], np.cumsum(np.full(outputSize - 1, readProgress))))
     halfWindowSize = windowSize / 2000.0
-    for idx in range(outputSize):
-        left = int((t - halfWindowSize) * float(samplingFrequency))
-        right = left + int(windowSize * float(samplingFrequency) / 1000.0)
-        if right >= numFrames:
-            right = numFrames - 1
-        numFramesLocal = right - left
-        #print idx, t, left, right, readProgress
-        if numFramesLocal <= 0:
-            raise Exception("zero window size (t = " + str(t) + " sec.)")
-        dataTmp = np.zeros(numFramesLocal)
-        for i in range(numFramesLocal):
-            dataTmp[i] = data[i + left]
-        dataX[idx] = t
-        t += readProgress
-        rms = calculateRMS(dataTmp)
-        dataY[idx] = rms
+    left = ((dataX - halfWindowSize) * float(samplingFrequency)).astype(int)
+    right = np.minimum(left + int(windowSize * float(samplingFrequency) / 1000.0), numFrames - 1)
+    numFramesLocal = right - left
+    if np.any(numFramesLocal <= 0):
+        raise Exception("zero window size (t = " + str(dataX[np.argmax(numFramesLocal <= 0)]) + " sec.)")
+
+    dataY = np.zeros(outputSize)
+    inside = left >= 0
+    dataY[inside] = _window_rms(data, left[inside], right[inside])
+    # windows starting before the first sample wrap around to the end of the signal (as indexed in the original
+    # implementation), these are calculated individually
+    for idx in np.flatnonzero(~inside):
+        dataY[idx] = calculateRMS(data[np.arange(left[idx], right[idx])])
 
     return dataX[1:], dataY[1:]  # throw away awful first data point
 
 
+def find_zero_crossings(data, min_spacing=0):
+    """
+    Find the rising zero crossings of a signal.
+
+    :param data: list or numpy array containing the signal
+    :param min_spacing: crossings less than min_spacing samples after the previous crossing are dropped (noise
+                        around the zero crossing)
+    :return: numpy array of the crossing positions as fractional sample indexes, linearly interpolated between the
+             samples before and after each crossing
+    """
+    data = np.asarray(data, dtype=float)
+    idx = np.flatnonzero((data[:-1] < 0.) & (data[1:] >= 0.))
+    crossings = idx - data[idx] / (data[idx + 1] - data[idx])
+    if min_spacing > 0 and len(crossings) > 1:
+        keep = np.concatenate(([True], np.diff(crossings) >= min_spacing))
+        crossings = crossings[keep]
+    return crossings
+
+
+def calculateRmsOfCycles(data, samplingFrequency, cycles=1, crossings=None, nominalFrequency=60.):
+    """
+    Calculate the RMS of a signal over windows locked to its rising zero crossings.
+
+    :param data: list or numpy array containing the signal
+    :param samplingFrequency: sampling frequency [Hz]
+    :param cycles: number of cycles in each window, windows advance one cycle at a time
+    :param crossings: optional zero crossing positions (from find_zero_crossings()) to lock the windows to, for
+                      example the voltage crossings when calculating the current RMS
+    :param nominalFrequency: nominal signal frequency [Hz], crossings closer than half a nominal cycle are dropped
+    :return: a tuple containing two numpy arrays for the time of the window centers and the RMS value of the
+             window (the mean is not removed)
+    """
+    data = np.asarray(data, dtype=float)
+    if crossings is None:
+        crossings = find_zero_crossings(data, min_spacing=0.5*samplingFrequency/nominalFrequency)
+    bounds = np.ceil(crossings).astype(int)
+    bounds = bounds[(bounds >= 0) & (bounds <= len(data))]
+    if len(bounds) <= cycles:
+        return np.zeros(0), np.zeros(0)
+    left = bounds[:-cycles]
+    right = bounds[cycles:]
+    valid = right > left
+    left = left[valid]
+    right = right[valid]
+    rms = _window_rms(data, left, right, remove_mean=False)
+    return (left + right) / (2. * samplingFrequency), rms
+
+
 def active_power_from_waveform(t, V, I, sampling_rate, ts):
     """
     :param t: time vector (numpy)
@@ -351,177 +435,159 @@ def harmonic_analysis(t, V, I, sampling_rate, ts):
     # import time
     # harmonic_start = time.time()
 
-    P = V*I
-    # w = 2*np.pi
-
-    Fs = sampling_rate
+    V = np.asarray(V, dtype=float)
+    I = np.asarray(I, dtype=float)
     n_samples = len(t)
 
-    # full spectrum
-    ffI = np.fft.fft(I, n_samples)
-    ffV = np.fft.fft(V, n_samples)
-    # xfft = np.arange(0, len(ffI))*(Fs/len(ffI))  # x-axis of frequency for plotting
-
-    # only half of the fft coefficients
-    ffI2 = ffI[0:int(n_samples/2.)]
-    ffV2 = ffV[0:int(n_samples/2.)]
-    # xfft2 = xfft[0:int(n_samples/2.)]
-
-    harmonicsI = [[], [], [], []]  # [[harmonic index], [complex fft], [abs(complex fft)], [angle of complex fft]]
-    harmonicsV = [[], [], [], []]  # [[harmonic index], [complex fft], [abs(complex fft)], [angle of complex fft]]
-    powers = [[], [], []]  # [[harmonics], [P at that harmonic], [Q at that harmonic]]
-    # recoverI = []
-    # recoverV = []
-
-    # for i in range(len(ffI2)):
-    for i in range(41):  # IEEE Std 1547.1-2005
-        # ts.log_debug('Harmonic %d has mag %s' % (i, abs(ffI2[i])))
-
-        # if abs(ffI2[i]) >= 3.:  # threshold for removing nonsignificant harmonics
-        harmonicsI[0] += [i]
-        harmonicsI[1] += [ffI2[i]*2/len(ffI)]
-        harmonicsI[2] += [abs(ffI2[i])*2/len(ffI)]
-        harmonicsI[3] += [np.angle(ffI2[i])]
-
-        harmonicsV[0] += [i]
-        harmonicsV[1] += [ffV2[i]*2/len(ffV)]
-        harmonicsV[2] += [abs(ffV2[i])*2/len(ffV)]
-        harmonicsV[3] += [np.angle(ffV2[i])]
-
-    harmonicsI[1][0] = harmonicsI[1][0]/2
-    harmonicsI[2][0] = abs(np.real(harmonicsI[1][0]))
-    harmonicsV[1][0] = harmonicsV[1][0]/2
-    harmonicsV[2][0] = abs(np.real(harmonicsV[1][0]))
-
-    # Use to compare to other calculations
-    # for i in range(len(t)):
-    #     acumI = 0.0
-    #     acumV = 0.0
-    #     for k in range(1, len(harmonicsI[0])):
-    #         acumI += harmonicsI[2][k]*np.sin(w*harmonicsI[0][k]*(Fs/len(ffI))*t[i] + harmonicsI[3][k] + (np.pi)/2)
-    #         acumV += harmonicsV[2][k]*np.sin(w*harmonicsV[0][k]*(Fs/len(ffV))*t[i] + harmonicsV[3][k] + (np.pi)/2)
-    #     acumI += np.real(harmonicsI[1][0])
-    #     acumV += np.real(harmonicsV[1][0])
-    #     recoverI += [acumI]
-    #     recoverV += [acumV]
+    # first 41 coefficients of the full spectrum (IEEE Std 1547.1-2005), scaled to peak amplitude
+    bins = np.arange(41)
+    spectra = np.fft.fft(np.vstack((V, I)), n_samples, axis=1)[:, bins]*2/n_samples
+    spectra[:, 0] = spectra[:, 0]/2
 
-    ###############################################################################
-    ################ CALCULATIONS ACCORDING TO IEEE 1459 ##########################
-    ###############################################################################
-
-    # THD = VH/V1
-    VHsq = 0.0
-    IHsq = 0.0
-    # V0sq = 0.0
-    # I0sq = 0.0
-    V1sq = 0.0
-    I1sq = 0.0
-
-    for i in range(len(harmonicsV[0])):
-        if harmonicsV[0][i] == 0:  # for DC
-            #THDs
-            V0sq = np.square(harmonicsV[2][i])
-            I0sq = np.square(harmonicsI[2][i])
-            VHsq += V0sq
-            IHsq += I0sq
-
-            #harmonics power
-            powers[0] += [harmonicsI[0][i]*(Fs/len(I))/60.0]  # Harmonics
-            powers[1] += [np.real(harmonicsI[1][i])*np.real(harmonicsV[1][i])]  # power associated with the harmonic
-            powers[2] += [0]  # Reactive powers associated with those harmonics
-
-        elif harmonicsV[0][i]*Fs/len(t) == 60:  # for fundamental
-            #THDs
-            V1sq = np.square(harmonicsV[2][i])/2
-            I1sq = np.square(harmonicsI[2][i])/2
-            VHsq += 0.0
-            IHsq += 0.0
-            #harmonics power
-            powers[0] += [harmonicsI[0][i]*(Fs/len(I))/60.0]
-            powers[1] += [harmonicsI[2][i]*harmonicsV[2][i]*np.cos(harmonicsI[3][i]-harmonicsV[3][i])/2]
-            powers[2] += [harmonicsI[2][i]*harmonicsV[2][i]*np.sin(harmonicsI[3][i]-harmonicsV[3][i])/2]
-
-        else:  # for the rest of the harmonics
-            #THDs
-            VHsq += np.square(harmonicsV[2][i])/2
-            IHsq += np.square(harmonicsI[2][i])/2
-            # harmonic power
-            powers[0] += [harmonicsI[0][i]*(Fs/len(I))/60.0]
-            powers[1] += [harmonicsI[2][i]*harmonicsV[2][i]*np.cos(harmonicsI[3][i]-harmonicsV[3][i])/2]
-            powers[2] += [0]
-
-    # Vsq = V1sq+VHsq
-    # Isq = I1sq+IHsq
-
-    THD_I = np.sqrt(IHsq/I1sq)
-    THD_V = np.sqrt(VHsq/V1sq)
+    fund = bins*sampling_rate/float(n_samples) == 60
+    if not fund.any():
+        ts.log_warning('No fundamental frequency for given capture timing parameters. Will not calculate P1 or Q1.')
 
-    # THD_I2 = np.sqrt((Isq/I1sq)-1)
-    # THD_V2 = np.sqrt((Vsq/V1sq)-1)
+    # avg_P includes all the harmonics (P1 is just the fundamental)
+    pq = _ieee1459(spectra[:1], spectra[1:], fund, np.mean(V*I, keepdims=True))
 
-    # instantaneous power
-    i_P = 0.0
-    for i in range(len(P)):
-        i_P += P[i]
+    # ts.log_debug('Time to complete harmonic analysis = %s' % (time.time() - harmonic_start))
 
-    avg_P = i_P/len(P)  # includes all the harmonics (P1 is just the fundamental)
-    # avg_P2 = np.mean(P)
+    # return avg_P, P1, PH, N, Q1, DI, DV, DH, S, S1, SN, SH, PF1, PF, har_poll, THD_V, THD_I
+    return pq['P'][0], pq['S'][0], pq['Q1'][0], pq['N'][0], pq['PF1'][0]
 
-    PH = 0.0
-    P1 = 0.0
 
-    for i in range(len(powers[0])):
-        if powers[0][i] == 1:
-            P1 = powers[1][i]  # active power (fundamental)
-            Q1 = -powers[2][i]  # reactive power (fundamental) (negative value to be generator POV)
-        else:
-            PH += powers[1][i]  # real power from harmonics
-    if Q1 is None:
-        ts.log_warning('No fundamental frequency for given capture timing parameters. Will not calculate P1 or Q1.')
+HARMONIC_FIELDS = ('P', 'P1', 'PH', 'Q1', 'N', 'S', 'S1', 'SN', 'SH', 'DI', 'DV', 'DH', 'PF', 'PF1', 'THD_V', 'THD_I')
+HARMONIC_WINDOWS = {'hann': np.hanning, 'hanning': np.hanning, 'hamming': np.hamming, 'blackman': np.blackman,
+                    'bartlett': np.bartlett}
 
-    # Fundamental Apparent Power
-    S1 = np.sqrt(np.square(P1)+np.square(Q1))
-
-    # Current distortion power
-    DI = -S1*THD_I  # (negative value to be generator POV)
-    # DI_2 = np.sqrt(V1sq)*(np.sqrt(Isq-I1sq))
 
-    # Voltage distortion power
-    DV = -S1*THD_V # (negative value to be generator POV)
-    # DV_2 = np.sqrt(Vsq-V1sq)*np.sqrt(I1sq)
+def _ieee1459(cV, cI, fund, avg_P):
+    """
+    IEEE 1459 power decomposition for a batch of channels.
 
-    # Harmonic Apparent power
-    SH = S1*THD_I*THD_V
-    # SH_2 = (np.sqrt(Isq-I1sq))*np.sqrt(Vsq-V1sq)
+    :param cV: voltage spectrum, (n_channels x n_bins) complex peak amplitudes, bin 0 is DC
+    :param cI: current spectrum, same shape as cV
+    :param fund: boolean mask of the fundamental bin
+    :param avg_P: average active power of each channel (numpy)
 
-    # Harmonic distortion power
-    # DH = np.sqrt(np.square(SH)-np.square(PH))
+    :return: dict of HARMONIC_FIELDS -> numpy vector with one entry per channel
+    """
+    magV = np.abs(cV)
+    magI = np.abs(cI)
+    magV[:, 0] = np.abs(np.real(cV[:, 0]))
+    magI[:, 0] = np.abs(np.real(cI[:, 0]))
+    phase = np.angle(cI) - np.angle(cV)
+
+    # squared rms of each bin, DC is not divided by 2
+    sqV = np.square(magV)/2
+    sqI = np.square(magI)/2
+    sqV[:, 0] = np.square(magV[:, 0])
+    sqI[:, 0] = np.square(magI[:, 0])
+
+    # active and reactive power associated with each harmonic
+    p = magI*magV*np.cos(phase)/2
+    q = magI*magV*np.sin(phase)/2
+    p[:, 0] = np.real(cI[:, 0])*np.real(cV[:, 0])
+
+    pq = {'P': avg_P}
+    pq['P1'] = np.sum(p[:, fund], axis=1)
+    pq['PH'] = np.sum(p[:, ~fund], axis=1)
+    pq['Q1'] = -np.sum(q[:, fund], axis=1)  # (negative value to be generator POV)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # THD = VH/V1
+        pq['THD_I'] = np.sqrt(np.sum(sqI[:, ~fund], axis=1)/np.sum(sqI[:, fund], axis=1))
+        pq['THD_V'] = np.sqrt(np.sum(sqV[:, ~fund], axis=1)/np.sum(sqV[:, fund], axis=1))
+
+        S1 = np.sqrt(np.square(pq['P1']) + np.square(pq['Q1']))
+        pq['S1'] = S1
+        pq['DI'] = -S1*pq['THD_I']  # current distortion power (negative value to be generator POV)
+        pq['DV'] = -S1*pq['THD_V']  # voltage distortion power (negative value to be generator POV)
+        pq['SH'] = S1*pq['THD_I']*pq['THD_V']
+        pq['DH'] = np.sqrt(np.maximum(np.square(pq['SH']) - np.square(pq['PH']), 0.))
+        pq['SN'] = np.sqrt(np.square(pq['DI']) + np.square(pq['DV']) + np.square(pq['SH']))
+        pq['S'] = np.sqrt(np.square(S1) + np.square(pq['SN']))
+        pq['N'] = -np.sqrt(np.square(pq['S']) - np.square(avg_P))  # (negative value to be generator POV)
+        pq['PF1'] = pq['P1']/S1
+        pq['PF'] = avg_P/pq['S']
 
-    # Nonfundamental Apparent Power (SN)
-    SN = np.sqrt(np.square(DI) + np.square(DV) + np.square(SH))
-    S = np.sqrt(np.square(S1)+np.square(SN))
+    # PF Convention
+    flip = ((pq['Q1'] > 0) & (avg_P > 0)) | ((pq['Q1'] < 0) & (avg_P < 0))
+    pq['PF1'] = np.where(flip, -pq['PF1'], pq['PF1'])
+    pq['PF'] = np.where(flip, -pq['PF'], pq['PF'])
 
-    # Nonactive Power
-    N = -np.sqrt(np.square(S)-np.square(avg_P))  # (negative value to be generator POV)
+    return pq
 
-    # Fundamental power factor
-    # ts.log_debug('PF1 = %0.3f, P1 = %0.3f, S1 = %0.3f' % (P1/S1, P1, S1))
-    PF1 = P1/S1
-    # Power factor
-    PF = avg_P/S
 
-    # PF Convention
-    if (Q1 > 0 and avg_P > 0) or (Q1 < 0 and avg_P < 0):
-        PF1 = -PF1
-        PF = -PF
+def harmonic_analysis_batch(V, I, sampling_rate, fundamental=60., harmonics=40, cycles=None, window=None):
+    """
+    Harmonic and IEEE 1459 power analysis of several V/I channel pairs with a single rfft call.
 
-    # Harmonic pollution
-    # har_poll = SN/S1
+    The record is framed on an integer number of fundamental cycles so harmonic h lands on bin h*cycles of the
+    spectrum. An optional window reduces leakage when the sampling is not synchronous with the grid.
 
-    # ts.log_debug('Time to complete harmonic analysis = %s' % (time.time() - harmonic_start))
+    :param V: voltage array (n_channels x n_samples), a single vector is one channel
+    :param I: current array, same shape as V
+    :param sampling_rate - sampling rate (Hz)
+    :param fundamental - nominal fundamental frequency (Hz)
+    :param harmonics - highest harmonic order analyzed
+    :param cycles - number of fundamental cycles in the frame, default is all the whole cycles in the record
+    :param window - None, a window name (hann, hamming, blackman, bartlett) or an array of frame length
 
-    # return avg_P, P1, PH, N, Q1, DI, DV, DH, S, S1, SN, SH, PF1, PF, har_poll, THD_V, THD_I
-    return avg_P, S, Q1, N, PF1
+    :return: numpy structured array with one record per channel, fields are HARMONIC_FIELDS plus V_mag, V_ang,
+             I_mag and I_ang holding the rms magnitude and angle (rad) of harmonics 0..harmonics
+    """
+    V = np.atleast_2d(np.asarray(V, dtype=float))
+    I = np.atleast_2d(np.asarray(I, dtype=float))
+    if V.shape != I.shape or V.ndim != 2:
+        raise ValueError('Voltage and current arrays must have the same (n_channels x n_samples) shape')
+
+    samples_per_cycle = sampling_rate/float(fundamental)
+    if cycles is None:
+        cycles = int(V.shape[1]/samples_per_cycle)
+    cycles = int(cycles)
+    n = int(round(cycles*samples_per_cycle))
+    if cycles < 1 or n > V.shape[1]:
+        raise ValueError('Record of %d samples does not hold %s cycles of %s Hz' % (V.shape[1], cycles, fundamental))
+    V = V[:, :n]
+    I = I[:, :n]
+
+    if window is None:
+        w = np.ones(n)
+    elif isinstance(window, str):
+        if window not in HARMONIC_WINDOWS:
+            raise ValueError('Unknown window: %s' % window)
+        w = HARMONIC_WINDOWS[window](n)
+    else:
+        w = np.asarray(window, dtype=float)
+        if w.shape != (n,):
+            raise ValueError('Window length %d does not match frame length %d' % (len(w), n))
+
+    # one transform for every voltage and current channel, scaled to peak amplitude
+    spectra = np.fft.rfft(np.vstack((V, I))*w, axis=1)*(2./np.sum(w))
+    order = np.arange(harmonics + 1)
+    order = order[order*cycles < spectra.shape[1]]
+    spectra = spectra[:, order*cycles]
+    spectra[:, 0] = spectra[:, 0]/2
+
+    channels = V.shape[0]
+    cV = spectra[:channels]
+    cI = spectra[channels:]
+    pq = _ieee1459(cV, cI, order == 1, np.mean(V*I, axis=1))
+
+    dtype = [(f, float) for f in HARMONIC_FIELDS]
+    dtype += [(f, float, (len(order),)) for f in ('V_mag', 'V_ang', 'I_mag', 'I_ang')]
+    result = np.zeros(channels, dtype=dtype)
+    for f in HARMONIC_FIELDS:
+        result[f] = pq[f]
+    rms = np.full(len(order), np.sqrt(.5))
+    rms[0] = 1.
+    result['V_mag'] = np.abs(cV)*rms
+    result['I_mag'] = np.abs(cI)*rms
+    result['V_ang'] = np.angle(cV)
+    result['I_ang'] = np.angle(cI)
+    return result
 
 
 if __name__ == "__main__":
@@ -0,0 +1,297 @@
+"""
+Copyright (c) 2017, Sandia National Labs and SunSpec Alliance
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of the Sandia National Labs and SunSpec Alliance nor the names of its
+contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Questions can be directed to support@sunspec.org
+"""
+
+import concurrent.futures
+import glob
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from . import dataset
+from . import ride_through
+from . import waveform
+from . import waveform_analysis
+
+BATCH_CACHE_NAME = 'svpelab_batch_cache.json'
+BATCH_HASH_BLOCK = 1 << 20
+BATCH_POINTS = ['FILE', 'ELAPSED', 'CACHED', 'ERROR']
+PQ_SUMMARY_POINTS = ('VRMS', 'IRMS', 'P', 'Q', 'S', 'PF', 'FREQ')
+
+
+class BatchError(Exception):
+    """
+    Exception to wrap all batch analysis generated exceptions.
+    """
+    pass
+
+
+def pq_summary(filename, phases=(1, 2, 3), sep=','):
+    """
+    Batch analysis returning the mean per-cycle power quality data of each phase of a waveform csv file (see
+    waveform.CycleCalculator).
+    """
+    cycles = waveform.Waveform().compute_cycle_pq_csv(filename, phases=phases, sep=sep)
+    result = {}
+    for phase in [str(p) for p in phases]:
+        for p in PQ_SUMMARY_POINTS:
+            values = cycles[phase][p]
+            result['%s_%s' % (p, phase)] = float(np.nanmean(values)) if len(values) > 0 else None
+    return result
+
+
+def freq_summary(filename, chan='AC_V_1', sep=','):
+    """
+    Batch analysis returning the average, minimum and maximum cycle frequency and the largest ROCOF of a channel of a
+    waveform csv file (see waveform_analysis.FrequencyEstimator).
+    """
+    points, data = dataset.read_csv(filename, sep=sep)
+    columns = dict(zip(points, data))
+    time_chan = columns.get('TIME', columns.get('Time'))
+    if time_chan is None or chan not in columns:
+        raise BatchError('Channel not found: %s' % ('TIME' if time_chan is None else chan))
+    t = np.asarray(time_chan, dtype=float)
+    estimator = waveform_analysis.FrequencyEstimator((len(t) - 1)/(t[-1] - t[0]))
+    _, freqs, rocof = estimator.update(columns[chan], t[0])
+    if len(freqs) == 0:
+        return {'FREQ': None, 'FREQ_MIN': None, 'FREQ_MAX': None, 'ROCOF_MAX': None}
+    return {'FREQ': float(len(freqs)/np.sum(1./freqs)), 'FREQ_MIN': float(np.min(freqs)),
+            'FREQ_MAX': float(np.max(freqs)),
+            'ROCOF_MAX': float(np.nanmax(np.abs(rocof))) if np.any(np.isfinite(rocof)) else None}
+
+
+def ride_through_summary(filename, phases=(1, 2, 3), sep=',', **kwargs):
+    """
+    Batch analysis returning the number of ride-through events of a waveform csv file and the duration and per phase
+    trip delay of the first one (see ride_through.ride_through_analysis()).
+    """
+    events = ride_through.ride_through_csv(filename, phases=phases, sep=sep, **kwargs)
+    result = {'EVENTS': len(events), 'DURATION': float(events[0]['duration']) if len(events) > 0 else None}
+    for k, p in enumerate(phases):
+        delay = None
+        if len(events) > 0 and events[0]['tripped'][k]:
+            delay = float(events[0]['trip_delay'][k])
+        result['TRIP_DELAY_%s' % p] = delay
+    return result
+
+
+def file_hash(filename):
+    """
+    Return the SHA-1 hex digest of the content of a file.
+    """
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(BATCH_HASH_BLOCK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _analyze(filename, analysis, params):
+    """
+    Run an analysis on a file in a worker process, return (result, elapsed, error).
+    """
+    start = time.perf_counter()
+    try:
+        result = analysis(filename, **params)
+        error = None
+    except Exception as e:
+        result = {}
+        error = '%s: %s' % (type(e).__name__, e)
+    return result, time.perf_counter() - start, error
+
+
+class BatchSummary(object):
+    """
+    Summary dataset of a batch analysis, one record per file.
+
+    The result points are only known when the first successful result arrives, records received before are kept
+    until then. If a summary file is given the dataset is streamed to it as records are added.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.ds = None
+        self._pending = []
+
+    def add(self, filename, result, elapsed, cached, error):
+        if self.ds is None:
+            if error is not None:
+                self._pending.append((filename, result, elapsed, cached, error))
+                return
+            self.ds = dataset.Dataset(points=BATCH_POINTS + list(result.keys()))
+            if self.filename is not None:
+                self.ds.stream_csv(self.filename)
+            pending = self._pending
+            self._pending = []
+            for record in pending:
+                self.add(*record)
+        self.ds.append([filename, elapsed, 1 if cached else 0, error] +
+                       [result.get(p) for p in self.ds.points[len(BATCH_POINTS):]])
+
+    def close(self):
+        if self.ds is None:
+            self.ds = dataset.Dataset(points=list(BATCH_POINTS))
+            for filename, result, elapsed, cached, error in self._pending:
+                self.ds.append([filename, elapsed, 1 if cached else 0, error])
+            if self.filename is not None:
+                self.ds.stream_csv(self.filename)
+        self.ds.stream_close()
+        return self.ds
+
+
+def _load_cache(filename):
+    if filename is None or not os.path.exists(filename):
+        return {}
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _save_cache(filename, cache):
+    if filename is not None:
+        tmp = filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp, filename)
+
+
+def batch_analyze(files, analysis=pq_summary, params=None, summary_file=None, cache_file=None, processes=None,
+                  pattern='*.csv', ts=None):
+    """
+    Run an analysis on a set of waveform files in a process pool and collect the results in one summary dataset.
+
+    Files whose content and analysis settings are found in the cache are not analyzed again. The summary has the
+    points FILE, ELAPSED (analysis time in seconds), CACHED, ERROR followed by the points of the analysis results.
+
+    :param files: directory or list of files/directories to analyze
+    :param analysis: module level function analysis(filename, **params) returning a dict of point -> value
+    :param params: dict of analysis parameters
+    :param summary_file: csv file the summary dataset is streamed to, records are written in file order
+    :param cache_file: JSON results cache, default is BATCH_CACHE_NAME in the directory of the summary file, no cache
+                       if there is no summary file, False to disable
+    :param processes: number of worker processes, default is the number of CPUs
+    :param pattern: file pattern used to list directories
+    :param ts: test script used for logging
+
+    :return: summary Dataset
+    """
+    if isinstance(files, str):
+        files = [files]
+    filenames = []
+    for f in files:
+        if os.path.isdir(f):
+            filenames.extend(sorted(glob.glob(os.path.join(f, pattern))))
+        else:
+            filenames.append(f)
+    params = dict(params or {})
+    if cache_file is None and summary_file is not None:
+        cache_file = os.path.join(os.path.dirname(os.path.abspath(summary_file)), BATCH_CACHE_NAME)
+    elif cache_file is False:
+        cache_file = None
+
+    cache = _load_cache(cache_file)
+    settings = '%s.%s:%s' % (analysis.__module__, analysis.__name__, json.dumps(params, sort_keys=True, default=str))
+    summary = BatchSummary(summary_file)
+    start = time.perf_counter()
+    cached = 0
+
+    # summary records by file index, results arriving out of order are held until the preceding files are added
+    records = [None] * len(filenames)
+    added = 0
+    keys = {}
+    for i, filename in enumerate(filenames):
+        try:
+            key = hashlib.sha1((file_hash(filename) + settings).encode()).hexdigest()
+        except Exception as e:
+            records[i] = (filename, {}, 0., False, '%s: %s' % (type(e).__name__, e))
+            continue
+        entry = cache.get(key)
+        if entry is not None:
+            records[i] = (filename, entry['result'], entry['elapsed'], True, None)
+            cached += 1
+        else:
+            keys[i] = key
+
+    try:
+        while added < len(records) and records[added] is not None:
+            summary.add(*records[added])
+            added += 1
+        if keys:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+                futures = dict((pool.submit(_analyze, filenames[i], analysis, params), i) for i in keys)
+                for future in concurrent.futures.as_completed(futures):
+                    i = futures[future]
+                    filename = filenames[i]
+                    try:
+                        result, elapsed, error = future.result()
+                    except Exception as e:
+                        result, elapsed, error = {}, 0., '%s: %s' % (type(e).__name__, e)
+                    if ts is not None:
+                        if error is None:
+                            ts.log('Analyzed %s in %0.3f s' % (filename, elapsed))
+                        else:
+                            ts.log_warning('Analysis of %s failed: %s' % (filename, error))
+                    if error is None:
+                        cache[keys[i]] = {'file': filename, 'result': result, 'elapsed': elapsed}
+                    records[i] = (filename, result, elapsed, False, error)
+                    while added < len(records) and records[added] is not None:
+                        summary.add(*records[added])
+                        added += 1
+    finally:
+        # an interrupted batch still writes the records it has
+        for record in records[added:]:
+            if record is not None:
+                summary.add(*record)
+        _save_cache(cache_file, cache)
+        ds = summary.close()
+
+    if ts is not None:
+        ts.log('Batch analysis of %d files (%d cached) completed in %0.3f s' %
+               (len(filenames), cached, time.perf_counter() - start))
+    return ds
+
+
+if __name__ == "__main__":
+    import argparse
+
+    analyses = {'pq': pq_summary, 'freq': freq_summary, 'ride_through': ride_through_summary}
+    parser = argparse.ArgumentParser(description='Batch analysis of waveform capture files')
+    parser.add_argument('files', nargs='+', help='waveform csv files or directories')
+    parser.add_argument('-a', '--analysis', choices=sorted(analyses), default='pq')
+    parser.add_argument('-o', '--output', default='summary.csv', help='summary csv file')
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    args = parser.parse_args()
+    batch_analyze(args.files, analysis=analyses[args.analysis], summary_file=args.output, processes=args.processes)
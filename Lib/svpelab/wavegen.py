@@ -30,12 +30,11 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 Questions can be directed to support@sunspec.org
 """
 
-import sys
 import os
-import glob
-import importlib
 
-wavegen_modules = {}
+from . import plugins
+
+wavegen_modules = plugins.PluginModules()
 
 def params(info, id=None, label='Waveform Generator', group_name=None, active=None, active_value=None):
     """
@@ -216,36 +215,18 @@ class Wavegen(object):
 
 def wavegen_scan():
     """
-    Scans for wavegen modules in the current directory and imports them.
-    
-    This function scans all files in the current directory that match the pattern `wavegen_*.py` and imports them. It then extracts the `wavegen_info()` function from each module and stores the module in the `wavegen_modules` dictionary, keyed by the `mode` value returned from `wavegen_info()`.
-    
-    If a module does not have a `wavegen_info()` function, or if an exception occurs during the import, the module is removed from `sys.modules` to prevent further attempts to import it.
+    Scan for wavegen modules on import.
+
+    Finds all files in the current directory that match 'wavegen_*.py' and registers them in 'wavegen_modules',
+    keyed by the 'mode' value returned from 'wavegen_info'. The mode is read from the module source and cached
+    (see plugins.plugin_scan()), so a module is only imported when its mode is used. Scan and module import errors
+    are raised as WavegenError.
     """
     global wavegen_modules
     # scan all files in current directory that match wavegen_*.py
     package_name = '.'.join(__name__.split('.')[:-1])
-    files = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'wavegen_*.py'))
-    for f in files:
-        module_name = None
-        try:
-            module_name = os.path.splitext(os.path.basename(f))[0]
-            if package_name:
-                module_name = package_name + '.' + module_name
-            m = importlib.import_module(module_name)
-            if hasattr(m, 'wavegen_info'):
-                info = m.wavegen_info()
-                mode = info.get('mode')
-                # place module in module dict
-                if mode is not None:
-                    wavegen_modules[mode] = m
-            else:
-                if module_name is not None and module_name in sys.modules:
-                    del sys.modules[module_name]
-        except Exception as e:
-            if module_name is not None and module_name in sys.modules:
-                del sys.modules[module_name]
-            raise WavegenError('Error scanning module %s: %s' % (module_name, str(e)))
+    plugins.plugin_scan(wavegen_modules, os.path.dirname(os.path.realpath(__file__)), 'wavegen_*.py', 'wavegen_info',
+                        package_name=package_name, error=WavegenError, raise_errors=True)
 
 # scan for wavegen modules on import
 wavegen_scan()